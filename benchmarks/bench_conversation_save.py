@@ -0,0 +1,103 @@
+"""
+Benchmark du coût d'enregistrement d'un tour de conversation en fonction de la
+longueur de l'historique : ancienne réécriture complète ($set de tout
+`conversation_history`) contre ajout atomique ($push des seuls nouveaux messages).
+
+Nécessite MONGO_URI / MONGO_DB_NAME ; écrit dans une collection temporaire
+supprimée à la fin.
+
+    python -m benchmarks.bench_conversation_save --sizes 10 50 100 200 400 800
+"""
+import argparse
+import asyncio
+import json
+import statistics
+import time
+from datetime import datetime, timedelta, timezone
+
+import bson
+
+from services import saveConversation_service
+from services.repository import MongoRepository
+from services.saveConversation_service import build_message
+from services.analysis_service import update_running_stats
+
+async def legacy_save_conversation(repository, session_id, conversation_history):
+    """Implémentation d'origine : relit et réécrit tout l'historique à chaque tour."""
+    doc = await repository.find_one({"session_id": session_id})
+    existing_history = doc.get("conversation_history", []) if doc else []
+    existing_set = {f"{m['role']}|{m['content']}|{m['timestamp']}" for m in existing_history}
+    new_filtered = [
+        m for m in conversation_history
+        if f"{m['role']}|{m['content']}|{m['timestamp']}" not in existing_set
+    ]
+    combined_history = existing_history + new_filtered
+    update = {"$set": {"conversation_history": combined_history}}
+    await repository.update_one({"session_id": session_id}, update, upsert=True)
+    return len(bson.encode(update))
+
+def synthetic_history(session_id, size, start):
+    history = []
+    for i in range(size):
+        role = "user" if i % 2 == 0 else "assistant"
+        content = ("Idée de projet numéro %d. " % i) * (4 if role == "user" else 40)
+        timestamp = (start + timedelta(seconds=30 * i)).isoformat()
+        history.append(build_message(session_id, role, content, timestamp))
+    return history
+
+async def run(sizes, turns, collection_name):
+    repository = MongoRepository(collection_name)
+    saveConversation_service.chats_repository = repository
+    start = datetime(2025, 1, 1, tzinfo=timezone.utc)
+    results = []
+
+    for size in sizes:
+        for mode in ("legacy", "append"):
+            session_id = f"bench-{mode}-{size}"
+            history = synthetic_history(session_id, size, start)
+            await repository.update_one(
+                {"session_id": session_id},
+                {"$set": {"conversation_history": history, "stats": update_running_stats(None, history)}},
+                upsert=True
+            )
+            timings = []
+            payloads = []
+            for turn in range(turns):
+                turn_messages = synthetic_history(session_id, size + 2, start)[size:]
+                for m in turn_messages:
+                    m["message_id"] += f"-{turn}"
+                t0 = time.perf_counter()
+                if mode == "legacy":
+                    history = history + turn_messages
+                    payloads.append(await legacy_save_conversation(repository, session_id, history))
+                else:
+                    await saveConversation_service.save_conversation(session_id, turn_messages)
+                    payloads.append(len(bson.encode({"$push": {"conversation_history": {"$each": turn_messages}}})))
+                timings.append((time.perf_counter() - t0) * 1000)
+            results.append({
+                "mode": mode,
+                "history_size": size,
+                "median_ms": round(statistics.median(timings), 3),
+                "p95_ms": round(sorted(timings)[int(0.95 * (len(timings) - 1))], 3),
+                "payload_bytes": int(statistics.median(payloads)),
+            })
+            print(f"{mode:>7} | history={size:>5} | median={results[-1]['median_ms']:>8} ms | payload={results[-1]['payload_bytes']:>9} B")
+
+    await repository.collection.drop()
+    return results
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sizes", type=int, nargs="+", default=[10, 50, 100, 200, 400, 800])
+    parser.add_argument("--turns", type=int, default=20)
+    parser.add_argument("--collection", default="bench_conversation_save")
+    parser.add_argument("--output", help="Fichier JSON de résultats")
+    args = parser.parse_args()
+
+    results = asyncio.run(run(args.sizes, args.turns, args.collection))
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(results, f, indent=2)
+
+if __name__ == "__main__":
+    main()
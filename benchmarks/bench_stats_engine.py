@@ -0,0 +1,95 @@
+"""
+Benchmark du moteur vectorisé (services/stats_engine.py) contre les fonctions
+par session compute_time_stats / compute_size_stats, sur un jeu synthétique.
+Aucune base de données n'est nécessaire.
+
+    python -m benchmarks.bench_stats_engine --sessions 100000 --chunk-size 2000
+"""
+import argparse
+import json
+import random
+import time
+from datetime import datetime, timedelta, timezone
+
+from services.analysis_service import compute_time_stats, compute_size_stats
+from services.stats_engine import compute_batch_stats
+
+TORONTO_OFFSET = timezone(timedelta(hours=-5))
+
+def synthetic_sessions(rng, count, mean_messages, with_ts_ms=False):
+    """
+    Sessions au format de `conversation_history`, alternant user/assistant avec des
+    pauses occasionnelles de plus de 30 minutes. Sans `with_ts_ms`, les messages
+    imitent les anciens documents (horodatage ISO uniquement).
+    """
+    sessions = []
+    for i in range(count):
+        t = datetime(2025, 1, 1, tzinfo=TORONTO_OFFSET) + timedelta(minutes=rng.randint(0, 500000))
+        messages = []
+        for j in range(max(1, int(rng.expovariate(1 / mean_messages)))):
+            t += timedelta(seconds=rng.choice([3, 8, 45, 120, 900, 2400, 7200]), milliseconds=rng.randint(0, 999))
+            role = "user" if j % 2 == 0 else "assistant"
+            message = {"role": role, "content": "", "timestamp": t.isoformat(), "size": rng.randint(10, 2000)}
+            if with_ts_ms:
+                message["ts_ms"] = int(t.timestamp() * 1000)
+            messages.append(message)
+        sessions.append({"session_id": f"s{i}", "messages": messages})
+    return sessions
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sessions", type=int, default=100000)
+    parser.add_argument("--mean-messages", type=int, default=12)
+    parser.add_argument("--chunk-size", type=int, default=2000)
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--with-ts-ms", action="store_true", help="Messages au format actuel, avec ts_ms")
+    parser.add_argument("--output", help="Fichier JSON de résultats")
+    args = parser.parse_args()
+
+    rng = random.Random(args.seed)
+    per_session_seconds = 0.0
+    vectorized_seconds = 0.0
+    total_messages = 0
+    mismatches = 0
+
+    for start in range(0, args.sessions, args.chunk_size):
+        chunk = synthetic_sessions(rng, min(args.chunk_size, args.sessions - start), args.mean_messages, args.with_ts_ms)
+        total_messages += sum(len(s["messages"]) for s in chunk)
+
+        t0 = time.perf_counter()
+        expected = [
+            {"time_stats": compute_time_stats(s["messages"]), "size_stats": compute_size_stats(s["messages"])}
+            for s in chunk
+        ]
+        per_session_seconds += time.perf_counter() - t0
+
+        t0 = time.perf_counter()
+        actual = compute_batch_stats(chunk)
+        vectorized_seconds += time.perf_counter() - t0
+
+        # Les deux calculs peuvent différer d'un centième sur un arrondi à égalité.
+        for e, a in zip(expected, actual):
+            for key in ("total_messages", "num_gaps_over_30mins"):
+                if e["time_stats"][key] != a["time_stats"][key]:
+                    mismatches += 1
+            for key in ("total_duration_minutes", "avg_ai_latency_seconds"):
+                if abs(e["time_stats"][key] - a["time_stats"][key]) > 0.011:
+                    mismatches += 1
+
+    results = {
+        "sessions": args.sessions,
+        "messages": total_messages,
+        "chunk_size": args.chunk_size,
+        "with_ts_ms": args.with_ts_ms,
+        "per_session_seconds": round(per_session_seconds, 3),
+        "vectorized_seconds": round(vectorized_seconds, 3),
+        "speedup": round(per_session_seconds / vectorized_seconds, 1) if vectorized_seconds else None,
+        "mismatches": mismatches,
+    }
+    print(json.dumps(results, indent=2))
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(results, f, indent=2)
+
+if __name__ == "__main__":
+    main()
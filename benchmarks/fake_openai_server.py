@@ -0,0 +1,181 @@
+"""
+Serveur local compatible Azure OpenAI pour les tests de charge : aucun appel réseau
+ni aucun token facturé. Il répond aux routes utilisées par l'application
+(chat.completions en flux SSE ou non, models.list du préchauffage) avec une latence
+au premier token (TTFT), un débit de tokens et des taux d'erreur configurables.
+
+    python -m benchmarks.fake_openai_server --port 9000 --ttft-ms 400 --tokens-per-second 60 \\
+        --output-tokens 250 --rate-limit-rate 0.02 --error-rate 0.01
+
+puis lancer l'application avec API_BASE=http://127.0.0.1:9000 (API_KEY et
+OPENAI_API_VERSION quelconques). GET /_fake/stats donne les compteurs du serveur.
+
+Le contenu des réponses dépend du prompt système : dictionnaire de scores pour
+l'analyse d'une session, dictionnaires de thèmes pour les diagrammes, texte sinon.
+Chaque token du flux est un mot suivi d'une espace, ce qui permet au pilote de
+charge de compter les tokens reçus.
+"""
+import argparse
+import asyncio
+import hashlib
+import json
+import random
+import time
+import uuid
+from collections import Counter
+from dataclasses import dataclass
+
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse, StreamingResponse
+
+WORDS = (
+    "idée projet usage énergie ville mobilité santé données modèle capteur réseau "
+    "collaboratif durable prototype utilisateur service marché impact coût école"
+).split()
+THEMES = ["sustainability", "health", "education", "mobility", "artificial intelligence", "ecology"]
+
+@dataclass
+class FakeLLMSettings:
+    ttft_ms: float = 400.0
+    tokens_per_second: float = 60.0
+    output_tokens: int = 250
+    jitter: float = 0.2
+    error_rate: float = 0.0
+    rate_limit_rate: float = 0.0
+    retry_after_ms: int = 500
+
+def _jittered(value: float, jitter: float, rng: random.Random) -> float:
+    return max(0.0, value * (1 + rng.uniform(-jitter, jitter)))
+
+def _analysis_reply(prompt: str) -> str:
+    # Scores stables pour un même prompt : les réponses restent cohérentes avec le cache de l'application.
+    seed = int(hashlib.sha256(prompt.encode("utf-8")).hexdigest()[:8], 16)
+    rng = random.Random(seed)
+    return repr({
+        "originality_score": rng.randint(1, 10),
+        "matching_score": rng.randint(1, 10),
+        "assistant_influence_score": rng.randint(1, 10),
+        "analysis_details": {"summary": "Réponse synthétique du serveur de test."},
+    })
+
+def _reply_content(messages: list, output_tokens: int, rng: random.Random) -> str:
+    system = " ".join(m.get("content", "") for m in messages if m.get("role") == "system")
+    prompt = messages[-1].get("content", "") if messages else ""
+    if "évaluation d'idées" in system:
+        return _analysis_reply(prompt)
+    if "keyword extraction" in system:
+        return repr({theme: round(1 / len(THEMES), 2) for theme in THEMES})
+    if "thematic classification" in system:
+        return repr({i: THEMES[i % len(THEMES)] for i in range(prompt.count("\n") + 1)})
+    return " ".join(rng.choice(WORDS) for _ in range(output_tokens)) + " "
+
+def _error_response(status_code: int, message: str, headers: dict = None) -> JSONResponse:
+    return JSONResponse({"error": {"code": str(status_code), "message": message}}, status_code=status_code, headers=headers)
+
+def create_app(settings: FakeLLMSettings, seed: int = 42) -> FastAPI:
+    app = FastAPI()
+    rng = random.Random(seed)
+    counters = Counter()
+
+    def _completion_id() -> str:
+        return f"chatcmpl-{uuid.uuid4().hex[:24]}"
+
+    @app.get("/openai/models")
+    async def list_models():
+        counters["models"] += 1
+        return {"object": "list", "data": [{"id": "gpt-4o", "object": "model"}]}
+
+    @app.post("/openai/deployments/{deployment}/chat/completions")
+    async def chat_completions(deployment: str, request: Request):
+        body = await request.json()
+        counters["requests"] += 1
+        draw = rng.random()
+        if draw < settings.rate_limit_rate:
+            counters["rate_limited"] += 1
+            return _error_response(
+                429, "Rate limit reached (fake server).",
+                {"retry-after-ms": str(settings.retry_after_ms), "retry-after": str(max(1, round(settings.retry_after_ms / 1000)))},
+            )
+        if draw < settings.rate_limit_rate + settings.error_rate:
+            counters["errors"] += 1
+            return _error_response(500, "Internal server error (fake server).")
+
+        content = _reply_content(body.get("messages", []), int(body.get("max_tokens") or settings.output_tokens), rng)
+        # Un texte est émis mot par mot ; un dictionnaire d'un seul bloc.
+        tokens = [word + " " for word in content.split()] if content.endswith(" ") else [content]
+        ttft = _jittered(settings.ttft_ms, settings.jitter, rng) / 1000
+        interval = 1 / settings.tokens_per_second if settings.tokens_per_second > 0 else 0
+        counters["tokens"] += len(tokens)
+        created = int(time.time())
+        completion_id = _completion_id()
+
+        if not body.get("stream"):
+            await asyncio.sleep(ttft + interval * len(tokens))
+            counters["completions"] += 1
+            return {
+                "id": completion_id,
+                "object": "chat.completion",
+                "created": created,
+                "model": deployment,
+                "choices": [{"index": 0, "message": {"role": "assistant", "content": content}, "finish_reason": "stop"}],
+                "usage": {"prompt_tokens": 0, "completion_tokens": len(tokens), "total_tokens": len(tokens)},
+            }
+
+        def event(delta: dict, finish_reason=None) -> str:
+            chunk = {
+                "id": completion_id,
+                "object": "chat.completion.chunk",
+                "created": created,
+                "model": deployment,
+                "choices": [{"index": 0, "delta": delta, "finish_reason": finish_reason}],
+            }
+            return f"data: {json.dumps(chunk)}\n\n"
+
+        async def stream():
+            counters["streams"] += 1
+            await asyncio.sleep(ttft)
+            yield event({"role": "assistant", "content": ""})
+            for token in tokens:
+                yield event({"content": token})
+                if interval:
+                    await asyncio.sleep(interval)
+            yield event({}, "stop")
+            yield "data: [DONE]\n\n"
+
+        return StreamingResponse(stream(), media_type="text/event-stream")
+
+    @app.get("/_fake/stats")
+    async def fake_stats():
+        return {"settings": settings.__dict__, **counters}
+
+    return app
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=9000)
+    parser.add_argument("--ttft-ms", type=float, default=400.0, help="Délai avant le premier token")
+    parser.add_argument("--tokens-per-second", type=float, default=60.0, help="Débit de tokens d'un flux (0 : sans limite)")
+    parser.add_argument("--output-tokens", type=int, default=250, help="Longueur d'une réponse texte, bornée par max_tokens")
+    parser.add_argument("--jitter", type=float, default=0.2, help="Variation relative du TTFT (0.2 : ±20 %%)")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="Proportion de réponses 500")
+    parser.add_argument("--rate-limit-rate", type=float, default=0.0, help="Proportion de réponses 429")
+    parser.add_argument("--retry-after-ms", type=int, default=500, help="Délai annoncé dans les réponses 429")
+    parser.add_argument("--seed", type=int, default=42)
+    args = parser.parse_args()
+
+    import uvicorn
+
+    settings = FakeLLMSettings(
+        ttft_ms=args.ttft_ms,
+        tokens_per_second=args.tokens_per_second,
+        output_tokens=args.output_tokens,
+        jitter=args.jitter,
+        error_rate=args.error_rate,
+        rate_limit_rate=args.rate_limit_rate,
+        retry_after_ms=args.retry_after_ms,
+    )
+    uvicorn.run(create_app(settings, args.seed), host=args.host, port=args.port, log_level="warning")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,427 @@
+"""
+Pilote de charge de l'API : chaque scénario (endpoint) est joué à tour de rôle par
+`--concurrency` clients pendant `--duration` secondes (ou `--requests` requêtes), puis
+résumé en latences p50/p95/p99, requêtes par seconde et erreurs ; pour /chat_stream,
+délai au premier token (TTFT) et débit de tokens par flux. Les résultats sont écrits
+en JSON avec le commit courant, pour comparer deux versions.
+
+Environnement hors ligne : serveur de modèle factice (benchmarks.fake_openai_server)
+et base locale remplie par benchmarks.seed_data, par exemple
+
+    python -m benchmarks.fake_openai_server --port 9000 &
+    API_KEY=x OPENAI_API_VERSION=2024-06-01 API_BASE=http://127.0.0.1:9000 \\
+        MONGO_URI=mongodb://127.0.0.1:27017 MONGO_DB_NAME=bench uvicorn main:app --port 8000 &
+    python -m benchmarks.load_driver run --concurrency 32 --duration 30 --output before.json
+    python -m benchmarks.load_driver compare before.json after.json --threshold 0.1
+
+`compare` se termine avec le code 1 si une latence ou un débit se dégrade au-delà du seuil.
+"""
+import argparse
+import asyncio
+import json
+import random
+import subprocess
+import sys
+import time
+import uuid
+from dataclasses import dataclass, field
+from datetime import datetime, timezone
+from typing import Awaitable, Callable, Dict, List, Optional
+
+import httpx
+
+# Endpoints de lecture : chemin et paramètres de requête.
+GET_SCENARIOS = {
+    "stats": ("/stats", {}),
+    "diagrams": ("/diagrams", {"theme_engine": "local"}),
+    "analysis": ("/analysis", {"limit": 100}),
+    "analysis_buckets": ("/analysis/buckets", {"unit": "week"}),
+    "datas": ("/datas", {"limit": 50}),
+    "config": ("/config", {}),
+}
+DEFAULT_SCENARIOS = ["chat_stream", "analyze", *GET_SCENARIOS, "conversation"]
+STATS_ENDPOINTS = ["/llm/stats", "/mongo/pool-stats", "/http-cache/stats", "/analyze/cache/stats", "/session-store/stats"]
+CHAT_MESSAGES = [
+    "J'aimerais une idée de projet autour de la mobilité douce.",
+    "Comment rendre cette idée rentable ?",
+    "Quels seraient les premiers utilisateurs ?",
+    "Peux-tu résumer l'idée en deux phrases ?",
+]
+
+@dataclass
+class Sample:
+    ok: bool
+    status: int
+    latency_ms: float
+    ttft_ms: Optional[float] = None
+    tokens_per_second: Optional[float] = None
+    job_ms: Optional[float] = None
+    error: Optional[str] = None
+
+@dataclass
+class WorkerState:
+    """
+    État propre à un client virtuel : session de chat en cours, ETags reçus.
+    """
+    worker: int
+    run_id: str
+    rng: random.Random
+    turns: int = 0
+    chat_session: Optional[str] = None
+    etags: Dict[str, str] = field(default_factory=dict)
+
+@dataclass
+class DriverSettings:
+    seeded_sessions: int = 5000
+    turns_per_session: int = 4
+    analyze_wait: bool = True
+    bypass_cache: bool = False
+    revalidate: bool = False
+    job_timeout: float = 120.0
+
+def _ms(since: float) -> float:
+    return (time.perf_counter() - since) * 1000
+
+def _seeded_session(state: WorkerState, settings: DriverSettings) -> str:
+    # Mêmes identifiants que benchmarks.seed_data.
+    return f"bench-{state.rng.randrange(settings.seeded_sessions):06d}"
+
+async def chat_stream(client: httpx.AsyncClient, state: WorkerState, settings: DriverSettings) -> Sample:
+    """
+    Un tour de conversation ; une nouvelle session est ouverte tous les `turns_per_session` tours.
+    Les tokens sont comptés en mots, le serveur factice émettant un mot par token.
+    """
+    if state.chat_session is None or state.turns >= settings.turns_per_session:
+        state.chat_session = f"load-{state.run_id}-{state.worker}-{uuid.uuid4().hex[:8]}"
+        state.turns = 0
+    message = CHAT_MESSAGES[state.turns % len(CHAT_MESSAGES)]
+    state.turns += 1
+
+    started = time.perf_counter()
+    first_token = None
+    text = []
+    async with client.stream("POST", "/chat_stream", json={"message": message}, headers={"x-session-id": state.chat_session}) as response:
+        if response.status_code != 200:
+            await response.aread()
+            return Sample(False, response.status_code, _ms(started), error=response.text[:200])
+        async for chunk in response.aiter_text():
+            if chunk and first_token is None:
+                first_token = time.perf_counter()
+            text.append(chunk)
+    ended = time.perf_counter()
+    if first_token is None:
+        return Sample(False, 200, _ms(started), error="empty stream")
+    tokens = len("".join(text).split())
+    stream_seconds = ended - first_token
+    return Sample(
+        True, 200, (ended - started) * 1000,
+        ttft_ms=(first_token - started) * 1000,
+        tokens_per_second=tokens / stream_seconds if stream_seconds > 0 else None,
+    )
+
+async def analyze(client: httpx.AsyncClient, state: WorkerState, settings: DriverSettings) -> Sample:
+    """
+    Mise en file d'une analyse ; avec `analyze_wait`, `job_ms` mesure le délai jusqu'au
+    résultat (le job est interrogé toutes les 100 ms).
+    """
+    started = time.perf_counter()
+    response = await client.post("/analyze", json={"session_id": _seeded_session(state, settings), "bypass_cache": settings.bypass_cache})
+    latency = _ms(started)
+    if response.status_code != 202:
+        return Sample(False, response.status_code, latency, error=response.text[:200])
+    if not settings.analyze_wait:
+        return Sample(True, 202, latency)
+
+    job_id = response.json()["job_id"]
+    while _ms(started) < settings.job_timeout * 1000:
+        job = (await client.get(f"/analyze/jobs/{job_id}")).json()
+        if job.get("status") == "done":
+            return Sample(True, 202, latency, job_ms=_ms(started))
+        if job.get("status") == "failed":
+            return Sample(False, 202, latency, job_ms=_ms(started), error=str(job.get("error"))[:200])
+        await asyncio.sleep(0.1)
+    return Sample(False, 202, latency, error="job timeout")
+
+def get_scenario(name: str) -> Callable[[httpx.AsyncClient, WorkerState, DriverSettings], Awaitable[Sample]]:
+    path, params = GET_SCENARIOS[name]
+
+    async def run(client: httpx.AsyncClient, state: WorkerState, settings: DriverSettings) -> Sample:
+        headers = {"If-None-Match": state.etags[name]} if settings.revalidate and name in state.etags else {}
+        started = time.perf_counter()
+        response = await client.get(path, params=params, headers=headers)
+        await response.aread()
+        latency = _ms(started)
+        if "etag" in response.headers:
+            state.etags[name] = response.headers["etag"]
+        ok = response.status_code in (200, 304)
+        return Sample(ok, response.status_code, latency, error=None if ok else response.text[:200])
+
+    return run
+
+async def conversation(client: httpx.AsyncClient, state: WorkerState, settings: DriverSettings) -> Sample:
+    started = time.perf_counter()
+    response = await client.get("/conversation", params={"session_id": _seeded_session(state, settings)})
+    await response.aread()
+    ok = response.status_code == 200
+    return Sample(ok, response.status_code, _ms(started), error=None if ok else response.text[:200])
+
+SCENARIOS = {
+    "chat_stream": chat_stream,
+    "analyze": analyze,
+    "conversation": conversation,
+    **{name: get_scenario(name) for name in GET_SCENARIOS},
+}
+
+def percentile(sorted_values: List[float], q: float) -> Optional[float]:
+    """
+    Percentile par interpolation linéaire (q entre 0 et 100) d'une liste triée.
+    """
+    if not sorted_values:
+        return None
+    position = (len(sorted_values) - 1) * q / 100
+    lower = int(position)
+    upper = min(lower + 1, len(sorted_values) - 1)
+    value = sorted_values[lower] + (sorted_values[upper] - sorted_values[lower]) * (position - lower)
+    return round(value, 2)
+
+def distribution(values: List[Optional[float]]) -> Optional[dict]:
+    values = sorted(v for v in values if v is not None)
+    if not values:
+        return None
+    return {
+        "p50": percentile(values, 50),
+        "p95": percentile(values, 95),
+        "p99": percentile(values, 99),
+        "mean": round(sum(values) / len(values), 2),
+        "max": round(values[-1], 2),
+        "count": len(values),
+    }
+
+def summarize(samples: List[Sample], elapsed: float) -> dict:
+    ok = [s for s in samples if s.ok]
+    status_codes: Dict[str, int] = {}
+    errors: Dict[str, int] = {}
+    for s in samples:
+        status_codes[str(s.status)] = status_codes.get(str(s.status), 0) + 1
+        if s.error:
+            errors[s.error] = errors.get(s.error, 0) + 1
+    summary = {
+        "requests": len(samples),
+        "errors": len(samples) - len(ok),
+        "error_rate": round((len(samples) - len(ok)) / len(samples), 4) if samples else 0.0,
+        "rps": round(len(ok) / elapsed, 2) if elapsed > 0 else 0.0,
+        "elapsed_seconds": round(elapsed, 2),
+        "status_codes": status_codes,
+        "latency_ms": distribution([s.latency_ms for s in ok]),
+    }
+    for name in ("ttft_ms", "tokens_per_second", "job_ms"):
+        values = distribution([getattr(s, name) for s in ok])
+        if values:
+            summary[name] = values
+    if errors:
+        summary["top_errors"] = dict(sorted(errors.items(), key=lambda item: -item[1])[:5])
+    return summary
+
+async def run_scenario(client: httpx.AsyncClient, name: str, concurrency: int, duration: float,
+                       max_requests: Optional[int], settings: DriverSettings, run_id: str, seed: int) -> dict:
+    scenario = SCENARIOS[name]
+    samples: List[Sample] = []
+    deadline = time.perf_counter() + duration
+    budget = {"left": max_requests}
+
+    def take() -> bool:
+        if time.perf_counter() >= deadline:
+            return False
+        if budget["left"] is None:
+            return True
+        if budget["left"] <= 0:
+            return False
+        budget["left"] -= 1
+        return True
+
+    async def worker(index: int):
+        state = WorkerState(index, run_id, random.Random(seed * 1000 + index))
+        while take():
+            started = time.perf_counter()
+            try:
+                samples.append(await scenario(client, state, settings))
+            except httpx.HTTPError as e:
+                samples.append(Sample(False, 0, _ms(started), error=f"{type(e).__name__}: {e}"[:200]))
+
+    started = time.perf_counter()
+    await asyncio.gather(*(worker(i) for i in range(concurrency)))
+    return summarize(samples, time.perf_counter() - started)
+
+async def wait_until_ready(client: httpx.AsyncClient, timeout: float):
+    """
+    Attend que l'application soit prête (/health/ready), préchauffage compris.
+    """
+    deadline = time.perf_counter() + timeout
+    while True:
+        try:
+            response = await client.get("/health/ready")
+            if response.status_code == 200:
+                return
+        except httpx.HTTPError:
+            pass
+        if time.perf_counter() >= deadline:
+            raise SystemExit(f"Application non prête après {timeout:.0f} s")
+        await asyncio.sleep(0.5)
+
+async def server_stats(client: httpx.AsyncClient, fake_llm_url: Optional[str]) -> dict:
+    """
+    Compteurs exposés par l'application (et par le serveur factice) en fin de campagne.
+    """
+    stats = {}
+    for path in STATS_ENDPOINTS + ["/health/startup"]:
+        try:
+            response = await client.get(path)
+            if response.status_code == 200:
+                stats[path] = response.json()
+        except httpx.HTTPError:
+            pass
+    if fake_llm_url:
+        try:
+            async with httpx.AsyncClient(base_url=fake_llm_url) as fake:
+                stats["fake_llm"] = (await fake.get("/_fake/stats")).json()
+        except httpx.HTTPError:
+            pass
+    return stats
+
+def git_revision() -> dict:
+    def git(*args) -> Optional[str]:
+        try:
+            return subprocess.run(["git", *args], capture_output=True, text=True, check=True).stdout.strip()
+        except (OSError, subprocess.CalledProcessError):
+            return None
+
+    return {"commit": git("rev-parse", "HEAD"), "subject": git("log", "-1", "--format=%s"), "dirty": bool(git("status", "--porcelain"))}
+
+async def run(args) -> dict:
+    settings = DriverSettings(
+        seeded_sessions=args.seeded_sessions,
+        turns_per_session=args.turns_per_session,
+        analyze_wait=not args.no_analyze_wait,
+        bypass_cache=args.bypass_cache,
+        revalidate=args.revalidate,
+    )
+    run_id = uuid.uuid4().hex[:6]
+    limits = httpx.Limits(max_connections=args.concurrency * 2, max_keepalive_connections=args.concurrency * 2)
+    async with httpx.AsyncClient(base_url=args.base_url, limits=limits, timeout=args.timeout) as client:
+        await wait_until_ready(client, args.ready_timeout)
+        results = {}
+        for name in args.scenarios:
+            print(f"{name} : {args.concurrency} clients, {args.duration:.0f} s")
+            results[name] = await run_scenario(client, name, args.concurrency, args.duration, args.requests, settings, run_id, args.seed)
+            latency = results[name]["latency_ms"] or {}
+            print(f"  {results[name]['rps']} req/s, p50 {latency.get('p50')} ms, p99 {latency.get('p99')} ms, {results[name]['errors']} erreurs")
+        return {
+            "created_at": datetime.now(timezone.utc).isoformat(),
+            "git": git_revision(),
+            "config": {
+                "base_url": args.base_url,
+                "concurrency": args.concurrency,
+                "duration_seconds": args.duration,
+                "max_requests": args.requests,
+                "seed": args.seed,
+                **settings.__dict__,
+            },
+            "results": results,
+            "server_stats": await server_stats(client, args.fake_llm_url),
+        }
+
+# Métriques comparées : (scénario -> clé, sous-clé, sens de l'amélioration).
+COMPARED_METRICS = [
+    ("latency_ms", "p50", "lower"),
+    ("latency_ms", "p95", "lower"),
+    ("latency_ms", "p99", "lower"),
+    ("ttft_ms", "p95", "lower"),
+    ("tokens_per_second", "p50", "higher"),
+    ("job_ms", "p95", "lower"),
+    ("rps", None, "higher"),
+    ("error_rate", None, "lower"),
+]
+
+def compare(baseline: dict, current: dict, threshold: float) -> List[dict]:
+    """
+    Écart relatif de chaque métrique entre deux fichiers de résultats ; une variation
+    dans le mauvais sens au-delà de `threshold` est une régression.
+    """
+    rows = []
+    for name, result in current["results"].items():
+        before = baseline["results"].get(name)
+        if before is None:
+            continue
+        for key, sub, better in COMPARED_METRICS:
+            old, new = before.get(key), result.get(key)
+            if sub is not None:
+                old, new = (old or {}).get(sub), (new or {}).get(sub)
+            if old is None or new is None:
+                continue
+            if key == "error_rate":
+                # Un taux d'erreur se compare en points, pas en proportion de lui-même.
+                change = new - old
+                worse = change > threshold / 10
+            else:
+                change = (new - old) / old if old else (0.0 if new == old else float("inf"))
+                worse = change > threshold if better == "lower" else change < -threshold
+            rows.append({
+                "scenario": name,
+                "metric": f"{key}.{sub}" if sub else key,
+                "baseline": old,
+                "current": new,
+                "change": round(change, 4),
+                "regression": worse,
+            })
+    return rows
+
+def print_comparison(rows: List[dict], baseline: dict, current: dict):
+    print(f"{(baseline.get('git') or {}).get('commit', '?')[:10]} -> {(current.get('git') or {}).get('commit', '?')[:10]}")
+    for row in rows:
+        flag = "  RÉGRESSION" if row["regression"] else ""
+        print(f"{row['scenario']:<18} {row['metric']:<22} {row['baseline']:>10} -> {row['current']:>10} ({row['change']:+.1%}){flag}")
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    run_parser = commands.add_parser("run", help="Joue les scénarios et écrit les résultats")
+    run_parser.add_argument("--base-url", default="http://127.0.0.1:8000")
+    run_parser.add_argument("--scenarios", nargs="+", default=DEFAULT_SCENARIOS, choices=sorted(SCENARIOS))
+    run_parser.add_argument("--concurrency", type=int, default=16)
+    run_parser.add_argument("--duration", type=float, default=20.0, help="Durée de chaque scénario (secondes)")
+    run_parser.add_argument("--requests", type=int, help="Nombre maximal de requêtes par scénario")
+    run_parser.add_argument("--timeout", type=float, default=120.0, help="Délai maximal d'une requête (secondes)")
+    run_parser.add_argument("--ready-timeout", type=float, default=60.0)
+    run_parser.add_argument("--seeded-sessions", type=int, default=5000, help="Valeur de --sessions passée à seed_data")
+    run_parser.add_argument("--turns-per-session", type=int, default=4)
+    run_parser.add_argument("--no-analyze-wait", action="store_true", help="Ne mesure que la mise en file des analyses")
+    run_parser.add_argument("--bypass-cache", action="store_true", help="Analyses sans le cache des résultats du modèle")
+    run_parser.add_argument("--revalidate", action="store_true", help="Renvoie l'ETag reçu (If-None-Match), comme un navigateur")
+    run_parser.add_argument("--fake-llm-url", help="URL du serveur factice, pour joindre ses compteurs aux résultats")
+    run_parser.add_argument("--seed", type=int, default=42)
+    run_parser.add_argument("--output", help="Fichier JSON de résultats (par défaut load-<commit>.json)")
+
+    compare_parser = commands.add_parser("compare", help="Compare deux fichiers de résultats")
+    compare_parser.add_argument("baseline")
+    compare_parser.add_argument("current")
+    compare_parser.add_argument("--threshold", type=float, default=0.1, help="Dégradation relative tolérée (0.1 : 10 %%)")
+    args = parser.parse_args()
+
+    if args.command == "compare":
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        with open(args.current) as f:
+            current = json.load(f)
+        rows = compare(baseline, current, args.threshold)
+        print_comparison(rows, baseline, current)
+        sys.exit(1 if any(row["regression"] for row in rows) else 0)
+
+    report = asyncio.run(run(args))
+    output = args.output or f"load-{(report['git']['commit'] or 'unknown')[:10]}.json"
+    with open(output, "w") as f:
+        json.dump(report, f, indent=2, default=str)
+    print(f"Résultats écrits dans {output}")
+
+if __name__ == "__main__":
+    main()
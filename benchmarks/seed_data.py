@@ -0,0 +1,138 @@
+"""
+Générateur de données synthétiques pour les tests de charge : sessions de chat
+(historique, agrégats `stats`, idée finale) et analyses, au format écrit par
+l'application, dans la base désignée par MONGO_URI / MONGO_DB_NAME.
+
+Aucune base de production n'est nécessaire : une instance locale suffit, par exemple
+
+    docker run -d --name mongo-bench -p 27017:27017 mongo:7
+    MONGO_URI=mongodb://127.0.0.1:27017 MONGO_DB_NAME=bench \\
+        python -m benchmarks.seed_data --sessions 20000 --drop
+
+Les identifiants de session (bench-000000, ...) sont déterministes : relancer le script
+remplace les mêmes documents. Les index sont créés et les agrégats du tableau de bord
+recalculés à la fin.
+"""
+import argparse
+import asyncio
+import os
+import random
+import sys
+import time
+from datetime import datetime, timedelta, timezone
+
+from pymongo import ReplaceOne
+
+from services.analysis_service import size_stats_from_running, time_stats_from_running, update_running_stats
+from services.indexes import ensure_indexes
+from services.repository import analyses_repository, async_mongo_manager, chats_repository
+from services.rollup_service import refresh_rollups
+from services.saveConversation_service import build_message
+
+TORONTO_OFFSET = timezone(timedelta(hours=-5))
+SUBJECTS = [
+    "une application de covoiturage scolaire", "des capteurs de qualité de l'air", "un jeu éducatif en réalité virtuelle",
+    "une plateforme d'échange d'outils entre voisins", "un assistant IA pour la santé mentale", "des toits végétalisés",
+    "une mobilité douce en ville", "un marché local de producteurs", "le recyclage des batteries", "une école du numérique",
+]
+DETAILS = ["pour les étudiants", "en milieu rural", "à faible coût", "avec l'apprentissage automatique", "pour les aînés", "durable"]
+
+def session_id(index: int) -> str:
+    return f"bench-{index:06d}"
+
+def synthetic_session(rng: random.Random, index: int, mean_messages: int, start: datetime, days: int, completed_ratio: float) -> dict:
+    """
+    Session au format de la collection `chats` : messages alternés user/assistant,
+    réponses plus longues que les questions, pauses occasionnelles de plus de 30 minutes.
+    """
+    sid = session_id(index)
+    t = start + timedelta(minutes=rng.randint(0, days * 24 * 60))
+    subject = rng.choice(SUBJECTS)
+    history = []
+    for j in range(max(2, int(rng.expovariate(1 / mean_messages)))):
+        t += timedelta(seconds=rng.choice([5, 20, 60, 180, 600, 2400]), milliseconds=rng.randint(0, 999))
+        role = "user" if j % 2 == 0 else "assistant"
+        if role == "user":
+            content = f"Que penses-tu de {subject} {rng.choice(DETAILS)} ?"
+        else:
+            content = " ".join(f"Piste {k} : {subject} {rng.choice(DETAILS)}." for k in range(rng.randint(3, 30)))
+        history.append(build_message(sid, role, content, t.isoformat()))
+    doc = {"session_id": sid, "conversation_history": history, "stats": update_running_stats(None, history)}
+    if rng.random() < completed_ratio:
+        doc["final_idea"] = f"{subject.capitalize()} {rng.choice(DETAILS)}"
+    return doc
+
+def synthetic_analysis(rng: random.Random, chat: dict) -> dict:
+    """
+    Analyse au format de analysis_jobs.run_session_analysis, datée après la fin de la session.
+    """
+    last_ms = chat["conversation_history"][-1]["ts_ms"]
+    created_at = datetime.fromtimestamp(last_ms / 1000, tz=timezone.utc).replace(tzinfo=None) + timedelta(minutes=rng.randint(1, 600))
+    return {
+        "session_id": chat["session_id"],
+        "final_idea": chat["final_idea"],
+        "time_stats": time_stats_from_running(chat["stats"]),
+        "size_stats": size_stats_from_running(chat["stats"]),
+        "originality_score": rng.randint(1, 10),
+        "matching_score": rng.randint(1, 10),
+        "assistant_influence_score": rng.randint(1, 10),
+        "matching_analysis": {"summary": "Analyse synthétique."},
+        "created_at": created_at,
+    }
+
+async def seed(sessions: int, mean_messages: int, days: int, completed_ratio: float, analyzed_ratio: float,
+               batch_size: int, seed_value: int, drop: bool) -> dict:
+    rng = random.Random(seed_value)
+    start = datetime.now(TORONTO_OFFSET).replace(microsecond=0) - timedelta(days=days)
+    if drop:
+        await chats_repository.collection.delete_many({"session_id": {"$regex": "^bench-"}})
+        await analyses_repository.collection.delete_many({"session_id": {"$regex": "^bench-"}})
+    await ensure_indexes()
+
+    counts = {"chats": 0, "completed": 0, "analyses": 0, "messages": 0}
+    t0 = time.perf_counter()
+    for offset in range(0, sessions, batch_size):
+        chats, analyses = [], []
+        for index in range(offset, min(offset + batch_size, sessions)):
+            chat = synthetic_session(rng, index, mean_messages, start, days, completed_ratio)
+            chats.append(ReplaceOne({"session_id": chat["session_id"]}, chat, upsert=True))
+            counts["messages"] += len(chat["conversation_history"])
+            if "final_idea" in chat:
+                counts["completed"] += 1
+                if rng.random() < analyzed_ratio:
+                    analysis = synthetic_analysis(rng, chat)
+                    analyses.append(ReplaceOne({"session_id": analysis["session_id"]}, analysis, upsert=True))
+        await chats_repository.bulk_write(chats)
+        if analyses:
+            await analyses_repository.bulk_write(analyses)
+        counts["chats"] += len(chats)
+        counts["analyses"] += len(analyses)
+        print(f"{counts['chats']}/{sessions} sessions écrites")
+
+    counts["seconds"] = round(time.perf_counter() - t0, 1)
+    # Les écritures directes contournent les mises à jour incrémentales des agrégats.
+    await refresh_rollups()
+    await async_mongo_manager.close()
+    return counts
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sessions", type=int, default=5000)
+    parser.add_argument("--mean-messages", type=int, default=12)
+    parser.add_argument("--days", type=int, default=90, help="Période couverte, jusqu'à aujourd'hui")
+    parser.add_argument("--completed-ratio", type=float, default=0.7, help="Part des sessions avec une idée finale")
+    parser.add_argument("--analyzed-ratio", type=float, default=0.8, help="Part des sessions terminées déjà analysées")
+    parser.add_argument("--batch-size", type=int, default=1000)
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--drop", action="store_true", help="Supprime d'abord les sessions et analyses bench-*")
+    args = parser.parse_args()
+
+    if not os.getenv("MONGO_URI") or not os.getenv("MONGO_DB_NAME"):
+        sys.exit("MONGO_URI et MONGO_DB_NAME doivent désigner une base locale de test.")
+    print(asyncio.run(seed(
+        args.sessions, args.mean_messages, args.days, args.completed_ratio, args.analyzed_ratio,
+        args.batch_size, args.seed, args.drop,
+    )))
+
+if __name__ == "__main__":
+    main()
@@ -1,10 +1,39 @@
+import asyncio
+from contextlib import asynccontextmanager
+from utils.startup import startup_report
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
-from routes.chat_router import router as chat_router
-from routes.analyse_router import router as analyse_router
-from routes.admin_router import router as admin_router
+with startup_report.importing("routes.chat_router"):
+    from routes.chat_router import router as chat_router
+with startup_report.importing("routes.analyse_router"):
+    from routes.analyse_router import router as analyse_router
+with startup_report.importing("routes.admin_router"):
+    from routes.admin_router import router as admin_router
+with startup_report.importing("routes.health_router"):
+    from routes.health_router import router as health_router
+from services.repository import async_mongo_manager
+from services.llm_gateway import llm_gateway
+from services.analysis_jobs import analysis_pool
+from services.rollup_service import rollup_scheduler
+from services.warmup import warm_up
+from utils.cache_config import config_cache
 
-app = FastAPI()
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Le préchauffage (MongoDB, index, connexions au modèle) tourne en tâche de fond :
+    # /health/ready répond 503 tant qu'il n'est pas terminé.
+    warmup_task = asyncio.create_task(warm_up())
+    yield
+    warmup_task.cancel()
+    await asyncio.gather(warmup_task, return_exceptions=True)
+    # Les tâches de fond s'arrêtent avant la fermeture des clients qu'elles utilisent.
+    await analysis_pool.stop()
+    await rollup_scheduler.stop()
+    await config_cache.stop()
+    await llm_gateway.aclose()
+    await async_mongo_manager.close()
+
+app = FastAPI(lifespan=lifespan)
 
 app.add_middleware(
     CORSMiddleware,
@@ -12,11 +41,16 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=[
+        "X-Context-Tokens", "X-Context-Messages", "X-Context-Truncated",
+        "X-Next-Cursor", "ETag",
+    ],
 )
 
 app.include_router(chat_router)
 app.include_router(analyse_router)
 app.include_router(admin_router)
+app.include_router(health_router)
 
 if __name__ == "__main__":
     import uvicorn
@@ -1,5 +1,5 @@
-from pydantic import BaseModel
-from typing import List, Optional
+from pydantic import BaseModel, Field
+from typing import List, Literal, Optional
 
 class IntervalValue(BaseModel):
     min: int
@@ -16,9 +16,11 @@ class ConfigModel(BaseModel):
 class DownloadRequest(BaseModel):
     ids: List[str]  
     format: Optional[str] = None
+    gzip: bool = False
 
 class AnalyzePayload(BaseModel):
     session_id: str
+    bypass_cache: bool = False
 
 class ChatRequest(BaseModel):
     message: str
@@ -26,3 +28,11 @@ class ChatRequest(BaseModel):
 class FinalIdeaRequest(BaseModel):
     idea: str
 
+
+class BulkAnalyzePayload(BaseModel):
+    session_ids: Optional[List[str]] = None
+    filter: Literal["missing_analysis", "all_with_final_idea"] = "missing_analysis"
+    concurrency: int = Field(default=4, ge=1, le=64)
+    tokens_per_minute: Optional[int] = Field(default=None, gt=0)
+    batch_size: int = Field(default=100, ge=1, le=1000)
+    bypass_cache: bool = False
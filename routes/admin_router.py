@@ -1,64 +1,199 @@
-from fastapi import APIRouter, HTTPException
-from services.admin_services import get_config, get_chats, get_analysis, get_all, update_config, fetch_users_by_session_id, fetch_all_users, get_statistics, delete_analysis_entry, get_analysis_data, get_diagram_data
-from datetime import datetime
-from typing import List, Dict, Optional, Any
+import asyncio
+from fastapi import APIRouter, HTTPException, Query, Request
+from services.admin_services import get_config, update_config, fetch_users_by_session_id, list_sessions, InvalidCursorError, SESSION_PAGE_MAX, ANALYSIS_PAGE_MAX, get_statistics, delete_analysis_entry, get_analysis_data, get_analysis_buckets, get_diagram_data
+from datetime import datetime, timedelta
+from zoneinfo import ZoneInfo, ZoneInfoNotFoundError
+from typing import Optional, Literal
 from models.models import ConfigModel, DownloadRequest
+from services.session_store import session_memory
+from services.rollup_service import refresh_rollups, statistics_from_rollup
+from services.export_service import ExportFormatError, check_format, encode, encode_combined, iter_documents, peek, response_headers
+from services.llm_gateway import llm_gateway
+from services.repository import async_mongo_manager
+from fastapi.responses import StreamingResponse
+from utils.http_cache import HTTP_CACHE_TTL_SECONDS, Payload, cached_json, response_cache
 
 router = APIRouter()
 
 @router.get("/stats")
-def fetch_stats():
-    return get_statistics()
+async def fetch_stats(request: Request):
+    return await cached_json(request, get_statistics, ("analyses", "chats"), HTTP_CACHE_TTL_SECONDS)
+
+@router.post("/stats/refresh")
+async def refresh_stats():
+    """
+    Recalcule immédiatement les agrégats du tableau de bord au lieu d'attendre le prochain cycle.
+    """
+    return statistics_from_rollup(await refresh_rollups())
 
 @router.get("/diagrams")
-def fetch_diagram_data():
-    return get_diagram_data()
+async def fetch_diagram_data(request: Request, theme_engine: Literal["auto", "llm", "local"] = "auto"):
+    """
+    theme_engine : "llm" (modèle), "local" (extraction hors ligne) ou "auto" (modèle avec repli local).
+    """
+    return await cached_json(request, lambda: get_diagram_data(theme_engine), ("analyses",), HTTP_CACHE_TTL_SECONDS)
+
+def _parse_day(value: Optional[str], name: str) -> Optional[datetime]:
+    if not value:
+        return None
+    try:
+        return datetime.strptime(value, "%Y-%m-%d")
+    except ValueError:
+        raise HTTPException(status_code=400, detail=f"Invalid {name} '{value}', expected YYYY-MM-DD")
+
+def _day_range(start_date: Optional[str], end_date: Optional[str]):
+    # end_date est inclusive : la borne haute exclusive est le lendemain à minuit.
+    start_dt = _parse_day(start_date, "start_date")
+    end_dt = _parse_day(end_date, "end_date")
+    return start_dt, end_dt + timedelta(days=1) if end_dt else None
 
 @router.get("/analysis")
-async def fetch_analysis(start_date: str = None, end_date: str = None):
+async def fetch_analysis(
+    request: Request,
+    start_date: str = None,
+    end_date: str = None,
+    limit: Optional[int] = Query(None, ge=1, le=ANALYSIS_PAGE_MAX),
+    cursor: Optional[str] = None,
+):
+    """
+    Fetch analysis data with optional date filtering (either bound may be omitted).
+    With `limit`, the page is paginated: the next cursor is returned in the X-Next-Cursor header.
+    """
+    start_dt, end_dt = _day_range(start_date, end_date)
+
+    async def compute():
+        try:
+            page = await get_analysis_data(start_dt, end_dt, limit, cursor)
+        except InvalidCursorError as e:
+            raise HTTPException(status_code=400, detail=str(e))
+        return Payload(page["items"], {"X-Next-Cursor": page["next_cursor"]} if page["next_cursor"] else {})
+
+    return await cached_json(request, compute, ("analyses",), HTTP_CACHE_TTL_SECONDS)
+
+@router.get("/analysis/buckets")
+async def fetch_analysis_buckets(
+    request: Request,
+    start_date: str = None,
+    end_date: str = None,
+    unit: Literal["day", "week", "month"] = "day",
+    timezone: str = "UTC",
+):
+    """
+    Nombre d'analyses et scores moyens par jour, semaine ou mois de la période.
+    """
+    try:
+        ZoneInfo(timezone)
+    except (ZoneInfoNotFoundError, ValueError):
+        raise HTTPException(status_code=400, detail=f"Unknown timezone '{timezone}'")
+    start_dt, end_dt = _day_range(start_date, end_date)
+    return await cached_json(
+        request, lambda: get_analysis_buckets(start_dt, end_dt, unit, timezone), ("analyses",), HTTP_CACHE_TTL_SECONDS
+    )
+
+@router.post("/analysis/recompute-stats", status_code=202)
+async def recompute_analysis_stats(chunk_size: int = Query(2000, ge=100, le=20000), gap_threshold_minutes: float = Query(30, gt=0)):
     """
-    Fetch analysis data with optional date filtering.
+    Recalcule time_stats et size_stats de toutes les analyses (moteur vectorisé, par blocs).
+    L'avancement se suit via GET /analyze/jobs/{job_id}.
     """
-    start_dt = datetime.strptime(start_date, "%Y-%m-%d") if start_date else None
-    end_dt = datetime.strptime(end_date, "%Y-%m-%d") if end_date else None
-    print(get_analysis_data(start_dt, end_dt))
-    return get_analysis_data(start_dt, end_dt)
+    # Moteur vectorisé (numpy) chargé au premier recalcul, pas au démarrage du worker.
+    from services.stats_engine import start_stats_recompute
+
+    return await start_stats_recompute(chunk_size, gap_threshold_minutes)
 
 @router.delete("/analysis/{session_id}")
 async def remove_analysis(session_id: str):
     """
     Delete a specific analysis entry.
     """
-    return delete_analysis_entry(session_id)
+    return await delete_analysis_entry(session_id)
+
+async def _list_sessions(request: Request, limit: int, cursor: Optional[str], status: Optional[str], search: Optional[str]):
+    async def compute():
+        try:
+            return await list_sessions(limit, cursor, status, search)
+        except InvalidCursorError as e:
+            raise HTTPException(status_code=400, detail=str(e))
+
+    return await cached_json(request, compute, ("analyses", "chats"), HTTP_CACHE_TTL_SECONDS)
 
-@router.get("/datas", response_model=List[Dict])
-async def get_users():
+@router.get("/datas")
+async def get_users(
+    request: Request,
+    limit: int = Query(50, ge=1, le=SESSION_PAGE_MAX),
+    cursor: Optional[str] = None,
+    status: Optional[Literal["analyzed", "completed", "abandoned"]] = None,
+    search: Optional[str] = None,
+):
     """
-    Récupère toutes les données depuis MongoDB sans filtrage.
+    Liste paginée des sessions : {"items": [...], "next_cursor": ...}.
+    Passer `next_cursor` en `cursor` pour obtenir la page suivante.
     """
-    return await fetch_all_users()
+    return await _list_sessions(request, limit, cursor, status, search)
 
-@router.get("/user", response_model=List[Dict[str, Any]])
-async def get_users(id_session: Optional[str] = None):
+@router.get("/user")
+async def get_users(
+    request: Request,
+    id_session: Optional[str] = None,
+    limit: int = Query(50, ge=1, le=SESSION_PAGE_MAX),
+    cursor: Optional[str] = None,
+    status: Optional[Literal["analyzed", "completed", "abandoned"]] = None,
+    search: Optional[str] = None,
+):
     """
-    Récupère toutes les données depuis MongoDB.
-    - Si `id_session` est fourni, retourne les données filtrées par session_id.
-    - Sinon, retourne toutes les sessions.
+    Réponse paginée dans tous les cas : {"items": [...], "next_cursor": ...}.
+    - Si `id_session` est fourni, `items` contient la session complète (analyse et
+      conversation), ou rien si elle n'existe pas ; `next_cursor` vaut null.
+    - Sinon, liste paginée des sessions, comme /datas.
     """
     if id_session:
-        result = await fetch_users_by_session_id(id_session)
-        return [result] if result else [] 
-    return await fetch_all_users()
+        async def compute():
+            result = await fetch_users_by_session_id(id_session)
+            return {"items": [result] if result else [], "next_cursor": None}
+
+        return await cached_json(request, compute, ("analyses", "chats"), HTTP_CACHE_TTL_SECONDS)
+    return await _list_sessions(request, limit, cursor, status, search)
+
+@router.get("/session-store/stats")
+async def fetch_session_store_stats():
+    """
+    Occupation de la mémoire conversationnelle : sessions, octets, évictions, hits/misses.
+    """
+    return await session_memory.stats()
+
+@router.get("/http-cache/stats")
+async def fetch_http_cache_stats():
+    """
+    Cache des réponses de l'administration : entrées, hits, calculs mutualisés, réponses 304.
+    """
+    return response_cache.stats()
+
+@router.get("/mongo/pool-stats")
+async def fetch_mongo_pool_stats():
+    """
+    Pool de connexions MongoDB du worker : connexions ouvertes et utilisées, options du client.
+    """
+    return async_mongo_manager.pool_stats()
+
+@router.get("/llm/stats")
+async def fetch_llm_stats():
+    """
+    Appels au modèle via la passerelle partagée : appels, nouvelles tentatives, limitations (429), échecs.
+    """
+    return llm_gateway.stats()
 
 @router.get("/config", response_model=ConfigModel)
-async def get_configuration():
+async def get_configuration(request: Request):
     """
     Retrieve the configuration from the database.
     """
-    config = await get_config()
-    if not config:
-        raise HTTPException(status_code=404, detail="No configuration found in the database")
-    return config
+    async def compute():
+        config = await get_config()
+        if not config:
+            raise HTTPException(status_code=404, detail="No configuration found in the database")
+        return ConfigModel(**config)
+
+    return await cached_json(request, compute, ("config",), HTTP_CACHE_TTL_SECONDS)
 
 @router.put("/config", response_model=ConfigModel)
 async def update_configuration(config_data: ConfigModel):
@@ -70,24 +205,60 @@ async def update_configuration(config_data: ConfigModel):
         raise HTTPException(status_code=400, detail="Failed to update configuration")
     return updated_config
 
-@router.post("/download/chats", response_model=List[dict])
+def _export_format(request: DownloadRequest, table: Optional[str] = None) -> str:
+    try:
+        return check_format(request.format, table)
+    except ExportFormatError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+async def _report_missing(documents, missing: list, collection: str):
+    """
+    Transmet le flux puis signale les IDs introuvables, relevés pendant la lecture.
+    """
+    async for doc in documents:
+        yield doc
+    if missing:
+        print(f"Export {collection} : {len(missing)} session(s) introuvable(s) : {', '.join(missing[:20])}")
+
+async def _stream_collection(request: DownloadRequest, collection: str, basename: str, not_found: str):
+    file_format = _export_format(request, collection)
+    missing = []
+    first, documents = await peek(iter_documents(collection, request.ids, missing))
+    if first is None:
+        raise HTTPException(status_code=400, detail=not_found)
+    media_type, headers = response_headers(basename, file_format, request.gzip)
+    documents = _report_missing(documents, missing, collection)
+    return StreamingResponse(encode(documents, file_format, collection, request.gzip), media_type=media_type, headers=headers)
+
+@router.post("/download/chats")
 async def download_chats(request: DownloadRequest):
-    chats = await get_chats(request.ids)
-    if not chats:
-        raise HTTPException(status_code=400, detail="No chats found for given IDs")
-    return chats
+    """
+    Export en flux (json, ndjson, csv ou parquet, éventuellement gzip) lu directement depuis un curseur.
+    """
+    return await _stream_collection(request, "chats", "chats", "No chats found for given IDs")
 
-@router.post("/download/analysis", response_model=List[dict])
+@router.post("/download/analysis")
 async def download_analysis(request: DownloadRequest):
-    analyses = await get_analysis(request.ids, request.format)
-    if not analyses:
-        raise HTTPException(status_code=400, detail="No analyses found for given IDs")
-    return analyses
+    return await _stream_collection(request, "analyses", "analysis", "No analyses found for given IDs")
 
-@router.post("/download/all", response_model=dict)
+@router.post("/download/all")
 async def download_all(request: DownloadRequest):
-    data = await get_all(request.ids, request.format)
-    if not data["chats"] and not data["analyses"]:
+    file_format = _export_format(request)
+    missing_chats, missing_analyses = [], []
+    (first_chat, chats), (first_analysis, analyses) = await asyncio.gather(
+        peek(iter_documents("chats", request.ids, missing_chats)),
+        peek(iter_documents("analyses", request.ids, missing_analyses)),
+    )
+    if first_chat is None and first_analysis is None:
         raise HTTPException(status_code=400, detail="No data found for given IDs")
-    return data
+    media_type, headers = response_headers("all", file_format, request.gzip)
+    streams = {
+        "chats": _report_missing(chats, missing_chats, "chats"),
+        "analyses": _report_missing(analyses, missing_analyses, "analyses"),
+    }
+    return StreamingResponse(
+        encode_combined(streams, file_format, request.gzip),
+        media_type=media_type,
+        headers=headers
+    )
 
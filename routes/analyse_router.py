@@ -1,48 +1,51 @@
 from fastapi import APIRouter, HTTPException
-from datetime import datetime
-from services.analysis_service import compute_time_stats, compute_size_stats, analyze_final_idea
-from services.mongodb_connection import MongoDBManager
-from models.models import AnalyzePayload
+from services.analysis_jobs import analysis_pool, get_job
+from services.bulk_analysis import start_bulk_analysis
+from services.llm_cache import llm_cache
+from services.repository import chats_repository
+from models.models import AnalyzePayload, BulkAnalyzePayload
 
 router = APIRouter()
-mongo_manager = MongoDBManager()
-db = mongo_manager.db
 
-@router.post("/analyze")
+@router.post("/analyze", status_code=202)
 async def analyze_session(payload: AnalyzePayload):
-    session_id = payload.session_id
-
-    session_doc = db["chats"].find_one({"session_id": session_id})
+    """
+    Met l'analyse de la session en file d'attente et renvoie immédiatement l'identifiant du job.
+    Une demande répétée sur une conversation inchangée renvoie le même job ;
+    `bypass_cache` force un nouvel appel au modèle.
+    """
+    session_doc = await chats_repository.find_one(
+        {"session_id": payload.session_id},
+        {"_id": 0, "session_id": 1, "conversation_history": 1, "final_idea": 1}
+    )
     if not session_doc:
         raise HTTPException(status_code=404, detail="Session not found")
 
-    conversation_history = session_doc.get("conversation_history", [])
-    final_idea = session_doc.get("final_idea", "")
-
-    time_stats = compute_time_stats(conversation_history)
-    size_stats = compute_size_stats(conversation_history)
-
-    try:
-        originality_score, matching_score, matching_analysis, assistant_influence_score = analyze_final_idea(conversation_history, final_idea)
-    except ValueError:
-        return False  
-
-    analysis_result = {
-        "session_id": session_id,
-        "final_idea": final_idea,
-        "time_stats": time_stats,
-        "size_stats": size_stats,
-        "originality_score": originality_score,
-        "matching_score": matching_score,
-        "assistant_influence_score": assistant_influence_score,
-        "matching_analysis": matching_analysis,
-        "created_at": datetime.utcnow().isoformat(),
-    }
-    print(analysis_result)
-
-    try:
-        inserted_doc = db["analyses"].insert_one(analysis_result)
-        return inserted_doc.acknowledged  
-    except Exception as e:
-        return False 
-    
+    job = await analysis_pool.enqueue(session_doc, payload.bypass_cache)
+    return {"job_id": job["job_id"], "status": job["status"]}
+
+@router.post("/analyze/bulk", status_code=202)
+async def analyze_sessions_bulk(payload: BulkAnalyzePayload):
+    """
+    Lance la réanalyse d'une liste de sessions (`session_ids`) ou de toutes celles qui
+    correspondent à `filter`. L'avancement se suit via GET /analyze/jobs/{job_id}.
+    """
+    return await start_bulk_analysis(payload)
+
+@router.get("/analyze/cache/stats")
+async def get_analysis_cache_stats():
+    """
+    Cache des résultats du modèle : hits mémoire et base, défauts, écritures, contournements.
+    """
+    return llm_cache.stats()
+
+@router.get("/analyze/jobs/{job_id}")
+async def get_analysis_job(job_id: str):
+    """
+    Statut d'un job d'analyse (queued, running, done, failed) : scores pour une session,
+    avancement (total, processed, failed) pour une réanalyse en masse.
+    """
+    job = await get_job(job_id)
+    if not job:
+        raise HTTPException(status_code=404, detail="Job not found")
+    return job
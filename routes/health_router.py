@@ -0,0 +1,29 @@
+from fastapi import APIRouter
+from fastapi.responses import JSONResponse
+from services.warmup import readiness
+from utils.startup import startup_report
+
+router = APIRouter()
+
+@router.get("/health/live")
+async def liveness():
+    """
+    Le processus répond : ne vérifie aucune dépendance.
+    """
+    return {"status": "alive"}
+
+@router.get("/health/ready")
+async def ready():
+    """
+    200 une fois le préchauffage terminé et MongoDB joignable, 503 sinon : le répartiteur
+    n'envoie du trafic qu'aux workers prêts.
+    """
+    state = await readiness()
+    return JSONResponse(state, status_code=200 if state["ready"] else 503)
+
+@router.get("/health/startup")
+async def startup():
+    """
+    Chronologie du démarrage : imports par module, étapes de préchauffage, délai avant d'être prêt.
+    """
+    return startup_report.report()
@@ -1,231 +1,260 @@
-from services.mongodb_connection import MongoDBManager
-from openai import AzureOpenAI
-import os
-from dotenv import load_dotenv
+from services.repository import chats_repository, analyses_repository, config_repository
+from services.rollup_service import get_rollup, statistics_from_rollup, diagram_scores_from_rollup, on_analysis_replaced, on_chat_changed
+import re
+from datetime import datetime
+from bson import ObjectId
+from pymongo import ReturnDocument
 from typing import List, Optional, Dict, Any
 from utils import cache_config
-from utils.prompt_config import get_keyword_extraction_prompt
+from utils.http_cache import response_cache
+from services.theme_service import get_theme_distribution
 from models.models import ConfigModel
 
-load_dotenv()
-
-db_manager = MongoDBManager()
-
-chat_collection = db_manager.get_collection("chats")
-analysis_collection = db_manager.get_collection("analyses")
-config_collection = db_manager.get_collection("config")
-
-try:
-    client = AzureOpenAI(
-    api_key=os.getenv("API_KEY"),
-    api_version=os.getenv("OPENAI_API_VERSION"),
-    azure_endpoint=os.getenv("API_BASE")
-)
-except Exception as e:
-    raise RuntimeError(f"Erreur lors de l'initialisation du client Azure OpenAI : {e}")
-
-def get_statistics():
-    total_users = chat_collection.count_documents({})
-    total_completed_sessions = chat_collection.count_documents({"final_idea": {"$exists": True}})
-    total_abandoned_sessions = total_users - total_completed_sessions
-    reengagement_pipeline = [
-        {"$match": {"time_stats.user_returned_after_30mins": True}}, 
-        {"$group": {"_id": None, "num_reengagements": {"$sum": 1}}}  
-    ]
-    reengagement_result = list(analysis_collection.aggregate(reengagement_pipeline))
-    num_reengagements = reengagement_result[0].get("num_reengagements", 0) if reengagement_result else 0
-    session_duration_pipeline = [
-        {"$match": {"time_stats.total_duration_minutes": {"$exists": True}}},
-        {"$group": {"_id": None, "avg_session_duration": {"$avg": "$time_stats.total_duration_minutes"}}}
-    ]
-    session_duration_result = list(analysis_collection.aggregate(session_duration_pipeline))
-    avg_session_duration = round(session_duration_result[0].get("avg_session_duration", 0.00), 2) if session_duration_result else 0.00
-
-    return {
-        "total_users": total_users,
-        "total_completed_sessions": total_completed_sessions,
-        "total_abandoned_sessions": total_abandoned_sessions,
-        "num_reengagements": num_reengagements,  
-        "avg_session_duration": avg_session_duration  
-    }
-
-def extract_keywords(texts):
+async def get_statistics():
     """
-    Uses GPT-4o-mini to extract the most relevant themes and their frequencies as a Python dictionary.
+    Lit les compteurs pré-agrégés du tableau de bord (voir rollup_service).
     """
+    return statistics_from_rollup(await get_rollup())
 
-    prompt = get_keyword_extraction_prompt(texts)
-
-    try:
-        response = client.chat.completions.create(
-            model="gpt-4o",
-            messages=[
-                {"role": "system", "content": "You are an expert in semantic keyword extraction and frequency analysis."},
-                {"role": "user", "content": prompt}
-            ],
-            temperature=0.3
-        )
-
-        raw_response = response.choices[0].message.content
-
-        cleaned_response = raw_response.strip().replace("```python", "").replace("```", "").strip()
-
-        theme_frequencies = eval(cleaned_response) if cleaned_response.startswith("{") and cleaned_response.endswith("}") else {}
-
-        return [{"_id": theme, "count": round(freq, 2)} for theme, freq in theme_frequencies.items()]
-
-    except Exception as e:
-        return []
-
-def get_diagram_data():
+async def get_diagram_data(theme_engine: str = "auto"):
+    """
+    Scores moyens et heatmap lus dans les agrégats du tableau de bord ; la distribution
+    des thèmes vient du moteur choisi (voir theme_service.get_theme_distribution).
+    """
+    scores = diagram_scores_from_rollup(await get_rollup())
 
-    score_pipeline = [
-        {
-            "$group": {
-                "_id": None,
-                "avg_ai_score": {"$avg": "$assistant_influence_score"},
-                "avg_originality": {"$avg": "$originality_score"},
-                "avg_matching_score": {"$avg": "$matching_score"}
-            }
-        }
-    ]
-    score_result = list(analysis_collection.aggregate(score_pipeline))
-    avg_ai_score = round(score_result[0]["avg_ai_score"], 2) if score_result else 0.00
-    avg_originality = round(score_result[0]["avg_originality"], 2) if score_result else 0.00
-    avg_matching_score = round(score_result[0]["avg_matching_score"], 2) if score_result else 0.00 
+    final_ideas = await analyses_repository.find({"final_idea": {"$exists": True, "$ne": None}}, {"final_idea": 1})
 
-    size_pipeline = [
-        {
-            "$group": {
-                "_id": None,
-                "avg_user_msg_size": {"$avg": "$size_stats.avg_user_size"},
-                "avg_ai_msg_size": {"$avg": "$size_stats.avg_ai_size"}
-            }
-        }
-    ]
-    size_result = list(analysis_collection.aggregate(size_pipeline))
-    avg_user_msg_size = round(size_result[0]["avg_user_msg_size"], 2) if size_result else 0.00
-    avg_ai_msg_size = round(size_result[0]["avg_ai_msg_size"], 2) if size_result else 0.00
+    all_texts = [doc["final_idea"] for doc in final_ideas]
 
-    heatmap_pipeline = [
-        {
-            "$project": {
-                "originality_bucket": {
-                    "$switch": {
-                        "branches": [
-                            {"case": {"$lt": ["$originality_score", 25]}, "then": "0-25"},
-                            {"case": {"$lt": ["$originality_score", 50]}, "then": "25-50"},
-                            {"case": {"$lt": ["$originality_score", 75]}, "then": "50-75"},
-                            {"case": {"$lte": ["$originality_score", 100]}, "then": "75-100"}
-                        ],
-                        "default": "Unknown"
-                    }
-                },
-                "total_messages": "$time_stats.total_messages"
-            }
-        },
-        {
-            "$group": {
-                "_id": "$originality_bucket",
-                "avg_messages": {"$avg": "$total_messages"} 
-            }
-        },
-        {
-            "$sort": {"_id": 1}
-        }
-    ]
-    heatmap_result = list(analysis_collection.aggregate(heatmap_pipeline))
+    theme_result = await get_theme_distribution(all_texts, theme_engine)
+    return {**scores, "theme_distribution": theme_result}
 
-    final_ideas = list(analysis_collection.find({"final_idea": {"$exists": True, "$ne": None}}, {"final_idea": 1}))
+class InvalidCursorError(ValueError):
+    pass
 
-    all_texts = [doc["final_idea"] for doc in final_ideas]
+ANALYSIS_PAGE_MAX = 1000
 
-    theme_result = extract_keywords(all_texts)
-    return {
-        "avg_ai_score": avg_ai_score,
-        "avg_matching":avg_matching_score,
-        "avg_originality": avg_originality,
-        "avg_user_msg_size": avg_user_msg_size,
-        "avg_ai_msg_size": avg_ai_msg_size,
-        "heatmap_data": heatmap_result,
-        "theme_distribution": theme_result
-    }
+ANALYSIS_PROJECTION = {
+    "session_id": 1,
+    "time_stats.total_messages": 1,
+    "time_stats.total_duration_minutes": 1,
+    "created_at": 1,
+    "time_stats.user_returned_after_30mins": 1,
+    "time_stats.avg_ai_latency_seconds": 1,
+    "originality_score": 1,
+    "matching_score": 1,
+    "assistant_influence_score": 1,
+    "matching_analysis": 1
+}
 
-def get_analysis_data(start_date=None, end_date=None):
+def _created_at_range(start: Optional[datetime], end: Optional[datetime]) -> Dict[str, Any]:
     """
-    Retrieve analysis data from MongoDB, with optional filtering by date.
+    Filtre sur la période [start, end[ ; chaque borne est facultative.
     """
-    query = {}
-    if start_date and end_date:
-        query["created_at"] = {"$gte": start_date, "$lte": end_date}
-
-    analysis_data = list(analysis_collection.find(query, {
-        "_id": 0,
-        "session_id": 1, 
-        "time_stats.total_messages": 1, 
-        "time_stats.total_duration_minutes": 1,
-        "created_at": 1, 
-        "time_stats.user_returned_after_30mins": 1,        
-        "time_stats.avg_ai_latency_seconds": 1,
-        "originality_score": 1, 
-        "matching_score": 1, 
-        "assistant_influence_score":1, 
-        "matching_analysis": 1
-    }))
-
-    return analysis_data
-
-def delete_analysis_entry(session_id):
+    bounds = {}
+    if start:
+        bounds["$gte"] = start
+    if end:
+        bounds["$lt"] = end
+    return {"created_at": bounds} if bounds else {}
+
+# Préfixes de curseur des analyses dont `created_at` n'est pas (encore) une date BSON :
+# chaîne ISO d'avant la migration (services/migrations.py) ou valeur absente.
+STRING_CURSOR_PREFIX = "s:"
+NULL_CURSOR_PREFIX = "n:"
+
+def _encode_analysis_cursor(doc: Dict[str, Any]) -> str:
+    created_at = doc.get("created_at")
+    if isinstance(created_at, datetime):
+        return f"{created_at.isoformat()}_{doc['_id']}"
+    if isinstance(created_at, str):
+        return f"{STRING_CURSOR_PREFIX}{created_at}_{doc['_id']}"
+    return f"{NULL_CURSOR_PREFIX}_{doc['_id']}"
+
+def _decode_analysis_cursor(cursor: str) -> Dict[str, Any]:
+    """
+    Condition « après ce document » dans l'ordre (created_at, _id) décroissant. MongoDB
+    classe les dates après les chaînes, elles-mêmes après les valeurs nulles : chaque
+    condition inclut aussi les documents des types suivants dans l'ordre décroissant.
+    """
+    created_at, _, object_id = cursor.rpartition("_")
+    if not ObjectId.is_valid(object_id):
+        raise InvalidCursorError(f"Invalid cursor: {cursor}")
+    object_id = ObjectId(object_id)
+    if created_at == NULL_CURSOR_PREFIX:
+        return {"created_at": None, "_id": {"$lt": object_id}}
+    if created_at.startswith(STRING_CURSOR_PREFIX):
+        created_at = created_at[len(STRING_CURSOR_PREFIX):]
+        lower_types = {"created_at": {"$not": {"$type": ["date", "string"]}}}
+    else:
+        try:
+            created_at = datetime.fromisoformat(created_at)
+        except ValueError:
+            raise InvalidCursorError(f"Invalid cursor: {cursor}")
+        lower_types = {"created_at": {"$not": {"$type": "date"}}}
+    return {"$or": [
+        {"created_at": {"$lt": created_at}},
+        {"created_at": created_at, "_id": {"$lt": object_id}},
+        lower_types,
+    ]}
+
+async def get_analysis_data(start_date: Optional[datetime] = None, end_date: Optional[datetime] = None, limit: Optional[int] = None, cursor: Optional[str] = None) -> Dict[str, Any]:
+    """
+    Analyses de la période [start_date, end_date[ (bornes facultatives), des plus récentes
+    aux plus anciennes. Avec `limit`, les résultats sont paginés par clé sur (created_at, _id),
+    ce qui suit l'index `created_at_id` quelle que soit la profondeur de la page.
+    """
+    query = _created_at_range(start_date, end_date)
+    if cursor:
+        query = {"$and": [query, _decode_analysis_cursor(cursor)]} if query else _decode_analysis_cursor(cursor)
+    kwargs = {"sort": [("created_at", -1), ("_id", -1)]}
+    if limit:
+        limit = max(1, min(limit, ANALYSIS_PAGE_MAX))
+        kwargs["limit"] = limit + 1
+
+    items = await analyses_repository.find(query, ANALYSIS_PROJECTION, **kwargs)
+
+    next_cursor = None
+    if limit and len(items) > limit:
+        items = items[:limit]
+        next_cursor = _encode_analysis_cursor(items[-1])
+    for item in items:
+        item.pop("_id", None)
+    return {"items": items, "next_cursor": next_cursor}
+
+async def get_analysis_buckets(start_date: Optional[datetime] = None, end_date: Optional[datetime] = None, unit: str = "day", timezone: str = "UTC") -> List[dict]:
+    """
+    Nombre d'analyses et scores moyens par jour, semaine ou mois de la période : permet
+    de parcourir plusieurs mois d'historique par tranches sans charger chaque analyse.
+    """
+    return await analyses_repository.aggregate([
+        {"$match": _created_at_range(start_date, end_date) or {"created_at": {"$type": "date"}}},
+        {"$group": {
+            "_id": {"$dateTrunc": {"date": "$created_at", "unit": unit, "timezone": timezone}},
+            "count": {"$sum": 1},
+            "avg_originality_score": {"$avg": "$originality_score"},
+            "avg_matching_score": {"$avg": "$matching_score"},
+            "avg_assistant_influence_score": {"$avg": "$assistant_influence_score"},
+            "avg_duration_minutes": {"$avg": "$time_stats.total_duration_minutes"},
+        }},
+        {"$sort": {"_id": 1}},
+        {"$project": {
+            "_id": 0,
+            "start": "$_id",
+            "count": 1,
+            "avg_originality_score": 1,
+            "avg_matching_score": 1,
+            "avg_assistant_influence_score": 1,
+            "avg_duration_minutes": 1,
+        }},
+    ])
+
+async def delete_analysis_entry(session_id):
     """
     Delete an analysis entry based on session_id from both 'analyses' and 'chats' collections.
     """
-    analysis_result = analysis_collection.delete_one({"session_id": session_id})
-    chat_result = chat_collection.delete_one({"session_id": session_id})
-    deleted = analysis_result.deleted_count > 0 or chat_result.deleted_count > 0
-    return {"deleted": deleted}
+    analysis = await analyses_repository.find_one_and_delete({"session_id": session_id}, projection={"_id": 0})
+    chat = await chats_repository.find_one_and_delete({"session_id": session_id}, projection={"_id": 1, "final_idea": 1})
+    if analysis:
+        await on_analysis_replaced(analysis, None)
+    if chat:
+        await on_chat_changed(deleted=True, was_completed="final_idea" in chat)
+    return {"deleted": analysis is not None or chat is not None}
+
+SESSION_PAGE_MAX = 200
+
+# Champs d'analyse affichés dans la liste des sessions (sans corps de conversation).
+LISTING_ANALYSIS_PROJECTION = {
+    "_id": 0,
+    "created_at": 1,
+    "time_stats.total_messages": 1,
+    "time_stats.total_duration_minutes": 1,
+    "time_stats.user_returned_after_30mins": 1,
+    "originality_score": 1,
+    "matching_score": 1,
+    "matching_analysis": 1,
+}
+
+def _listing_pipeline(limit: int, cursor: Optional[str], status: Optional[str], search: Optional[str]) -> list:
+    match: Dict[str, Any] = {}
+    if cursor:
+        if not ObjectId.is_valid(cursor):
+            raise InvalidCursorError(f"Invalid cursor: {cursor}")
+        match["_id"] = {"$lt": ObjectId(cursor)}
+    if search:
+        match["session_id"] = {"$regex": f"^{re.escape(search)}"}
+    if status in ("analyzed", "completed"):
+        match["final_idea"] = {"$exists": True}
+    elif status == "abandoned":
+        match["final_idea"] = {"$exists": False}
+
+    lookup = {"$lookup": {
+        "from": "analyses",
+        "localField": "session_id",
+        "foreignField": "session_id",
+        "pipeline": [{"$project": LISTING_ANALYSIS_PROJECTION}, {"$limit": 1}],
+        "as": "analysis",
+    }}
+    pipeline = [{"$match": match}, {"$sort": {"_id": -1}}]
+    if status in ("analyzed", "completed"):
+        # Le filtre porte sur l'analyse : la jointure précède la limite.
+        pipeline += [lookup, {"$match": {"analysis": {"$size": 1} if status == "analyzed" else {"$size": 0}}}, {"$limit": limit + 1}]
+    else:
+        pipeline += [{"$limit": limit + 1}, lookup]
+    pipeline.append({"$replaceRoot": {"newRoot": {"$mergeObjects": [
+        {"$arrayElemAt": ["$analysis", 0]},
+        {
+            "_id": "$_id",
+            "session_id": "$session_id",
+            "final_idea": "$final_idea",
+            "message_count": {"$ifNull": ["$stats.total_messages", {"$size": {"$ifNull": ["$conversation_history", []]}}]},
+            "status": {"$cond": [
+                {"$gt": [{"$size": "$analysis"}, 0]}, "analyzed",
+                {"$cond": [{"$ifNull": ["$final_idea", False]}, "completed", "abandoned"]}
+            ]},
+        },
+    ]}}})
+    return pipeline
 
-async def fetch_all_users():
+async def list_sessions(limit: int = 50, cursor: Optional[str] = None, status: Optional[str] = None, search: Optional[str] = None) -> Dict[str, Any]:
     """
-    Récupère toutes les sessions complètes de analysis_collection et les sessions incomplètes de chat_collection.
+    Liste paginée des sessions, des plus récentes aux plus anciennes (pagination par clé
+    sur `_id` : le coût d'une page ne dépend pas de sa position).
+    Les éléments ne contiennent pas l'historique de conversation, à récupérer via
+    fetch_users_by_session_id.
     """
-    analysis_data = list(analysis_collection.find({}, {
-        "_id": 0,
-        "session_id": 1,
-        "final_idea": 1,
-        "time_stats.total_messages": 1,
-        "time_stats.total_duration_minutes": 1,
-        "created_at": 1,
-        "time_stats.user_returned_after_30mins": 1,
-        "originality_score": 1,
-        "matching_score": 1,
-        "matching_analysis": 1
-    }))
-    chat_sessions = list(chat_collection.find({"final_idea": {"$exists": False}}, {"_id": 0, "session_id": 1,"conversation_history": 1,}))
-    all_sessions = analysis_data + chat_sessions  
-    
-    return all_sessions
+    limit = max(1, min(limit, SESSION_PAGE_MAX))
+    items = await chats_repository.aggregate(_listing_pipeline(limit, cursor, status, search))
+    next_cursor = None
+    if len(items) > limit:
+        items = items[:limit]
+        next_cursor = str(items[-1]["_id"])
+    for item in items:
+        item.pop("_id", None)
+    return {"items": items, "next_cursor": next_cursor}
 
 async def fetch_users_by_session_id(session_id: str):
     """
     Recherche une session par son ID :
-    1. Vérifie d'abord dans `analysis_collection`.
-    2. Si elle existe, retourne les détails de `analysis_collection` + les données de `chat_collection` si présentes.
-    3. Si non trouvée, vérifie seulement dans `chat_collection`.
+    1. Vérifie d'abord dans `analyses_repository`.
+    2. Si elle existe, retourne les détails de `analyses_repository` + les données de `chats_repository` si présentes.
+    3. Si non trouvée, vérifie seulement dans `chats_repository`.
     4. Si aucune donnée trouvée, retourne None.
     """
-    analysis_data = analysis_collection.find_one(
+    analysis_data = await analyses_repository.find_one(
         {"session_id": session_id},
         {"_id": 0}  
     )
     if analysis_data:
-        chat_data = chat_collection.find_one(
+        chat_data = await chats_repository.find_one(
             {"session_id": session_id},
             {"_id": 0} 
         )
         if chat_data:
             analysis_data["chat_session"] = chat_data
         return analysis_data
-    chat_data = chat_collection.find_one(
+    chat_data = await chats_repository.find_one(
         {"session_id": session_id},
         {"_id": 0} 
     )
@@ -233,57 +262,23 @@ async def fetch_users_by_session_id(session_id: str):
 
 async def get_config():
     """
-    Fetch the configuration from the database.
+    Fetch the configuration through the versioned config cache.
     If no configuration exists, return None.
     """
-    if config_collection is None:
-        raise ValueError("Database collection is not initialized")
-    config = config_collection.find_one({}, {"_id": 0})  
-    return config if config else None
+    return await cache_config.config_cache.get()
 
 async def update_config(config_data: ConfigModel):
     """
-    Update or insert a new configuration in the database.
+    Update or insert the configuration and bump its version number,
+    which invalidates the config cache of every worker.
     """
-    if config_collection is None:
-        raise ValueError("Database collection is not initialized")
-    existing_config = await get_config() 
-    if existing_config:
-        config_collection.update_one({}, {"$set": config_data.dict()})
-    else:
-        await config_collection.insert_one(config_data.dict())
-    fresh = await get_config()
-    cache_config.config_cache = fresh
+    fresh = await config_repository.find_one_and_update(
+        {},
+        {"$set": config_data.dict(), "$inc": {"version": 1}},
+        projection={"_id": 0},
+        upsert=True,
+        return_document=ReturnDocument.AFTER
+    )
+    cache_config.config_cache.set(fresh)
+    response_cache.invalidate("config")
     return fresh
-
-async def get_chats(ids: List[str]) -> List[dict]:
-    chats = []
-    for session_id in ids:
-        chat_data = chat_collection.find_one(
-            {"session_id": session_id},
-            {"_id": 0}  
-        )
-        if chat_data is not None:
-            chats.append(chat_data)
-    return chats
-
-async def get_analysis(ids: List[str], file_format: Optional[str] = None) -> List[Dict[str, Any]]:
-    """
-    Récupère les documents dans la collection 'analyses' correspondant aux IDs fournis.
-    La variable file_format peut servir à adapter le format de retour.
-    """
-    analyses = []
-    for session_id in ids:
-        analysis_data = analysis_collection.find_one(
-            {"session_id": session_id},
-            {"_id": 0}  
-        )
-        if analysis_data is not None:
-            analyses.append(analysis_data)
-    return analyses
-
-async def get_all(ids: List[str], file_format: Optional[str] = None) -> Dict[str, List[Dict[str, Any]]]:
-    """Combine les données des collections 'chats' et 'analyses'."""
-    chats = await get_chats(ids)
-    analyses = await get_analysis(ids, file_format)
-    return {"chats": chats, "analyses": analyses}
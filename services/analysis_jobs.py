@@ -0,0 +1,272 @@
+import asyncio
+import hashlib
+import json
+import os
+from datetime import datetime, timedelta
+from typing import Optional
+from pymongo import ReturnDocument
+from services.analysis_service import (
+    ANALYSIS_MODEL,
+    compute_time_stats,
+    compute_size_stats,
+    score_final_idea,
+    scores_as_tuple,
+    time_stats_from_running,
+    size_stats_from_running,
+)
+from services.llm_cache import llm_cache, llm_result_key, normalize_conversation, normalize_text
+from utils.prompt_config import ANALYSIS_PROMPT_VERSION
+from services.repository import chats_repository, analyses_repository, analysis_jobs_repository
+from services.rollup_service import on_analysis_replaced
+
+ANALYSIS_WORKERS = int(os.getenv("ANALYSIS_WORKERS", "4"))
+# Au-delà de ce délai sans nouvelles, un job "queued"/"running" est considéré comme
+# abandonné (worker redémarré) et peut être repris.
+ANALYSIS_JOB_STALE_SECONDS = int(os.getenv("ANALYSIS_JOB_STALE_SECONDS", "600"))
+# Intervalle de la recherche des jobs abandonnés, lancée aussi au démarrage (0 : désactivée).
+ANALYSIS_JOB_SWEEP_SECONDS = float(os.getenv("ANALYSIS_JOB_SWEEP_SECONDS", "300"))
+
+def conversation_hash(conversation_history: list, final_idea: str) -> str:
+    """
+    Empreinte du contenu analysé : deux demandes sur la même conversation et la même idée
+    finale produisent la même empreinte.
+    """
+    canonical = json.dumps(
+        {
+            "messages": [[m.get("role"), m.get("content"), m.get("timestamp")] for m in conversation_history],
+            "final_idea": final_idea,
+        },
+        ensure_ascii=False,
+        sort_keys=True,
+    )
+    return hashlib.sha256(canonical.encode("utf-8")).hexdigest()
+
+def make_job_id(session_id: str, content_hash: str) -> str:
+    return hashlib.sha256(f"{session_id}|{content_hash}".encode("utf-8")).hexdigest()[:32]
+
+def analysis_cache_key(conversation_history: list, final_idea: str) -> str:
+    return llm_result_key(
+        "analysis",
+        ANALYSIS_PROMPT_VERSION,
+        ANALYSIS_MODEL,
+        {"conversation": normalize_conversation(conversation_history), "final_idea": normalize_text(final_idea)},
+    )
+
+async def lookup_cached_scores(conversation_history: list, final_idea: str) -> Optional[dict]:
+    return await llm_cache.get(analysis_cache_key(conversation_history, final_idea))
+
+async def score_session(conversation_history: list, final_idea: str, bypass_cache: bool = False,
+                        cached_scores: Optional[dict] = None, cache_checked: bool = False) -> tuple:
+    """
+    Scores LLM de l'idée finale, lus dans le cache de résultats quand la même conversation
+    a déjà été évaluée avec le même prompt et le même modèle. `bypass_cache` force un nouvel
+    appel (dont le résultat remplace celui du cache). Un appelant qui a déjà consulté le
+    cache (`cache_checked`) fournit le résultat lu dans `cached_scores`, pour que chaque
+    demande ne compte qu'une fois dans les statistiques du cache.
+    Un échec du modèle est propagé : aucun score par défaut n'est mis en cache ni
+    enregistré, le job passe en échec.
+    """
+    key = analysis_cache_key(conversation_history, final_idea)
+    if bypass_cache:
+        llm_cache.note_bypass()
+    else:
+        cached = cached_scores if cache_checked else await llm_cache.get(key)
+        if cached is not None:
+            return scores_as_tuple(cached)
+    scores = await asyncio.to_thread(score_final_idea, conversation_history, final_idea)
+    await llm_cache.set(key, scores, "analysis", ANALYSIS_PROMPT_VERSION, ANALYSIS_MODEL)
+    return scores_as_tuple(scores)
+
+async def run_session_analysis(session_doc: dict, bypass_cache: bool = False,
+                               cached_scores: Optional[dict] = None, cache_checked: bool = False) -> dict:
+    """
+    Calcule les statistiques et les scores LLM d'une session et renvoie le document d'analyse
+    (`cached_scores` / `cache_checked` : voir score_session).
+    """
+    conversation_history = session_doc.get("conversation_history", [])
+    final_idea = session_doc.get("final_idea", "")
+
+    # Les agrégats maintenus à l'écriture évitent de retrier et reparser tout l'historique.
+    running_stats = session_doc.get("stats")
+    if running_stats and running_stats.get("total_messages") == len(conversation_history):
+        time_stats = time_stats_from_running(running_stats)
+        size_stats = size_stats_from_running(running_stats)
+    else:
+        time_stats = compute_time_stats(conversation_history)
+        size_stats = compute_size_stats(conversation_history)
+    originality_score, matching_score, matching_analysis, assistant_influence_score = await score_session(
+        conversation_history, final_idea, bypass_cache, cached_scores, cache_checked
+    )
+
+    return {
+        "session_id": session_doc["session_id"],
+        "final_idea": final_idea,
+        "time_stats": time_stats,
+        "size_stats": size_stats,
+        "originality_score": originality_score,
+        "matching_score": matching_score,
+        "assistant_influence_score": assistant_influence_score,
+        "matching_analysis": matching_analysis,
+        "created_at": datetime.utcnow(),
+    }
+
+async def save_analysis(analysis_result: dict):
+    """
+    Enregistre l'analyse d'une session ; une nouvelle analyse remplace la précédente
+    au lieu de créer un doublon. L'image précédente sert à mettre à jour les agrégats
+    du tableau de bord par différence.
+    """
+    previous = await analyses_repository.find_one_and_update(
+        {"session_id": analysis_result["session_id"]},
+        {"$set": analysis_result},
+        projection={"_id": 0},
+        upsert=True,
+        return_document=ReturnDocument.BEFORE
+    )
+    await on_analysis_replaced(previous, {**(previous or {}), **analysis_result})
+    return previous
+
+class AnalysisWorkerPool:
+    """
+    File d'attente des analyses, traitée par un nombre borné de workers asyncio.
+    L'état de chaque job est persisté dans la collection `analysis_jobs`, ce qui permet
+    d'interroger son statut depuis n'importe quel worker HTTP.
+    """
+    def __init__(self, concurrency: int = ANALYSIS_WORKERS, sweep_interval: float = ANALYSIS_JOB_SWEEP_SECONDS):
+        self.concurrency = concurrency
+        self.sweep_interval = sweep_interval
+        self._queue: Optional[asyncio.Queue] = None
+        self._workers = []
+
+    def ensure_started(self):
+        if self._queue is None:
+            self._queue = asyncio.Queue()
+            loop = asyncio.get_running_loop()
+            self._workers = [loop.create_task(self._worker()) for _ in range(self.concurrency)]
+            if self.sweep_interval > 0:
+                self._workers.append(loop.create_task(self._sweep()))
+
+    async def stop(self):
+        for worker in self._workers:
+            worker.cancel()
+        await asyncio.gather(*self._workers, return_exceptions=True)
+        self._workers = []
+        self._queue = None
+
+    async def requeue_stale_jobs(self) -> int:
+        """
+        Remet en file les jobs "queued"/"running" sans nouvelles depuis ANALYSIS_JOB_STALE_SECONDS
+        (worker arrêté ou redémarré avant de les terminer). La mise à jour conditionnelle sur
+        `updated_at` garantit qu'un seul processus reprend chaque job.
+        """
+        self.ensure_started()
+        now = datetime.utcnow()
+        stale_jobs = await analysis_jobs_repository.find(
+            {"status": {"$in": ["queued", "running"]}, "updated_at": {"$lt": now - timedelta(seconds=ANALYSIS_JOB_STALE_SECONDS)}},
+            {"updated_at": 1}
+        )
+        requeued = 0
+        for job in stale_jobs:
+            requeued += await self._requeue(job, now)
+        return requeued
+
+    async def _requeue(self, job: dict, now: datetime, **fields) -> bool:
+        result = await analysis_jobs_repository.update_one(
+            {"_id": job["_id"], "updated_at": job["updated_at"]},
+            {"$set": {"status": "queued", "updated_at": now, "error": None, **fields}}
+        )
+        if not result.modified_count:
+            return False
+        await self._queue.put(job["_id"])
+        return True
+
+    async def _sweep(self):
+        while True:
+            try:
+                requeued = await self.requeue_stale_jobs()
+                if requeued:
+                    print(f"{requeued} job(s) d'analyse abandonné(s) remis en file")
+            except Exception as e:
+                print(f"Erreur lors de la reprise des jobs d'analyse abandonnés : {e}")
+            await asyncio.sleep(self.sweep_interval)
+
+    async def enqueue(self, session_doc: dict, bypass_cache: bool = False) -> dict:
+        """
+        Crée (ou retrouve) le job correspondant à l'état actuel de la session.
+        Une demande répétée sur un contenu inchangé renvoie le job existant, sauf avec
+        `bypass_cache` qui relance l'analyse sans passer par le cache de résultats.
+        """
+        self.ensure_started()
+        session_id = session_doc["session_id"]
+        content_hash = conversation_hash(
+            session_doc.get("conversation_history", []), session_doc.get("final_idea", "")
+        )
+        job_id = make_job_id(session_id, content_hash)
+        now = datetime.utcnow()
+
+        result = await analysis_jobs_repository.update_one(
+            {"_id": job_id},
+            {"$setOnInsert": {
+                "session_id": session_id,
+                "conversation_hash": content_hash,
+                "status": "queued",
+                "bypass_cache": bypass_cache,
+                "created_at": now,
+                "updated_at": now,
+            }},
+            upsert=True
+        )
+        if result.upserted_id is not None:
+            await self._queue.put(job_id)
+            return await get_job(job_id)
+
+        job = await analysis_jobs_repository.find_one({"_id": job_id})
+        stale = job["updated_at"] < now - timedelta(seconds=ANALYSIS_JOB_STALE_SECONDS)
+        rerun = bypass_cache and job["status"] == "done"
+        if job["status"] == "failed" or rerun or (job["status"] in ("queued", "running") and stale):
+            await self._requeue(job, now, bypass_cache=bypass_cache)
+        return await get_job(job_id)
+
+    async def _worker(self):
+        while True:
+            job_id = await self._queue.get()
+            try:
+                await self._run(job_id)
+            except Exception as e:
+                try:
+                    await self._set_status(job_id, "failed", error=str(e))
+                except Exception as status_error:
+                    # MongoDB encore indisponible : le job restera "running" et sera repris
+                    # une fois périmé (ANALYSIS_JOB_STALE_SECONDS) ; le worker continue.
+                    print(f"Impossible de marquer le job {job_id} en échec ({e}) : {status_error}")
+            finally:
+                self._queue.task_done()
+
+    async def _run(self, job_id: str):
+        job = await self._set_status(job_id, "running", started_at=datetime.utcnow())
+        session_doc = await chats_repository.find_one({"session_id": job["session_id"]})
+        if not session_doc:
+            await self._set_status(job_id, "failed", error="Session not found")
+            return
+        analysis_result = await run_session_analysis(session_doc, job.get("bypass_cache", False))
+        await save_analysis(analysis_result)
+        await self._set_status(job_id, "done", finished_at=datetime.utcnow(), result={
+            "originality_score": analysis_result["originality_score"],
+            "matching_score": analysis_result["matching_score"],
+            "assistant_influence_score": analysis_result["assistant_influence_score"],
+        })
+
+    async def _set_status(self, job_id: str, status: str, **fields):
+        return await analysis_jobs_repository.find_one_and_update(
+            {"_id": job_id},
+            {"$set": {"status": status, "updated_at": datetime.utcnow(), **fields}},
+            return_document=ReturnDocument.AFTER
+        )
+
+async def get_job(job_id: str) -> Optional[dict]:
+    job = await analysis_jobs_repository.find_one({"_id": job_id})
+    if job:
+        job["job_id"] = job.pop("_id")
+    return job
+
+analysis_pool = AnalysisWorkerPool()
@@ -1,22 +1,94 @@
 import ast
-from openai import AzureOpenAI
-import os
-from dotenv import load_dotenv
-from datetime import datetime
-from utils.prompt_config import get_analysis_prompt
+from services.llm_gateway import llm_gateway
+from utils.prompt_registry import prompt_registry
 
-load_dotenv()
+from datetime import datetime, timezone
 
-try:
-    client = AzureOpenAI(
-    api_key=os.getenv("API_KEY"),
-    api_version=os.getenv("OPENAI_API_VERSION"),
-    azure_endpoint=os.getenv("API_BASE")
-)
-except Exception as e:
-    raise RuntimeError(f"Erreur lors de l'initialisation du client Azure OpenAI : {e}")
+GAP_THRESHOLD_MS = 30 * 60 * 1000
 
-from datetime import datetime
+def timestamp_to_ms(timestamp: str) -> int:
+    """
+    Convertit un timestamp ISO 8601 en millisecondes depuis l'epoch (UTC si aucun fuseau n'est indiqué).
+    """
+    if timestamp.endswith("Z"):
+        timestamp = timestamp[:-1] + "+00:00"
+    dt = datetime.fromisoformat(timestamp)
+    if dt.tzinfo is None:
+        dt = dt.replace(tzinfo=timezone.utc)
+    return int(dt.timestamp() * 1000)
+
+def update_running_stats(stats, new_messages):
+    """
+    Met à jour les agrégats d'une session avec des messages ajoutés en fin d'historique,
+    sans relire les messages précédents. `stats` vaut None pour une session vide.
+    Les définitions sont celles de compute_time_stats / compute_size_stats.
+    """
+    stats = dict(stats) if stats else {
+        "total_messages": 0,
+        "first_ts_ms": None,
+        "last_ts_ms": None,
+        "last_role": None,
+        "active_ms": 0,
+        "num_gaps_over_30mins": 0,
+        "latency_sum_ms": 0,
+        "latency_count": 0,
+        "user_messages": 0,
+        "user_size_sum": 0,
+        "assistant_messages": 0,
+        "assistant_size_sum": 0,
+    }
+    for msg in new_messages:
+        ts_ms = msg.get("ts_ms")
+        if ts_ms is None:
+            ts_ms = timestamp_to_ms(msg["timestamp"])
+        if stats["last_ts_ms"] is not None:
+            delta = ts_ms - stats["last_ts_ms"]
+            if delta > GAP_THRESHOLD_MS:
+                stats["num_gaps_over_30mins"] += 1
+            else:
+                stats["active_ms"] += delta
+            if stats["last_role"] == "user" and msg["role"] == "assistant":
+                stats["latency_sum_ms"] += delta
+                stats["latency_count"] += 1
+        else:
+            stats["first_ts_ms"] = ts_ms
+
+        size = msg.get("size", len(msg["content"]))
+        if msg["role"] == "user":
+            stats["user_messages"] += 1
+            stats["user_size_sum"] += size
+        elif msg["role"] == "assistant":
+            stats["assistant_messages"] += 1
+            stats["assistant_size_sum"] += size
+
+        stats["total_messages"] += 1
+        stats["last_ts_ms"] = ts_ms
+        stats["last_role"] = msg["role"]
+    return stats
+
+def time_stats_from_running(stats):
+    """
+    Équivalent O(1) de compute_time_stats à partir des agrégats maintenus à l'écriture.
+    """
+    latency_count = stats.get("latency_count", 0)
+    return {
+        "total_messages": stats.get("total_messages", 0),
+        "total_duration_minutes": round(stats.get("active_ms", 0) / 60000.0, 2),
+        "num_gaps_over_30mins": stats.get("num_gaps_over_30mins", 0),
+        "user_returned_after_30mins": stats.get("num_gaps_over_30mins", 0) > 0,
+        "avg_ai_latency_seconds": round(stats.get("latency_sum_ms", 0) / 1000.0 / latency_count, 2) if latency_count else 0.0
+    }
+
+def size_stats_from_running(stats):
+    """
+    Équivalent O(1) de compute_size_stats à partir des agrégats maintenus à l'écriture.
+    """
+    user_messages = stats.get("user_messages", 0)
+    assistant_messages = stats.get("assistant_messages", 0)
+    return {
+        "avg_user_size": stats.get("user_size_sum", 0) / user_messages if user_messages else 0,
+        "avg_ai_size": stats.get("assistant_size_sum", 0) / assistant_messages if assistant_messages else 0
+    }
 
 def compute_time_stats(conversation_history):
     """
@@ -96,37 +168,41 @@ def compute_size_stats(conversation_history):
         "avg_ai_size": avg_ai_size
     }
 
-def analyze_final_idea(conversation_history, final_idea):
-    prompt = get_analysis_prompt(conversation_history, final_idea)
-    try:
-        response = client.chat.completions.create(
-            model="gpt-4o", 
-            messages=[
-                {
-                    "role": "system",
-                    "content": (
-                        "Tu es un expert en évaluation d'idées. "
-                        "Tu dois renvoyer UNIQUEMENT un dictionnaire Python valide."
-                    )
-                },
-                {
-                    "role": "user",
-                    "content": prompt
-                }
-            ],
-            temperature=0.0
-        )
-        raw_response = response.choices[0].message.content
-        parsed = ast.literal_eval(raw_response)
-        originality_score = parsed.get('originality_score', 0)
-        matching_score = parsed.get('matching_score', 0)
-        assistant_influence_score = parsed.get('assistant_influence_score', 0)
-        analysis_details = parsed.get('analysis_details', {})
-
-    except Exception as e:
-        originality_score = 0
-        matching_score = 0
-        assistant_influence_score = 0
-        analysis_details = f"Erreur lors de la récupération du dict Python : {str(e)}"
-
-    return originality_score, matching_score, analysis_details, assistant_influence_score
+ANALYSIS_MODEL = "gpt-4o"
+
+def score_final_idea(conversation_history, final_idea):
+    """
+    Appelle le modèle et renvoie le dictionnaire de scores ; lève une exception si l'appel
+    échoue ou si la réponse n'est pas un dictionnaire Python valide.
+    """
+    prompt = prompt_registry.analysis_prompt(conversation_history, final_idea).text
+    response = llm_gateway.chat(
+        model=ANALYSIS_MODEL,
+        messages=[
+            {
+                "role": "system",
+                "content": (
+                    "Tu es un expert en évaluation d'idées. "
+                    "Tu dois renvoyer UNIQUEMENT un dictionnaire Python valide."
+                )
+            },
+            {
+                "role": "user",
+                "content": prompt
+            }
+        ],
+        temperature=0.0
+    )
+    raw_response = response.choices[0].message.content
+    parsed = ast.literal_eval(raw_response)
+    if not isinstance(parsed, dict):
+        raise ValueError(f"Réponse inattendue du modèle : {raw_response[:200]}")
+    return {
+        "originality_score": parsed.get('originality_score', 0),
+        "matching_score": parsed.get('matching_score', 0),
+        "assistant_influence_score": parsed.get('assistant_influence_score', 0),
+        "analysis_details": parsed.get('analysis_details', {}),
+    }
+
+def scores_as_tuple(scores):
+    return scores["originality_score"], scores["matching_score"], scores["analysis_details"], scores["assistant_influence_score"]
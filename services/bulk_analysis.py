@@ -0,0 +1,196 @@
+import asyncio
+import time
+import uuid
+from datetime import datetime
+from typing import AsyncIterator, Optional
+from pymongo import UpdateOne
+from models.models import BulkAnalyzePayload
+from services.analysis_jobs import lookup_cached_scores, run_session_analysis
+from services.repository import chats_repository, analyses_repository, analysis_jobs_repository
+from services.rollup_service import refresh_rollups
+from services.bulk_lookup import iter_by_session_ids
+from utils.prompt_registry import prompt_registry
+
+# Estimation des tokens de sortie d'une analyse, ajoutée au prompt pour le budget par minute.
+ANALYSIS_OUTPUT_TOKENS_ESTIMATE = 600
+SESSION_PROJECTION = {"_id": 0, "session_id": 1, "conversation_history": 1, "final_idea": 1, "stats": 1}
+# Les documents d'un lot d'IDs sont lus d'un coup : lots réduits pour borner la mémoire.
+SESSION_IDS_CHUNK = 200
+
+class TokenBucket:
+    """
+    Limiteur de débit en tokens par minute : `acquire(n)` attend que la capacité soit disponible.
+    """
+    def __init__(self, tokens_per_minute: int):
+        self.capacity = float(tokens_per_minute)
+        self.rate = tokens_per_minute / 60.0
+        self.tokens = self.capacity
+        self.updated_at = time.monotonic()
+        self._lock = asyncio.Lock()
+
+    async def acquire(self, n: int):
+        n = min(float(n), self.capacity)
+        async with self._lock:
+            while True:
+                now = time.monotonic()
+                self.tokens = min(self.capacity, self.tokens + (now - self.updated_at) * self.rate)
+                self.updated_at = now
+                if self.tokens >= n:
+                    self.tokens -= n
+                    return
+                await asyncio.sleep((n - self.tokens) / self.rate)
+
+def _missing_analysis_pipeline(count_only: bool = False) -> list:
+    pipeline = [
+        {"$match": {"final_idea": {"$exists": True, "$ne": None}}},
+        {"$lookup": {
+            "from": "analyses",
+            "localField": "session_id",
+            "foreignField": "session_id",
+            "pipeline": [{"$project": {"_id": 1}}, {"$limit": 1}],
+            "as": "existing_analysis",
+        }},
+        {"$match": {"existing_analysis": {"$size": 0}}},
+    ]
+    if count_only:
+        return pipeline + [{"$count": "total"}]
+    return pipeline + [{"$project": SESSION_PROJECTION}]
+
+async def count_target_sessions(payload: BulkAnalyzePayload) -> int:
+    if payload.session_ids is not None:
+        return len(set(payload.session_ids))
+    if payload.filter == "missing_analysis":
+        result = await chats_repository.aggregate(_missing_analysis_pipeline(count_only=True))
+        return result[0]["total"] if result else 0
+    return await chats_repository.count_documents({"final_idea": {"$exists": True, "$ne": None}})
+
+async def iter_target_sessions(payload: BulkAnalyzePayload, batch_size: int, missing: Optional[list] = None) -> AsyncIterator[dict]:
+    """
+    Parcourt les sessions ciblées par curseur, sans jamais les charger toutes en mémoire.
+    Les IDs explicitement demandés mais introuvables sont ajoutés à `missing`.
+    """
+    if payload.session_ids is not None:
+        async for doc in iter_by_session_ids(chats_repository, payload.session_ids, SESSION_PROJECTION, SESSION_IDS_CHUNK, missing=missing):
+            yield doc
+    elif payload.filter == "missing_analysis":
+        cursor = await chats_repository.aggregate_cursor(_missing_analysis_pipeline(), batchSize=batch_size)
+        async for doc in cursor:
+            yield doc
+    else:
+        cursor = chats_repository.find_cursor(
+            {"final_idea": {"$exists": True, "$ne": None}}, SESSION_PROJECTION, batch_size=batch_size
+        )
+        async for doc in cursor:
+            yield doc
+
+class BulkAnalysisRunner:
+    """
+    Réanalyse un ensemble de sessions avec un parallélisme borné et, si demandé, un budget
+    de tokens par minute. Les résultats sont écrits par lots (`bulk_write`) et l'avancement
+    est publié dans `analysis_jobs`, consultable via GET /analyze/jobs/{job_id}.
+    """
+    def __init__(self, job_id: str, payload: BulkAnalyzePayload):
+        self.job_id = job_id
+        self.payload = payload
+        self.bucket = TokenBucket(payload.tokens_per_minute) if payload.tokens_per_minute else None
+        self.pending_writes = []
+        self.processed = 0
+        self.failed = 0
+        self.missing = []
+        self.tokens = 0
+        self.cached = 0
+
+    async def run(self):
+        semaphore = asyncio.Semaphore(self.payload.concurrency)
+        tasks = set()
+        try:
+            total = await count_target_sessions(self.payload)
+            await self._update(status="running", total=total, started_at=datetime.utcnow())
+            async for session_doc in iter_target_sessions(self.payload, batch_size=self.payload.concurrency * 4, missing=self.missing):
+                await semaphore.acquire()
+                task = asyncio.create_task(self._analyze(session_doc))
+                task.add_done_callback(lambda _: semaphore.release())
+                tasks.add(task)
+                tasks = {t for t in tasks if not t.done()}
+                if len(self.pending_writes) >= self.payload.batch_size:
+                    await self._flush()
+            await asyncio.gather(*tasks)
+            await self._flush()
+            # Les écritures par lots ne fournissent pas d'image précédente : recalcul complet.
+            await refresh_rollups()
+            await self._update(status="done", finished_at=datetime.utcnow())
+        except Exception as e:
+            for task in tasks:
+                task.cancel()
+            await self._update(status="failed", error=str(e), finished_at=datetime.utcnow())
+
+    async def _analyze(self, session_doc: dict):
+        try:
+            conversation_history = session_doc.get("conversation_history", [])
+            final_idea = session_doc.get("final_idea", "")
+            # Un résultat déjà en cache ne consomme pas de tokens : pas de budget à réserver.
+            # La lecture est faite une seule fois et transmise à l'analyse.
+            cached_scores = None if self.payload.bypass_cache else await lookup_cached_scores(conversation_history, final_idea)
+            cached = cached_scores is not None
+            estimated = 0
+            if not cached:
+                estimated = prompt_registry.analysis_prompt(conversation_history, final_idea).token_count + ANALYSIS_OUTPUT_TOKENS_ESTIMATE
+                if self.bucket:
+                    await self.bucket.acquire(estimated)
+            analysis_result = await run_session_analysis(
+                session_doc, self.payload.bypass_cache, cached_scores, cache_checked=not self.payload.bypass_cache
+            )
+            self.pending_writes.append(UpdateOne(
+                {"session_id": analysis_result["session_id"]},
+                {"$set": analysis_result},
+                upsert=True
+            ))
+            self.tokens += estimated
+            self.cached += int(cached)
+            self.processed += 1
+        except Exception as e:
+            print(f"Échec de l'analyse de la session {session_doc.get('session_id')} : {e}")
+            self.failed += 1
+
+    async def _flush(self):
+        if self.pending_writes:
+            writes, self.pending_writes = self.pending_writes, []
+            await analyses_repository.bulk_write(writes, ordered=False)
+        await self._update()
+
+    async def _update(self, **fields):
+        await analysis_jobs_repository.update_one(
+            {"_id": self.job_id},
+            {"$set": {
+                "processed": self.processed,
+                "failed": self.failed,
+                "missing": len(self.missing),
+                "missing_ids": self.missing[:100],
+                "estimated_tokens": self.tokens,
+                "cached": self.cached,
+                "updated_at": datetime.utcnow(),
+                **fields,
+            }}
+        )
+
+_running_bulk_jobs = set()
+
+async def start_bulk_analysis(payload: BulkAnalyzePayload) -> dict:
+    job_id = uuid.uuid4().hex
+    now = datetime.utcnow()
+    job = {
+        "_id": job_id,
+        "type": "bulk",
+        "status": "queued",
+        "request": payload.dict(exclude={"session_ids"}),
+        "session_ids_count": len(payload.session_ids) if payload.session_ids is not None else None,
+        "processed": 0,
+        "failed": 0,
+        "created_at": now,
+        "updated_at": now,
+    }
+    await analysis_jobs_repository.insert_one(job)
+    task = asyncio.create_task(BulkAnalysisRunner(job_id, payload).run())
+    _running_bulk_jobs.add(task)
+    task.add_done_callback(_running_bulk_jobs.discard)
+    return {"job_id": job_id, "status": "queued"}
@@ -0,0 +1,46 @@
+import os
+from typing import AsyncIterator, Dict, List, Mapping, Optional, Any
+from services.repository import MongoRepository
+
+BULK_LOOKUP_BATCH_SIZE = int(os.getenv("BULK_LOOKUP_BATCH_SIZE", "500"))
+
+def unique_ids(session_ids: List[str]) -> List[str]:
+    """
+    Identifiants sans doublons, dans l'ordre de première apparition.
+    """
+    return list(dict.fromkeys(session_ids))
+
+def _with_session_id(projection: Optional[Mapping[str, Any]]) -> Optional[dict]:
+    # Une projection d'inclusion doit conserver session_id pour pouvoir réordonner les résultats.
+    if projection is None:
+        return None
+    projection = dict(projection)
+    if any(v for k, v in projection.items() if k != "_id") and "session_id" not in projection:
+        projection["session_id"] = 1
+    return projection
+
+async def iter_by_session_ids(
+    repository: MongoRepository,
+    session_ids: List[str],
+    projection: Optional[Mapping[str, Any]] = None,
+    batch_size: int = BULK_LOOKUP_BATCH_SIZE,
+    missing: Optional[List[str]] = None,
+) -> AsyncIterator[dict]:
+    """
+    Parcourt les documents des sessions demandées, dans l'ordre de `session_ids`, à raison
+    d'une requête `$in` par lot de `batch_size` identifiants. Les identifiants introuvables
+    sont ajoutés à `missing` si une liste est fournie.
+    """
+    projection = _with_session_id(projection)
+    ids = unique_ids(session_ids)
+    for start in range(0, len(ids), batch_size):
+        batch = ids[start:start + batch_size]
+        by_id: Dict[str, dict] = {}
+        for doc in await repository.find({"session_id": {"$in": batch}}, projection):
+            by_id.setdefault(doc["session_id"], doc)
+        for session_id in batch:
+            doc = by_id.get(session_id)
+            if doc is not None:
+                yield doc
+            elif missing is not None:
+                missing.append(session_id)
@@ -1,18 +1,23 @@
-import asyncio
+import os
+import time
 from datetime import datetime
+from typing import AsyncIterator
 from zoneinfo import ZoneInfo
 from fastapi import HTTPException
 from fastapi.responses import StreamingResponse
-from llama_index.core.base.llms.types import ChatMessage, MessageRole
-from services.chat_service import get_buffer_for_session, wrapped_client
-from services.saveConversation_service import save_conversation, load_conversation 
-from utils.prompt_config import get_chat_prompt
-from services.mongodb_connection import MongoDBManager
+from services.llm_gateway import llm_gateway
+from services.session_store import session_memory
+from services.context_builder import build_context, CHAT_OUTPUT_TOKEN_RESERVE
+from services.saveConversation_service import save_conversation, load_last_messages, build_message
+from utils.prompt_registry import prompt_registry
 from services.admin_services import get_config 
-from utils import cache_config
 
 CANADA_TZ = ZoneInfo("America/Toronto")
-db_manager = MongoDBManager()
+
+# Politique de regroupement des tokens avant envoi au client.
+# 0 / 0 : chaque token est transmis dès sa réception (comportement par défaut).
+STREAM_FLUSH_MIN_CHARS = int(os.getenv("STREAM_FLUSH_MIN_CHARS", "0"))
+STREAM_FLUSH_INTERVAL_MS = int(os.getenv("STREAM_FLUSH_INTERVAL_MS", "0"))
 
 # if global_config is None:
 #     config_collection = db_manager.get_collection("config")
@@ -44,53 +49,27 @@ db_manager = MongoDBManager()
 # """
 
 async def process_chat_stream(message: str, session_id: str, conversation_history: list) -> StreamingResponse:
-    if cache_config.config_cache is None:
-        cache_config.config_cache = await get_config()
-    genderTone = cache_config.config_cache.get("genderTone")
-    tone = cache_config.config_cache.get("tone")
-    intervalValue = cache_config.config_cache.get("intervalValue")
-
-    print(intervalValue)
-    text_size = cache_config.config_cache.get("textSize")
-
-    SYSTEM_INSTRUCTIONS = get_chat_prompt(tone, genderTone, text_size,intervalValue)
-    print("SYSTEM_INSTRUCTIONS recalculé :", tone, genderTone, text_size, intervalValue)
-    print(SYSTEM_INSTRUCTIONS)
+    config = await get_config()
+    system_prompt = prompt_registry.system_prompt(config)
 
     if not conversation_history:
-        conversation_history = await load_conversation(session_id)
+        conversation_history = await load_last_messages(session_id)
 
-    memory_buffer = get_buffer_for_session(session_id)
+    new_messages = []
+    chat_history = await session_memory.get_messages(session_id)
     if conversation_history and conversation_history[-1]["role"] == "user":
         print("Message déjà présent, on ne l'ajoute pas.")
     else:
         user_timestamp = datetime.now(CANADA_TZ).isoformat()
-        user_message_metadata = {
-            "role": "user",
-            "content": message,
-            "timestamp": user_timestamp,
-            "size": len(message)
-        }
-        conversation_history.append(user_message_metadata)
-        new_message = ChatMessage(
-            role=MessageRole.USER,
-            content=message
-        )
-        memory_buffer.put(new_message)
-    chat_history = memory_buffer.get()
-    messages_to_send = [{"role": "system", "content": SYSTEM_INSTRUCTIONS}]
-    messages_to_send += [{"role": msg.role.value.lower(), "content": msg.content} for msg in chat_history[-10:]]
-    # for msg in chat_history:
-    #     messages_to_send.append({
-    #         "role": msg.role.value.lower(),
-    #         "content": msg.content
-    #     })
+        new_messages.append(build_message(session_id, "user", message, user_timestamp))
+    # Le message utilisateur n'entre en mémoire qu'avec la réponse, une fois celle-ci obtenue.
+    context = build_context(system_prompt, chat_history + new_messages)
 
     try:
-        response = wrapped_client._client.chat.completions.create(
-            model="gpt-4o",
-            messages=messages_to_send,
+        response = await llm_gateway.achat(
+            context.messages,
             temperature=0.3,
+            max_tokens=CHAT_OUTPUT_TOKEN_RESERVE,
             stream=True
         )
     except Exception as e:
@@ -99,35 +78,65 @@ async def process_chat_stream(message: str, session_id: str, conversation_histor
         raise HTTPException(status_code=500, detail=f"Erreur OpenAI: {str(e)}")
     async def generate():
         full_response = ""
-        async for chunk in _iterate_response(response):
+        async for chunk in _coalesce_tokens(_iterate_response(response)):
             full_response += chunk
             yield chunk
         assistant_timestamp = datetime.now(CANADA_TZ).isoformat()
-        assistant_message_metadata = {
-            "role": "assistant",
-            "content": full_response,
-            "timestamp": assistant_timestamp,
-            "size": len(full_response)
-        }
-        conversation_history.append(assistant_message_metadata)
-        assistant_message = ChatMessage(role=MessageRole.ASSISTANT, content=full_response)
-        memory_buffer.put(assistant_message)
-        await save_conversation(session_id, conversation_history)
+        assistant_message = build_message(session_id, "assistant", full_response, assistant_timestamp)
+        new_messages.append(assistant_message)
+        await session_memory.append(session_id, new_messages)
+        await save_conversation(session_id, new_messages)
     
-    return StreamingResponse(generate(), media_type="text/plain")
+    headers = {
+        "X-Context-Tokens": str(context.input_tokens),
+        "X-Context-Messages": str(context.history_messages),
+        "X-Context-Truncated": str(context.truncated).lower(),
+    }
+    return StreamingResponse(generate(), media_type="text/plain", headers=headers)
 
-async def _iterate_response(response) -> asyncio.StreamReader:
+async def _iterate_response(response) -> AsyncIterator[str]:
     """
-    Itère sur les chunks de la réponse de manière asynchrone.
+    Itère sur les chunks du flux asynchrone OpenAI sans bloquer la boucle d'événements.
     """
-    for chunk in response:
+    async for chunk in response:
         try:
             choices = chunk.choices
             if choices and len(choices) > 0:
                 delta = choices[0].delta
                 token = getattr(delta, "content", "")
                 if token:
-                    await asyncio.sleep(0.05)
                     yield token
         except Exception as e:
             continue
+
+async def _coalesce_tokens(
+    tokens: AsyncIterator[str],
+    min_chars: int = None,
+    interval_ms: int = None,
+) -> AsyncIterator[str]:
+    """
+    Regroupe les tokens et les émet dès que `min_chars` caractères sont accumulés
+    ou que `interval_ms` millisecondes se sont écoulées depuis le dernier envoi.
+    Sans politique configurée, les tokens sont transmis tels quels.
+    """
+    min_chars = STREAM_FLUSH_MIN_CHARS if min_chars is None else min_chars
+    interval_ms = STREAM_FLUSH_INTERVAL_MS if interval_ms is None else interval_ms
+    if min_chars <= 0 and interval_ms <= 0:
+        async for token in tokens:
+            yield token
+        return
+
+    buffer = []
+    buffered_chars = 0
+    last_flush = time.monotonic()
+    async for token in tokens:
+        buffer.append(token)
+        buffered_chars += len(token)
+        elapsed_ms = (time.monotonic() - last_flush) * 1000
+        if (min_chars > 0 and buffered_chars >= min_chars) or (interval_ms > 0 and elapsed_ms >= interval_ms):
+            yield "".join(buffer)
+            buffer = []
+            buffered_chars = 0
+            last_flush = time.monotonic()
+    if buffer:
+        yield "".join(buffer)
@@ -0,0 +1,74 @@
+import os
+from dataclasses import dataclass
+from typing import List, Optional
+from dotenv import load_dotenv
+from utils.prompt_registry import CompiledPrompt
+from utils.tokens import count_tokens, truncate_tokens
+
+load_dotenv()
+
+CHAT_CONTEXT_WINDOW = int(os.getenv("CHAT_CONTEXT_WINDOW", "128000"))
+CHAT_INPUT_TOKEN_BUDGET = int(os.getenv("CHAT_INPUT_TOKEN_BUDGET", "8000"))
+CHAT_OUTPUT_TOKEN_RESERVE = int(os.getenv("CHAT_OUTPUT_TOKEN_RESERVE", "4096"))
+
+# Tokens de structure ajoutés par le format chat pour chaque message,
+# et pour amorcer la réponse de l'assistant.
+MESSAGE_TOKEN_OVERHEAD = 4
+REPLY_PRIMING_TOKENS = 3
+
+@dataclass
+class ContextWindow:
+    messages: List[dict]
+    input_tokens: int
+    history_messages: int
+    truncated: bool = False
+    dropped_messages: int = 0
+    budget: int = 0
+
+def build_context(
+    system_prompt: CompiledPrompt,
+    history: List[dict],
+    input_budget: Optional[int] = None,
+    output_reserve: Optional[int] = None,
+) -> ContextWindow:
+    """
+    Construit la liste de messages envoyée au modèle sans dépasser le budget de tokens d'entrée.
+    - Le budget effectif est min(`input_budget`, fenêtre de contexte - `output_reserve`).
+    - L'historique est parcouru du plus récent au plus ancien ; on s'arrête au premier
+      message qui ne tient plus, pour ne jamais créer de trou dans la conversation.
+    - Le coût d'un message est le champ `tokens` calculé à sa création (build_message) ;
+      il n'est recompté que s'il est absent.
+    - Si le message le plus récent dépasse à lui seul le budget restant, il est tronqué
+      à ses premiers tokens (troncature déterministe) plutôt qu'omis.
+    """
+    input_budget = CHAT_INPUT_TOKEN_BUDGET if input_budget is None else input_budget
+    output_reserve = CHAT_OUTPUT_TOKEN_RESERVE if output_reserve is None else output_reserve
+    budget = min(input_budget, CHAT_CONTEXT_WINDOW - output_reserve)
+
+    used = system_prompt.token_count + MESSAGE_TOKEN_OVERHEAD + REPLY_PRIMING_TOKENS
+    selected = []
+    truncated = False
+    for msg in reversed(history):
+        tokens = msg.get("tokens")
+        cost = (count_tokens(msg["content"]) if tokens is None else tokens) + MESSAGE_TOKEN_OVERHEAD
+        if used + cost <= budget:
+            selected.append({"role": msg["role"], "content": msg["content"]})
+            used += cost
+            continue
+        if not selected:
+            remaining = max(budget - used - MESSAGE_TOKEN_OVERHEAD, 0)
+            content = truncate_tokens(msg["content"], remaining)
+            selected.append({"role": msg["role"], "content": content})
+            used += count_tokens(content) + MESSAGE_TOKEN_OVERHEAD
+            truncated = True
+        break
+    selected.reverse()
+
+    return ContextWindow(
+        messages=[{"role": "system", "content": system_prompt.text}] + selected,
+        input_tokens=used,
+        history_messages=len(selected),
+        truncated=truncated,
+        dropped_messages=len(history) - len(selected),
+        budget=budget,
+    )
@@ -0,0 +1,291 @@
+import csv
+import importlib.util
+import io
+import json
+import zlib
+from datetime import datetime
+from typing import AsyncIterator, Dict, Iterable, List, Optional, Tuple
+from services.bulk_lookup import iter_by_session_ids
+from services.repository import chats_repository, analyses_repository
+
+# pyarrow n'est importé qu'au premier export Parquet (import coûteux au démarrage).
+PYARROW_AVAILABLE = importlib.util.find_spec("pyarrow") is not None
+
+EXPORT_FORMATS = ("json", "ndjson", "csv", "parquet")
+EXPORT_BATCH_SIZE = 500
+# Nombre de lignes regroupées par écriture CSV / row group Parquet.
+EXPORT_ROWS_PER_CHUNK = 1000
+# Taille visée des morceaux JSON / NDJSON envoyés au client.
+EXPORT_FLUSH_CHARS = 64 * 1024
+
+MEDIA_TYPES = {
+    "json": "application/json",
+    "ndjson": "application/x-ndjson",
+    "csv": "text/csv; charset=utf-8",
+    "parquet": "application/vnd.apache.parquet",
+}
+
+# Schéma fixe des exports tabulaires : (colonne, type Arrow).
+ANALYSIS_COLUMNS = [
+    ("session_id", "string"),
+    ("final_idea", "string"),
+    ("created_at", "string"),
+    ("originality_score", "float64"),
+    ("matching_score", "float64"),
+    ("assistant_influence_score", "float64"),
+    ("matching_analysis", "string"),
+    ("time_stats.total_messages", "int64"),
+    ("time_stats.total_duration_minutes", "float64"),
+    ("time_stats.num_gaps_over_30mins", "int64"),
+    ("time_stats.user_returned_after_30mins", "bool"),
+    ("time_stats.avg_ai_latency_seconds", "float64"),
+    ("size_stats.avg_user_size", "float64"),
+    ("size_stats.avg_ai_size", "float64"),
+]
+# Une conversation s'exporte à raison d'une ligne par message.
+CHAT_COLUMNS = [
+    ("session_id", "string"),
+    ("final_idea", "string"),
+    ("message_index", "int64"),
+    ("role", "string"),
+    ("content", "string"),
+    ("timestamp", "string"),
+]
+
+class ExportFormatError(ValueError):
+    pass
+
+def _default(value):
+    if isinstance(value, datetime):
+        return value.isoformat()
+    return str(value)
+
+def _dumps(doc) -> str:
+    return json.dumps(doc, ensure_ascii=False, default=_default)
+
+def _get_path(doc: dict, path: str):
+    for key in path.split("."):
+        if not isinstance(doc, dict):
+            return None
+        doc = doc.get(key)
+    return doc
+
+def _cell(value, kind: str):
+    if value is None:
+        return None
+    try:
+        if kind == "string":
+            if isinstance(value, (dict, list)):
+                return _dumps(value)
+            return _default(value) if not isinstance(value, str) else value
+        if kind == "float64":
+            return float(value)
+        if kind == "int64":
+            return int(value)
+        if kind == "bool":
+            return bool(value)
+    except (TypeError, ValueError):
+        return None
+    return value
+
+def analysis_rows(doc: dict) -> Iterable[list]:
+    yield [_cell(_get_path(doc, name), kind) for name, kind in ANALYSIS_COLUMNS]
+
+def chat_rows(doc: dict) -> Iterable[list]:
+    for index, message in enumerate(doc.get("conversation_history") or []):
+        yield [
+            _cell(doc.get("session_id"), "string"),
+            _cell(doc.get("final_idea"), "string"),
+            index,
+            _cell(message.get("role"), "string"),
+            _cell(message.get("content"), "string"),
+            _cell(message.get("timestamp"), "string"),
+        ]
+
+TABLES = {
+    "chats": (CHAT_COLUMNS, chat_rows),
+    "analyses": (ANALYSIS_COLUMNS, analysis_rows),
+}
+
+def collection_repository(collection: str):
+    return chats_repository if collection == "chats" else analyses_repository
+
+def iter_documents(collection: str, ids: List[str], missing: Optional[List[str]] = None) -> AsyncIterator[dict]:
+    """
+    Documents des sessions demandées, dans l'ordre des IDs, lus par lots de EXPORT_BATCH_SIZE.
+    Les IDs introuvables sont ajoutés à `missing` au fil de la lecture.
+    """
+    return iter_by_session_ids(collection_repository(collection), ids, {"_id": 0}, batch_size=EXPORT_BATCH_SIZE, missing=missing)
+
+async def peek(documents: AsyncIterator[dict]) -> Tuple[Optional[dict], AsyncIterator[dict]]:
+    """
+    Lit le premier document sans le perdre : permet de répondre 400 avant d'ouvrir le flux.
+    """
+    first = await anext(documents, None)
+
+    async def chained():
+        if first is not None:
+            yield first
+            async for doc in documents:
+                yield doc
+
+    return first, chained()
+
+async def _json_array(documents: AsyncIterator[dict]) -> AsyncIterator[str]:
+    yield "["
+    separator = ""
+    async for doc in documents:
+        yield separator + _dumps(doc)
+        separator = ","
+    yield "]"
+
+async def _ndjson(documents: AsyncIterator[dict], collection: Optional[str] = None) -> AsyncIterator[str]:
+    async for doc in documents:
+        yield _dumps({"collection": collection, **doc} if collection else doc) + "\n"
+
+async def _csv(documents: AsyncIterator[dict], table: str) -> AsyncIterator[str]:
+    columns, to_rows = TABLES[table]
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow([name for name, _ in columns])
+    pending = 0
+    async for doc in documents:
+        for row in to_rows(doc):
+            writer.writerow(row)
+            pending += 1
+        if pending >= EXPORT_ROWS_PER_CHUNK:
+            yield buffer.getvalue()
+            buffer.seek(0)
+            buffer.truncate()
+            pending = 0
+    yield buffer.getvalue()
+
+class _ChunkSink(io.RawIOBase):
+    """
+    Fichier en écriture seule dont le contenu est vidé au fil de l'eau vers la réponse.
+    """
+    def __init__(self):
+        self.chunks: List[bytes] = []
+        self.position = 0
+
+    def writable(self):
+        return True
+
+    def write(self, data):
+        data = bytes(data)
+        self.chunks.append(data)
+        self.position += len(data)
+        return len(data)
+
+    def tell(self):
+        return self.position
+
+    def drain(self) -> bytes:
+        data, self.chunks = b"".join(self.chunks), []
+        return data
+
+async def _parquet(documents: AsyncIterator[dict], table: str) -> AsyncIterator[bytes]:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+
+    columns, to_rows = TABLES[table]
+    schema = pa.schema([(name, getattr(pa, kind if kind != "bool" else "bool_")()) for name, kind in columns])
+    sink = _ChunkSink()
+    writer = pq.ParquetWriter(sink, schema, compression="snappy")
+
+    def write_row_group(rows):
+        writer.write_table(pa.Table.from_arrays(
+            [pa.array([row[i] for row in rows], type=schema.field(i).type) for i in range(len(columns))],
+            schema=schema
+        ))
+
+    rows = []
+    async for doc in documents:
+        rows.extend(to_rows(doc))
+        if len(rows) >= EXPORT_ROWS_PER_CHUNK:
+            write_row_group(rows)
+            rows = []
+            yield sink.drain()
+    if rows:
+        write_row_group(rows)
+    writer.close()
+    yield sink.drain()
+
+async def _buffered(chunks: AsyncIterator[str]) -> AsyncIterator[str]:
+    """
+    Regroupe les petits morceaux texte ; le premier part immédiatement.
+    """
+    pending, size, first = [], 0, True
+    async for chunk in chunks:
+        pending.append(chunk)
+        size += len(chunk)
+        if first or size >= EXPORT_FLUSH_CHARS:
+            yield "".join(pending)
+            pending, size, first = [], 0, False
+    if pending:
+        yield "".join(pending)
+
+async def _gzip(chunks: AsyncIterator) -> AsyncIterator[bytes]:
+    compressor = zlib.compressobj(wbits=31)
+    first = True
+    async for chunk in chunks:
+        data = compressor.compress(chunk.encode("utf-8") if isinstance(chunk, str) else chunk)
+        if first:
+            # Le premier morceau est vidé tout de suite pour que le client reçoive des octets sans attendre.
+            data += compressor.flush(zlib.Z_SYNC_FLUSH)
+            first = False
+        if data:
+            yield data
+    yield compressor.flush()
+
+def check_format(file_format: Optional[str], table: Optional[str] = None) -> str:
+    file_format = (file_format or "json").lower()
+    if file_format not in EXPORT_FORMATS:
+        raise ExportFormatError(f"Unsupported format '{file_format}', expected one of {', '.join(EXPORT_FORMATS)}")
+    if file_format in ("csv", "parquet") and table is None:
+        raise ExportFormatError(f"Format '{file_format}' exports a single table: use /download/chats or /download/analysis")
+    if file_format == "parquet" and not PYARROW_AVAILABLE:
+        raise ExportFormatError("Parquet export requires pyarrow, which is not installed")
+    return file_format
+
+def encode(documents: AsyncIterator[dict], file_format: str, table: str, gzip: bool = False) -> AsyncIterator:
+    """
+    Sérialise un flux de documents d'une collection au format demandé, morceau par morceau.
+    """
+    if file_format == "ndjson":
+        chunks = _ndjson(documents)
+    elif file_format == "csv":
+        chunks = _csv(documents, table)
+    elif file_format == "parquet":
+        chunks = _parquet(documents, table)
+    else:
+        chunks = _json_array(documents)
+    if file_format in ("json", "ndjson"):
+        chunks = _buffered(chunks)
+    return _gzip(chunks) if gzip else chunks
+
+async def _combined_json(streams: Dict[str, AsyncIterator[dict]]) -> AsyncIterator[str]:
+    yield "{"
+    for i, (name, documents) in enumerate(streams.items()):
+        yield ("," if i else "") + _dumps(name) + ":"
+        async for chunk in _json_array(documents):
+            yield chunk
+    yield "}"
+
+async def _combined_ndjson(streams: Dict[str, AsyncIterator[dict]]) -> AsyncIterator[str]:
+    for name, documents in streams.items():
+        async for line in _ndjson(documents, collection=name):
+            yield line
+
+def encode_combined(streams: Dict[str, AsyncIterator[dict]], file_format: str, gzip: bool = False) -> AsyncIterator:
+    """
+    Export de plusieurs collections : un objet {"chats": [...], "analyses": [...]} en JSON,
+    ou une ligne par document portant sa collection en NDJSON.
+    """
+    chunks = _buffered(_combined_ndjson(streams) if file_format == "ndjson" else _combined_json(streams))
+    return _gzip(chunks) if gzip else chunks
+
+def response_headers(basename: str, file_format: str, gzip: bool = False) -> Tuple[str, Dict[str, str]]:
+    extension = file_format + (".gz" if gzip else "")
+    media_type = "application/gzip" if gzip else MEDIA_TYPES[file_format]
+    return media_type, {"Content-Disposition": f'attachment; filename="{basename}.{extension}"'}
@@ -0,0 +1,183 @@
+import argparse
+import asyncio
+import json
+import os
+from dataclasses import dataclass
+from datetime import datetime
+from typing import Any, Dict, List, Optional
+from pymongo import ASCENDING, DESCENDING, IndexModel
+from pymongo.errors import OperationFailure, ServerSelectionTimeoutError
+from services.repository import async_mongo_manager
+from services.llm_cache import LLM_CACHE_TTL_SECONDS
+
+ENSURE_INDEXES_ON_STARTUP = os.getenv("MONGO_ENSURE_INDEXES", "true").lower() == "true"
+
+# Registre déclaratif des index : collection -> index attendus.
+INDEXES: Dict[str, List[IndexModel]] = {
+    "chats": [
+        IndexModel([("session_id", ASCENDING)], unique=True, name="session_id_unique"),
+        # Sessions terminées, des plus récentes aux plus anciennes (liste paginée, agrégats).
+        IndexModel(
+            [("_id", DESCENDING)],
+            partialFilterExpression={"final_idea": {"$exists": True}},
+            name="completed_sessions",
+        ),
+    ],
+    "analyses": [
+        IndexModel([("session_id", ASCENDING)], unique=True, name="session_id_unique"),
+        # Filtres par période et pagination (created_at, _id) de /analysis.
+        IndexModel([("created_at", DESCENDING), ("_id", DESCENDING)], name="created_at_id"),
+    ],
+    "llm_cache": [
+        IndexModel([("created_at", ASCENDING)], expireAfterSeconds=LLM_CACHE_TTL_SECONDS, name="created_at_ttl"),
+    ],
+    "analysis_jobs": [
+        IndexModel([("type", ASCENDING), ("created_at", DESCENDING)], name="type_created_at"),
+    ],
+}
+
+async def ensure_indexes(db=None) -> Dict[str, List[str]]:
+    """
+    Crée les index du registre s'ils n'existent pas (opération idempotente).
+    Chaque index est créé séparément : un index impossible à construire (doublons, options
+    en conflit) est signalé sans empêcher la création des autres ni le démarrage.
+    Aucun document n'est supprimé ici : les doublons d'analyses se retirent par l'étape
+    explicite `python -m services.migrations --dedupe`, avant de relancer la création.
+    """
+    db = db if db is not None else async_mongo_manager.db
+    created = {}
+    for collection, indexes in INDEXES.items():
+        created[collection] = []
+        for index in indexes:
+            name = index.document["name"]
+            try:
+                created[collection] += await db[collection].create_indexes([index])
+            except ServerSelectionTimeoutError as e:
+                print(f"MongoDB injoignable, index non vérifiés : {e}")
+                return created
+            except OperationFailure as e:
+                if e.code == 11000:
+                    print(f"Index unique '{name}' impossible sur '{collection}' (doublons : `python -m services.indexes --duplicates`, `python -m services.migrations --dedupe` pour les analyses) : {e}")
+                else:
+                    print(f"Erreur lors de la création de l'index '{name}' de '{collection}' : {e}")
+    return created
+
+async def find_duplicate_session_ids(db=None, limit: int = 20) -> Dict[str, List[dict]]:
+    db = db if db is not None else async_mongo_manager.db
+    duplicates = {}
+    for collection in ("chats", "analyses"):
+        cursor = await db[collection].aggregate([
+            {"$group": {"_id": "$session_id", "count": {"$sum": 1}}},
+            {"$match": {"count": {"$gt": 1}}},
+            {"$limit": limit},
+        ], allowDiskUse=True)
+        duplicates[collection] = await cursor.to_list()
+    return duplicates
+
+@dataclass
+class QueryCheck:
+    """
+    Requête d'un service, rejouée avec `explain` pour vérifier qu'elle utilise un index.
+    `command` est la commande MongoDB (find, count, aggregate) telle que l'envoie le service.
+    """
+    name: str
+    command: Dict[str, Any]
+    # Lecture complète assumée (ex. toutes les idées finales pour les thèmes).
+    allow_collscan: bool = False
+
+SAMPLE_SESSION_ID = "explain-sample-session"
+
+QUERY_CHECKS = [
+    QueryCheck("chats by session_id", {"find": "chats", "filter": {"session_id": SAMPLE_SESSION_ID}, "limit": 1}),
+    QueryCheck("analyses by session_id", {"find": "analyses", "filter": {"session_id": SAMPLE_SESSION_ID}, "limit": 1}),
+    QueryCheck("bulk lookup chats", {"find": "chats", "filter": {"session_id": {"$in": [SAMPLE_SESSION_ID, "other"]}}}),
+    QueryCheck("bulk lookup analyses", {"find": "analyses", "filter": {"session_id": {"$in": [SAMPLE_SESSION_ID, "other"]}}}),
+    # Recalcul périodique des agrégats du tableau de bord : parcours complet assumé.
+    QueryCheck("completed sessions count", {"count": "chats", "query": {"final_idea": {"$exists": True}}}, allow_collscan=True),
+    QueryCheck("session listing page", {"find": "chats", "filter": {}, "sort": {"_id": -1}, "limit": 51}),
+    QueryCheck(
+        "completed sessions listing page",
+        {"find": "chats", "filter": {"final_idea": {"$exists": True}}, "sort": {"_id": -1}, "limit": 51},
+    ),
+    QueryCheck("session id prefix search", {"find": "chats", "filter": {"session_id": {"$regex": "^abc"}}, "sort": {"_id": -1}, "limit": 51}),
+    QueryCheck(
+        "analyses by created_at range",
+        {"find": "analyses", "filter": {"created_at": {"$gte": datetime(2025, 1, 1)}}, "sort": {"created_at": -1, "_id": -1}, "limit": 501},
+    ),
+    QueryCheck(
+        "analyses time buckets",
+        {"aggregate": "analyses", "pipeline": [
+            {"$match": {"created_at": {"$gte": datetime(2025, 1, 1), "$lt": datetime(2025, 4, 1)}}},
+            {"$group": {"_id": {"$dateTrunc": {"date": "$created_at", "unit": "day"}}, "count": {"$sum": 1}}},
+        ], "cursor": {}},
+    ),
+    QueryCheck(
+        "final ideas for themes",
+        {"find": "analyses", "filter": {"final_idea": {"$exists": True, "$ne": None}}, "projection": {"final_idea": 1}},
+        allow_collscan=True,
+    ),
+]
+
+def _winning_stages(plan: Any) -> List[str]:
+    """
+    Étapes des plans retenus, quelle que soit la forme de la sortie d'explain.
+    """
+    stages = []
+    if isinstance(plan, dict):
+        for key, value in plan.items():
+            if key in ("winningPlan", "queryPlan"):
+                stages.extend(_collect_stages(value))
+            else:
+                stages.extend(_winning_stages(value))
+    elif isinstance(plan, list):
+        for item in plan:
+            stages.extend(_winning_stages(item))
+    return stages
+
+def _collect_stages(plan: Any) -> List[str]:
+    stages = []
+    if isinstance(plan, dict):
+        if "stage" in plan:
+            stages.append(plan["stage"])
+        for value in plan.values():
+            stages.extend(_collect_stages(value))
+    elif isinstance(plan, list):
+        for item in plan:
+            stages.extend(_collect_stages(item))
+    return stages
+
+async def explain_queries(db=None, checks: Optional[List[QueryCheck]] = None) -> List[dict]:
+    """
+    Rejoue chaque requête avec `explain` et signale les parcours complets de collection (COLLSCAN).
+    """
+    db = db if db is not None else async_mongo_manager.db
+    report = []
+    for check in checks or QUERY_CHECKS:
+        try:
+            explained = await db.command("explain", check.command, verbosity="queryPlanner")
+            stages = _winning_stages(explained)
+            collscan = "COLLSCAN" in stages
+            status = "ok" if not collscan or check.allow_collscan else "COLLSCAN"
+        except OperationFailure as e:
+            stages, status = [], f"error: {e}"
+        report.append({"query": check.name, "status": status, "stages": stages})
+    return report
+
+async def _main(args):
+    if args.apply:
+        print(json.dumps(await ensure_indexes(), indent=2))
+    if args.duplicates:
+        print(json.dumps(await find_duplicate_session_ids(), indent=2, default=str))
+    if args.explain or not (args.apply or args.duplicates):
+        report = await explain_queries()
+        for line in report:
+            print(f"{line['status']:>10}  {line['query']}  ({' > '.join(line['stages'])})")
+        if any(line["status"] == "COLLSCAN" for line in report):
+            raise SystemExit(1)
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Index MongoDB : création et vérification des plans de requête.")
+    parser.add_argument("--apply", action="store_true", help="crée les index du registre")
+    parser.add_argument("--duplicates", action="store_true", help="liste les session_id en double")
+    parser.add_argument("--explain", action="store_true", help="vérifie les plans des requêtes (par défaut)")
+    asyncio.run(_main(parser.parse_args()))
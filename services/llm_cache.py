@@ -0,0 +1,118 @@
+import copy
+import hashlib
+import json
+import os
+from collections import OrderedDict
+from datetime import datetime
+from typing import Any, List, Optional
+from services.repository import MongoRepository
+
+LLM_CACHE_MEMORY_ENTRIES = int(os.getenv("LLM_CACHE_MEMORY_ENTRIES", "2048"))
+# Durée de conservation des résultats en base (index TTL sur created_at).
+LLM_CACHE_TTL_SECONDS = int(os.getenv("LLM_CACHE_TTL_SECONDS", str(90 * 24 * 3600)))
+
+llm_cache_repository = MongoRepository("llm_cache")
+
+def normalize_text(text: Optional[str]) -> str:
+    return " ".join((text or "").split())
+
+def normalize_conversation(conversation_history: List[dict]) -> List[List[str]]:
+    """
+    Rôle et contenu de chaque message, espaces normalisés : seuls les éléments repris
+    dans le prompt entrent dans la clé (pas les horodatages ni les identifiants).
+    """
+    return [[m.get("role") or "", normalize_text(m.get("content"))] for m in conversation_history]
+
+def llm_result_key(kind: str, prompt_version: str, model: str, payload: Any) -> str:
+    """
+    Clé d'adressage par contenu : même prompt, même modèle, même entrée -> même clé.
+    """
+    canonical = json.dumps(
+        {"kind": kind, "prompt_version": prompt_version, "model": model, "payload": payload},
+        ensure_ascii=False,
+        sort_keys=True,
+        separators=(",", ":"),
+    )
+    return hashlib.sha256(canonical.encode("utf-8")).hexdigest()
+
+class LLMResultCache:
+    """
+    Cache des réponses du modèle pour les appels déterministes (temperature=0).
+    - Premier niveau : LRU en mémoire, borné à `max_entries` résultats.
+    - Second niveau : collection `llm_cache`, partagée par les workers et conservée
+      LLM_CACHE_TTL_SECONDS.
+    Une erreur du cache n'interrompt jamais l'appel : elle est traitée comme un défaut.
+    Seuls les résultats valides doivent y être écrits (jamais les erreurs du modèle).
+    """
+    def __init__(self, repository: MongoRepository = llm_cache_repository, max_entries: int = LLM_CACHE_MEMORY_ENTRIES):
+        self.repository = repository
+        self.max_entries = max_entries
+        self._memory: "OrderedDict[str, Any]" = OrderedDict()
+        self.memory_hits = 0
+        self.store_hits = 0
+        self.misses = 0
+        self.writes = 0
+        self.bypassed = 0
+        self.errors = 0
+
+    def _remember(self, key: str, result: Any):
+        self._memory[key] = result
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.max_entries:
+            self._memory.popitem(last=False)
+
+    async def get(self, key: str) -> Optional[Any]:
+        if key in self._memory:
+            self._memory.move_to_end(key)
+            self.memory_hits += 1
+            return copy.deepcopy(self._memory[key])
+        try:
+            doc = await self.repository.find_one({"_id": key}, {"result": 1})
+        except Exception as e:
+            print(f"Lecture du cache LLM impossible : {e}")
+            self.errors += 1
+            doc = None
+        if doc is None:
+            self.misses += 1
+            return None
+        self.store_hits += 1
+        self._remember(key, doc["result"])
+        return copy.deepcopy(doc["result"])
+
+    async def set(self, key: str, result: Any, kind: str, prompt_version: str, model: str):
+        self._remember(key, copy.deepcopy(result))
+        try:
+            await self.repository.update_one(
+                {"_id": key},
+                {"$set": {
+                    "kind": kind,
+                    "prompt_version": prompt_version,
+                    "model": model,
+                    "result": result,
+                    "created_at": datetime.utcnow(),
+                }},
+                upsert=True
+            )
+            self.writes += 1
+        except Exception as e:
+            print(f"Écriture du cache LLM impossible : {e}")
+            self.errors += 1
+
+    def note_bypass(self):
+        self.bypassed += 1
+
+    def stats(self) -> dict:
+        lookups = self.memory_hits + self.store_hits + self.misses
+        return {
+            "memory_entries": len(self._memory),
+            "max_memory_entries": self.max_entries,
+            "memory_hits": self.memory_hits,
+            "store_hits": self.store_hits,
+            "misses": self.misses,
+            "hit_ratio": round((self.memory_hits + self.store_hits) / lookups, 4) if lookups else None,
+            "writes": self.writes,
+            "bypassed": self.bypassed,
+            "errors": self.errors,
+        }
+
+llm_cache = LLMResultCache()
@@ -0,0 +1,256 @@
+import asyncio
+import os
+import random
+import threading
+import time
+from email.utils import parsedate_to_datetime
+from typing import Any, List, Optional
+from dotenv import load_dotenv
+
+load_dotenv()
+
+DEFAULT_MODEL = os.getenv("LLM_MODEL", "gpt-4o")
+
+# Délais par défaut d'un appel ; chaque appel peut fournir son propre `timeout` (secondes).
+LLM_TIMEOUT_SECONDS = float(os.getenv("LLM_TIMEOUT_SECONDS", "60"))
+LLM_CONNECT_TIMEOUT_SECONDS = float(os.getenv("LLM_CONNECT_TIMEOUT_SECONDS", "5"))
+
+# Pool de connexions partagé : les rafales réutilisent des connexions TLS déjà ouvertes.
+LLM_MAX_CONNECTIONS = int(os.getenv("LLM_MAX_CONNECTIONS", "100"))
+LLM_MAX_KEEPALIVE_CONNECTIONS = int(os.getenv("LLM_MAX_KEEPALIVE_CONNECTIONS", "20"))
+LLM_KEEPALIVE_EXPIRY_SECONDS = float(os.getenv("LLM_KEEPALIVE_EXPIRY_SECONDS", "60"))
+
+# Nouvelles tentatives sur 429, 5xx et erreurs réseau, avec backoff exponentiel « full jitter ».
+LLM_MAX_RETRIES = int(os.getenv("LLM_MAX_RETRIES", "4"))
+LLM_BACKOFF_BASE_SECONDS = float(os.getenv("LLM_BACKOFF_BASE_SECONDS", "0.5"))
+LLM_BACKOFF_MAX_SECONDS = float(os.getenv("LLM_BACKOFF_MAX_SECONDS", "20"))
+LLM_WARMUP_TIMEOUT_SECONDS = float(os.getenv("LLM_WARMUP_TIMEOUT_SECONDS", "10"))
+# Un Retry-After plus long que ce délai n'est pas attendu : l'erreur est renvoyée à l'appelant.
+LLM_RETRY_AFTER_MAX_SECONDS = float(os.getenv("LLM_RETRY_AFTER_MAX_SECONDS", "60"))
+# Durée totale d'un appel, tentatives et attentes comprises : au-delà, l'erreur est renvoyée.
+LLM_RETRY_DEADLINE_SECONDS = float(os.getenv("LLM_RETRY_DEADLINE_SECONDS", "120"))
+
+def _retry_after(error: Exception) -> Optional[float]:
+    """
+    Délai demandé par le serveur (en-têtes retry-after-ms ou retry-after, en secondes ou date HTTP).
+    """
+    response = getattr(error, "response", None)
+    if response is None:
+        return None
+    headers = response.headers
+    try:
+        if "retry-after-ms" in headers:
+            return float(headers["retry-after-ms"]) / 1000.0
+        value = headers.get("retry-after")
+        if value is None:
+            return None
+        try:
+            return float(value)
+        except ValueError:
+            return max(0.0, parsedate_to_datetime(value).timestamp() - time.time())
+    except (TypeError, ValueError):
+        return None
+
+def _is_retryable(error: Exception, retry_timeouts: bool = True) -> bool:
+    import openai
+
+    if isinstance(error, openai.APITimeoutError):
+        # Sous-classe d'APIConnectionError : un délai dépassé n'est retenté que sur demande.
+        return retry_timeouts
+    if isinstance(error, (openai.RateLimitError, openai.InternalServerError, openai.APIConnectionError)):
+        return True
+    return isinstance(error, openai.APIStatusError) and error.status_code >= 500
+
+def backoff_delay(attempt: int, error: Optional[Exception] = None) -> float:
+    retry_after = _retry_after(error) if error is not None else None
+    if retry_after is not None:
+        return retry_after
+    return random.uniform(0, min(LLM_BACKOFF_MAX_SECONDS, LLM_BACKOFF_BASE_SECONDS * (2 ** attempt)))
+
+def _timeout(timeout: Optional[float]):
+    import httpx
+
+    return httpx.Timeout(LLM_TIMEOUT_SECONDS if timeout is None else timeout, connect=LLM_CONNECT_TIMEOUT_SECONDS)
+
+def _limits():
+    import httpx
+
+    return httpx.Limits(
+        max_connections=LLM_MAX_CONNECTIONS,
+        max_keepalive_connections=LLM_MAX_KEEPALIVE_CONNECTIONS,
+        keepalive_expiry=LLM_KEEPALIVE_EXPIRY_SECONDS,
+    )
+
+def _credentials() -> dict:
+    api_key = os.getenv("API_KEY")
+    api_version = os.getenv("OPENAI_API_VERSION")
+    api_base = os.getenv("API_BASE")
+    if not api_key or not api_version or not api_base:
+        raise ValueError("Les variables d'environnement API_KEY, OPENAI_API_VERSION et API_BASE doivent être définies.")
+    return {"api_key": api_key, "api_version": api_version, "azure_endpoint": api_base}
+
+class LLMGateway:
+    """
+    Point d'accès unique au modèle pour tous les services.
+    - Un client synchrone (appels depuis des threads) et un client asynchrone, créés au
+      premier usage et partagés, chacun avec son pool de connexions HTTP persistantes.
+      Le SDK openai n'est importé qu'à ce moment : il pèse lourd au démarrage d'un worker.
+    - Les nouvelles tentatives du SDK sont désactivées : la politique est appliquée ici
+      (429, 5xx, erreurs réseau ; Retry-After respecté, sinon backoff exponentiel avec gigue).
+    """
+    def __init__(self, max_retries: int = LLM_MAX_RETRIES):
+        self.max_retries = max_retries
+        self._client = None
+        self._async_client = None
+        self._lock = threading.Lock()
+        self.calls = 0
+        self.retries = 0
+        self.throttled = 0
+        self.failures = 0
+
+    @property
+    def client(self):
+        if self._client is None:
+            with self._lock:
+                if self._client is None:
+                    import httpx
+                    from openai import AzureOpenAI
+
+                    self._client = AzureOpenAI(
+                        **_credentials(),
+                        max_retries=0,
+                        timeout=_timeout(None),
+                        http_client=httpx.Client(limits=_limits(), timeout=_timeout(None)),
+                    )
+        return self._client
+
+    @property
+    def async_client(self):
+        if self._async_client is None:
+            with self._lock:
+                if self._async_client is None:
+                    import httpx
+                    from openai import AsyncAzureOpenAI
+
+                    self._async_client = AsyncAzureOpenAI(
+                        **_credentials(),
+                        max_retries=0,
+                        timeout=_timeout(None),
+                        http_client=httpx.AsyncClient(limits=_limits(), timeout=_timeout(None)),
+                    )
+        return self._async_client
+
+    def _should_retry(self, error: Exception, attempt: int, deadline: float, retry_timeouts: bool = True) -> Optional[float]:
+        """
+        Délai avant la prochaine tentative, ou None si l'erreur doit être renvoyée
+        (erreur définitive, tentatives épuisées ou échéance `deadline` dépassée).
+        """
+        if attempt >= self.max_retries or not _is_retryable(error, retry_timeouts):
+            return None
+        delay = backoff_delay(attempt, error)
+        if delay > LLM_RETRY_AFTER_MAX_SECONDS or time.monotonic() + delay >= deadline:
+            return None
+        if getattr(error, "status_code", None) == 429:
+            self.throttled += 1
+        self.retries += 1
+        print(f"Appel LLM en échec ({type(error).__name__}), nouvelle tentative dans {delay:.2f}s")
+        return delay
+
+    @staticmethod
+    def _attempt_timeout(timeout: Optional[float], deadline: float):
+        # Une tentative ne dépasse jamais l'échéance de l'appel.
+        remaining = max(0.1, deadline - time.monotonic())
+        return _timeout(min(LLM_TIMEOUT_SECONDS if timeout is None else timeout, remaining))
+
+    def chat(self, messages: List[dict], model: str = DEFAULT_MODEL, timeout: Optional[float] = None,
+             deadline_seconds: float = LLM_RETRY_DEADLINE_SECONDS, **kwargs) -> Any:
+        """
+        `chat.completions.create` avec la politique de nouvelles tentatives (appel bloquant),
+        le tout borné à `deadline_seconds`.
+        """
+        self.calls += 1
+        deadline = time.monotonic() + deadline_seconds
+        attempt = 0
+        while True:
+            try:
+                return self.client.chat.completions.create(
+                    model=model, messages=messages, timeout=self._attempt_timeout(timeout, deadline), **kwargs
+                )
+            except Exception as e:
+                delay = self._should_retry(e, attempt, deadline)
+                if delay is None:
+                    self.failures += 1
+                    raise
+                time.sleep(delay)
+                attempt += 1
+
+    async def achat(self, messages: List[dict], model: str = DEFAULT_MODEL, timeout: Optional[float] = None,
+                    deadline_seconds: float = LLM_RETRY_DEADLINE_SECONDS, **kwargs) -> Any:
+        """
+        Variante asynchrone de `chat`. Avec `stream=True` (appel interactif), seule
+        l'ouverture du flux est retentée, et jamais après un délai dépassé : l'utilisateur
+        reçoit l'erreur au lieu d'attendre plusieurs fois LLM_TIMEOUT_SECONDS. Une erreur
+        en cours de flux est renvoyée à l'appelant.
+        """
+        self.calls += 1
+        deadline = time.monotonic() + deadline_seconds
+        retry_timeouts = not kwargs.get("stream", False)
+        attempt = 0
+        while True:
+            try:
+                return await self.async_client.chat.completions.create(
+                    model=model, messages=messages, timeout=self._attempt_timeout(timeout, deadline), **kwargs
+                )
+            except Exception as e:
+                delay = self._should_retry(e, attempt, deadline, retry_timeouts)
+                if delay is None:
+                    self.failures += 1
+                    raise
+                await asyncio.sleep(delay)
+                attempt += 1
+
+    def complete(self, prompt: str, system: Optional[str] = None, **kwargs) -> str:
+        messages = ([{"role": "system", "content": system}] if system else []) + [{"role": "user", "content": prompt}]
+        return self.chat(messages, **kwargs).choices[0].message.content
+
+    async def warmup(self, timeout: float = LLM_WARMUP_TIMEOUT_SECONDS):
+        """
+        Ouvre une connexion de chaque pool (requête de liste des modèles, sans consommation
+        de tokens) pour que les premiers appels ne paient pas la poignée de main TLS.
+        Lève une exception si le service est injoignable.
+        """
+        import openai
+
+        async def probe(call):
+            try:
+                await call()
+            except openai.APIStatusError:
+                # Le serveur a répondu : la connexion est établie, le statut importe peu.
+                pass
+
+        await asyncio.gather(
+            probe(lambda: self.async_client.models.list(timeout=_timeout(timeout))),
+            probe(lambda: asyncio.to_thread(self.client.models.list, timeout=_timeout(timeout))),
+        )
+
+    async def aclose(self):
+        client, self._client = self._client, None
+        async_client, self._async_client = self._async_client, None
+        if client is not None:
+            client.close()
+        if async_client is not None:
+            await async_client.close()
+
+    def stats(self) -> dict:
+        return {
+            "calls": self.calls,
+            "retries": self.retries,
+            "throttled": self.throttled,
+            "failures": self.failures,
+            "max_retries": self.max_retries,
+            "retry_deadline_seconds": LLM_RETRY_DEADLINE_SECONDS,
+            "max_connections": LLM_MAX_CONNECTIONS,
+            "max_keepalive_connections": LLM_MAX_KEEPALIVE_CONNECTIONS,
+        }
+
+llm_gateway = LLMGateway()
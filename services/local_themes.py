@@ -0,0 +1,255 @@
+import os
+import string
+from collections import Counter
+from functools import lru_cache
+from typing import Dict, FrozenSet, Iterable, List, Optional, Set
+
+LOCAL_THEMES_MAX_THEMES = int(os.getenv("LOCAL_THEMES_MAX_THEMES", "12"))
+MIN_TOKEN_LENGTH = 3
+
+# BIGRAM_CANDIDATES mots les plus fréquents peuvent seuls former des bigrammes : un thème
+# de deux mots est fait de mots eux-mêmes fréquents, et le vocabulaire reste borné.
+BIGRAM_CANDIDATES = int(os.getenv("LOCAL_THEMES_BIGRAM_CANDIDATES", "500"))
+
+# Découpage par str.translate + split (bien plus rapide qu'une expression régulière Unicode) :
+# ponctuation et chiffres deviennent des espaces ; apostrophes et traits d'union restent dans
+# le mot ("l'intelligence", "user's"), élisions et possessifs étant retirés une seule fois par
+# mot distinct (voir _TermTable).
+SEPARATORS = str.maketrans({c: " " for c in string.punctuation.replace("'", "").replace("-", "") + string.digits + "«»“”„…–—•·"})
+ELISIONS = {"c", "d", "j", "l", "m", "n", "s", "t", "qu", "jusqu", "lorsqu", "puisqu"}
+
+ENGLISH_STOPWORDS = {
+    "a", "about", "above", "after", "again", "against", "all", "also", "am", "an", "and", "any", "are", "as", "at",
+    "be", "because", "been", "before", "being", "below", "between", "both", "but", "by", "can", "could", "did", "do",
+    "does", "doing", "down", "during", "each", "even", "every", "few", "for", "from", "further", "get", "gets", "had",
+    "has", "have", "having", "he", "her", "here", "hers", "herself", "him", "himself", "his", "how", "i", "idea",
+    "ideas", "if", "in", "into", "is", "it", "its", "itself", "just", "like", "make", "makes", "many", "me", "more",
+    "most", "much", "must", "my", "myself", "need", "new", "no", "nor", "not", "now", "of", "off", "on", "once", "one",
+    "only", "or", "other", "our", "ours", "ourselves", "out", "over", "own", "people", "same", "she", "should", "so",
+    "some", "such", "than", "that", "the", "their", "theirs", "them", "themselves", "then", "there", "these", "they",
+    "thing", "things", "this", "those", "through", "to", "too", "under", "until", "up", "use", "used", "using", "very",
+    "want", "was", "way", "we", "were", "what", "when", "where", "which", "while", "who", "whom", "why", "will",
+    "with", "would", "you", "your", "yours", "yourself", "yourselves",
+}
+FRENCH_STOPWORDS = {
+    "afin", "ai", "aie", "ainsi", "alors", "au", "aucun", "aussi", "autre", "autres", "aux", "avec", "avoir", "bien",
+    "car", "ce", "ceci", "cela", "celle", "celles", "celui", "ces", "cet", "cette", "ceux", "chaque", "chez", "comme",
+    "comment", "dans", "de", "des", "donc", "dont", "du", "elle", "elles", "en", "encore", "entre", "est", "et", "été",
+    "être", "eux", "faire", "fait", "faut", "ici", "idée", "idées", "il", "ils", "je", "la", "le", "les", "leur",
+    "leurs", "lui", "mais", "me", "même", "mes", "moi", "mon", "ne", "ni", "nos", "notre", "nous", "on", "ont", "ou",
+    "où", "par", "pas", "permet", "peu", "peut", "plus", "pour", "pourrait", "qu", "quand", "que", "quel", "quelle",
+    "quelles", "quels", "qui", "sa", "sans", "se", "selon", "ses", "si", "son", "sont", "sous", "sur", "ta", "te",
+    "tes", "toi", "ton", "tous", "tout", "toute", "toutes", "très", "tu", "un", "une", "unes", "uns", "utiliser",
+    "vers", "via", "vos", "votre", "vous", "y",
+}
+
+# Regroupement des synonymes et des équivalents français/anglais sous un libellé unique.
+PHRASE_SYNONYMS = {
+    ("artificial", "intelligence"): "artificial intelligence",
+    ("intelligence", "artificielle"): "artificial intelligence",
+    ("machine", "learning"): "machine learning",
+    ("apprentissage", "automatique"): "machine learning",
+    ("réalité", "virtuelle"): "virtual reality",
+    ("virtual", "reality"): "virtual reality",
+    ("réalité", "augmentée"): "augmented reality",
+    ("augmented", "reality"): "augmented reality",
+    ("développement", "durable"): "sustainability",
+    ("science", "fiction"): "science fiction",
+}
+WORD_SYNONYMS = {
+    "ai": "artificial intelligence",
+    "ia": "artificial intelligence",
+    "ml": "machine learning",
+    "vr": "virtual reality",
+    "ar": "augmented reality",
+    "sustainable": "sustainability",
+    "durable": "sustainability",
+    "écologie": "ecology",
+    "écologique": "ecology",
+    "ecological": "ecology",
+    "technologie": "technology",
+    "technologies": "technology",
+    "technologique": "technology",
+    "technological": "technology",
+    "santé": "health",
+    "éducation": "education",
+    "educational": "education",
+    "environnement": "environment",
+    "environmental": "environment",
+    "espace": "space",
+    "application": "app",
+    "applications": "app",
+    "apps": "app",
+    "jeu": "game",
+    "jeux": "game",
+    "games": "game",
+    "science-fiction": "science fiction",
+}
+
+def _nltk_stopwords() -> Set[str]:
+    """
+    Complète les listes intégrées par celles de NLTK quand le corpus est disponible localement
+    (aucun téléchargement n'est tenté).
+    """
+    try:
+        from nltk.corpus import stopwords
+        return set(stopwords.words("english")) | set(stopwords.words("french"))
+    except Exception:
+        return set()
+
+@lru_cache(maxsize=1)
+def stopwords() -> FrozenSet[str]:
+    # Chargé au premier usage : importer NLTK ralentit sensiblement le démarrage.
+    return frozenset(ENGLISH_STOPWORDS | FRENCH_STOPWORDS | _nltk_stopwords())
+
+# Le second mot d'une expression n'est jamais élidé : il suffit à repérer les idées à fusionner.
+PHRASE_SECOND_WORDS = {words[1] for words in PHRASE_SYNONYMS}
+
+def _bare(token: str) -> Optional[str]:
+    """
+    Mot sans élision ni possessif ; None pour "j'ai", qui ne doit pas devenir "ai"
+    (abréviation anglaise d'intelligence artificielle).
+    """
+    token = token.replace("’", "'")
+    if "'" not in token:
+        return token
+    if token == "j'ai":
+        return None
+    head, _, tail = token.partition("'")
+    if head in ELISIONS:
+        token = tail
+    if token.endswith("'s"):
+        token = token[:-2]
+    return token.replace("'", "")
+
+def _singular(token: str) -> str:
+    if len(token) > 4 and token.endswith("ies"):
+        return token[:-3] + "y"
+    if len(token) > 4 and token.endswith("s") and not token.endswith("ss"):
+        return token[:-1]
+    return token
+
+class _TermTable(dict):
+    """
+    Terme associé à chaque mot brut (None pour un mot vide), calculé une seule fois par mot.
+    """
+    def __missing__(self, token: str) -> Optional[str]:
+        word = _bare(token)
+        if word in WORD_SYNONYMS:
+            term = WORD_SYNONYMS[word]
+        elif word is None or word in stopwords() or len(word) < MIN_TOKEN_LENGTH:
+            term = None
+        else:
+            term = _singular(word)
+        self[token] = term
+        return term
+
+_terms = _TermTable()
+
+def _merge_phrases(tokens: List[str]) -> List[Optional[str]]:
+    """
+    Termes d'une suite de mots, les expressions de PHRASE_SYNONYMS comptant pour un seul terme.
+    """
+    words = [_bare(t) for t in tokens]
+    terms: List[Optional[str]] = []
+    i = 0
+    while i < len(tokens):
+        phrase = PHRASE_SYNONYMS.get(tuple(words[i:i + 2]))
+        if phrase:
+            terms.append(phrase)
+            i += 2
+        else:
+            terms.append(_terms[tokens[i]])
+            i += 1
+    return terms
+
+def tokenize(text: str) -> List[str]:
+    return [t.strip("'’-") for t in str(text).lower().translate(SEPARATORS).split() if t.strip("'’-")]
+
+def _term_sequence(tokens: List[str]) -> List[Optional[str]]:
+    if PHRASE_SECOND_WORDS.isdisjoint(tokens):
+        return list(map(_terms.__getitem__, tokens))
+    return _merge_phrases(tokens)
+
+def _bigrams(terms: List[Optional[str]], candidates: Optional[Set[str]] = None) -> Iterable[str]:
+    return (
+        f"{left} {right}" for left, right in zip(terms, terms[1:])
+        if left and right and " " not in left and " " not in right
+        and (candidates is None or (left in candidates and right in candidates))
+    )
+
+def extract_terms(text: str) -> Set[str]:
+    """
+    Termes d'une idée : mots pleins (synonymes regroupés) et bigrammes de mots pleins
+    consécutifs ; un mot vide coupe les bigrammes.
+    """
+    terms = _term_sequence(tokenize(text))
+    result = {t for t in terms if t}
+    result.update(_bigrams(terms))
+    return result
+
+def extract_local_themes(texts: Iterable[str], max_themes: int = LOCAL_THEMES_MAX_THEMES) -> List[Dict[str, float]]:
+    """
+    Extraction des thèmes sans appel réseau, au même format que l'extraction par LLM :
+    [{"_id": thème, "count": fréquence relative}].
+    Chaque terme est pondéré par TF-IDF (TF binaire, les idées étant courtes) : les termes
+    présents partout, peu discriminants, sont pénalisés. Un bigramme retenu absorbe les
+    mots qui le composent.
+    """
+    import numpy as np
+
+    # Les idées identiques ne sont analysées qu'une fois, pondérées par leur nombre d'occurrences.
+    occurrences = Counter(texts)
+    occurrences.pop(None, None)
+    occurrences.pop("", None)
+    n_docs = sum(occurrences.values())
+    if not n_docs:
+        return []
+
+    counts = list(occurrences.values())
+    # Normalisation en un seul passage sur tout le corpus, puis découpage idée par idée.
+    corpus = "\n".join(str(text).replace("\n", " ") for text in occurrences).lower().translate(SEPARATORS)
+    sequences = [_term_sequence(line.split()) for line in corpus.split("\n")]
+
+    df = Counter()
+    for terms, count in zip(sequences, counts):
+        unigrams = set(terms)
+        unigrams.discard(None)
+        if count == 1:
+            df.update(unigrams)
+        else:
+            for term in unigrams:
+                df[term] += count
+
+    candidates = {term for term, _ in df.most_common(BIGRAM_CANDIDATES) if " " not in term}
+    for terms, count in zip(sequences, counts):
+        bigrams = set(_bigrams(terms, candidates))
+        if count == 1:
+            df.update(bigrams)
+        else:
+            for term in bigrams:
+                df[term] += count
+
+    # Un terme isolé ne fait pas un thème dès qu'il y a assez d'idées.
+    min_df = 2 if n_docs >= 20 else 1
+    vocabulary = [term for term, n in df.items() if n >= min_df]
+    if not vocabulary:
+        return []
+    df_array = np.fromiter((df[t] for t in vocabulary), dtype=np.float64, count=len(vocabulary))
+    idf = np.log((1 + n_docs) / (1 + df_array)) + 1
+    scores = df_array * idf
+
+    selected: List[str] = []
+    for index in np.argsort(-scores, kind="stable"):
+        if len(selected) >= max_themes:
+            break
+        term = vocabulary[index]
+        if " " in term:
+            words = term.split(" ")
+            selected = [s for s in selected if not (s in words and df[term] * 2 >= df[s])]
+        elif any(term in s.split(" ") and df[s] * 2 >= df[term] for s in selected if " " in s):
+            continue
+        selected.append(term)
+
+    total = sum(df[t] for t in selected)
+    return [{"_id": term, "count": round(df[term] / total, 2)} for term in sorted(selected, key=lambda t: -df[t])]
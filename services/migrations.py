@@ -0,0 +1,77 @@
+import argparse
+import asyncio
+import json
+from services.repository import analyses_repository
+from services.rollup_service import refresh_rollups
+
+# Analyses dont la date est encore une chaîne ISO (format des versions précédentes).
+STRING_CREATED_AT = {"created_at": {"$type": "string"}}
+
+async def migrate_created_at_to_date() -> dict:
+    """
+    Convertit en date BSON les `created_at` stockés sous forme de chaîne ISO.
+    La conversion est faite côté serveur (pipeline de mise à jour, chaînes sans fuseau lues
+    en UTC) ; une chaîne illisible est laissée telle quelle et comptée dans `remaining`.
+    Relancer la migration est sans effet.
+    """
+    result = await analyses_repository.update_many(
+        STRING_CREATED_AT,
+        [{"$set": {"created_at": {"$dateFromString": {
+            "dateString": "$created_at",
+            "onError": "$created_at",
+        }}}}],
+    )
+    remaining = await analyses_repository.count_documents(STRING_CREATED_AT)
+    return {"matched": result.matched_count, "converted": result.modified_count, "remaining": remaining}
+
+# Analyses d'une même session relues par lots, du plus récent au plus ancien.
+DEDUPE_CHUNK = 500
+NEWEST_FIRST = [("session_id", 1), ("created_at", -1), ("_id", -1)]
+
+async def dedupe_analyses(collection=None, dry_run: bool = False) -> dict:
+    """
+    Supprime les analyses en double d'une même session en ne gardant que la plus récente
+    (`created_at`, puis `_id`), préalable à l'index unique sur `session_id`.
+    Les agrégats du tableau de bord sont recalculés si des analyses ont été supprimées.
+    Relancer la migration est sans effet.
+    """
+    collection = collection if collection is not None else analyses_repository.collection
+    cursor = await collection.aggregate([
+        {"$group": {"_id": "$session_id", "count": {"$sum": 1}}},
+        {"$match": {"count": {"$gt": 1}}},
+    ], allowDiskUse=True)
+    session_ids = [doc["_id"] async for doc in cursor]
+
+    to_delete = []
+    for start in range(0, len(session_ids), DEDUPE_CHUNK):
+        chunk = session_ids[start:start + DEDUPE_CHUNK]
+        seen = set()
+        async for doc in collection.find({"session_id": {"$in": chunk}}, {"_id": 1, "session_id": 1}, sort=NEWEST_FIRST):
+            if doc["session_id"] in seen:
+                to_delete.append(doc["_id"])
+            else:
+                seen.add(doc["session_id"])
+
+    deleted = 0
+    if not dry_run:
+        for start in range(0, len(to_delete), DEDUPE_CHUNK):
+            result = await collection.delete_many({"_id": {"$in": to_delete[start:start + DEDUPE_CHUNK]}})
+            deleted += result.deleted_count
+        if deleted:
+            await refresh_rollups()
+    return {"sessions": len(session_ids), "duplicates": len(to_delete), "deleted": deleted}
+
+async def _main(args):
+    if args.dedupe:
+        print(json.dumps(await dedupe_analyses(dry_run=args.dry_run)))
+        return
+    if args.dry_run:
+        print(json.dumps({"pending": await analyses_repository.count_documents(STRING_CREATED_AT)}))
+        return
+    print(json.dumps(await migrate_created_at_to_date()))
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Migrations des analyses : dates `created_at` en date BSON, doublons par session.")
+    parser.add_argument("--dedupe", action="store_true", help="supprime les analyses en double (garde la plus récente par session)")
+    parser.add_argument("--dry-run", action="store_true", help="compte les documents concernés sans les modifier")
+    asyncio.run(_main(parser.parse_args()))
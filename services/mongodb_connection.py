@@ -1,14 +1,149 @@
 from dotenv import load_dotenv
 import os
-from pymongo import MongoClient
- 
-class MongoDBManager:
+import threading
+from collections import Counter
+from typing import Optional
+from pymongo import AsyncMongoClient
+from pymongo import monitoring
+
+load_dotenv()
+
+def _int_env(name: str) -> Optional[int]:
+    value = os.getenv(name)
+    return int(value) if value else None
+
+def _write_concern(value: Optional[str]):
+    if not value:
+        return None
+    return int(value) if value.isdigit() else value
+
+def client_options() -> dict:
+    """
+    Options du client lues dans l'environnement ; une variable absente laisse la valeur
+    par défaut du driver. Le nombre total de connexions d'un déploiement vaut au plus
+    MONGO_MAX_POOL_SIZE x serveurs x workers.
+    """
+    options = {
+        "maxPoolSize": _int_env("MONGO_MAX_POOL_SIZE") or 50,
+        "minPoolSize": _int_env("MONGO_MIN_POOL_SIZE"),
+        "maxIdleTimeMS": _int_env("MONGO_MAX_IDLE_TIME_MS"),
+        "waitQueueTimeoutMS": _int_env("MONGO_WAIT_QUEUE_TIMEOUT_MS"),
+        "connectTimeoutMS": _int_env("MONGO_CONNECT_TIMEOUT_MS"),
+        "serverSelectionTimeoutMS": _int_env("MONGO_SERVER_SELECTION_TIMEOUT_MS"),
+        "socketTimeoutMS": _int_env("MONGO_SOCKET_TIMEOUT_MS"),
+        "readPreference": os.getenv("MONGO_READ_PREFERENCE"),
+        "w": _write_concern(os.getenv("MONGO_WRITE_CONCERN")),
+        "appname": os.getenv("MONGO_APP_NAME", "generative-ai-prod"),
+    }
+    return {key: value for key, value in options.items() if value is not None}
+
+class PoolStatsListener(monitoring.ConnectionPoolListener):
+    """
+    Compteurs du pool de connexions, alimentés par les événements du driver.
+    """
     def __init__(self):
-        load_dotenv()
-        uri = os.getenv('MONGO_URI')
-        db_name = os.getenv('MONGO_DB_NAME')
-        self.client = MongoClient(uri)
-        self.db = self.client[db_name]
- 
+        self._lock = threading.Lock()
+        self.events = Counter()
+        self.open = Counter()
+        self.checked_out = Counter()
+
+    def _count(self, event_name: str, address=None, open_delta: int = 0, out_delta: int = 0):
+        with self._lock:
+            self.events[event_name] += 1
+            if address is not None:
+                key = f"{address[0]}:{address[1]}"
+                self.open[key] += open_delta
+                self.checked_out[key] += out_delta
+
+    def pool_created(self, event):
+        self._count("pools_created")
+
+    def pool_ready(self, event):
+        pass
+
+    def pool_cleared(self, event):
+        self._count("pools_cleared")
+
+    def pool_closed(self, event):
+        self._count("pools_closed")
+
+    def connection_created(self, event):
+        self._count("connections_created", event.address, open_delta=1)
+
+    def connection_ready(self, event):
+        pass
+
+    def connection_closed(self, event):
+        self._count("connections_closed", event.address, open_delta=-1)
+
+    def connection_check_out_started(self, event):
+        pass
+
+    def connection_check_out_failed(self, event):
+        self._count("check_out_failures")
+
+    def connection_checked_out(self, event):
+        self._count("checked_out_total", event.address, out_delta=1)
+
+    def connection_checked_in(self, event):
+        self._count("checked_in_total", event.address, out_delta=-1)
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "open_connections": sum(self.open.values()),
+                "in_use_connections": sum(self.checked_out.values()),
+                "by_server": {
+                    address: {"open": self.open[address], "in_use": self.checked_out[address]}
+                    for address in self.open
+                },
+                **self.events,
+            }
+
+class AsyncMongoDBManager:
+    """
+    Client MongoDB unique du processus, basé sur le driver async natif de pymongo.
+    Le client est créé au premier accès (ou par `connect`, appelé au démarrage de
+    l'application) et fermé par `close` à l'arrêt ; tous les dépôts partagent son pool.
+    """
+    def __init__(self, uri: Optional[str] = None, db_name: Optional[str] = None, **options):
+        self._uri = uri
+        self._db_name = db_name
+        self._options = options
+        self._client: Optional[AsyncMongoClient] = None
+        self._lock = threading.Lock()
+        self.pool_listener = PoolStatsListener()
+
+    def connect(self) -> AsyncMongoClient:
+        if self._client is None:
+            with self._lock:
+                if self._client is None:
+                    self._client = AsyncMongoClient(
+                        self._uri or os.getenv('MONGO_URI'),
+                        event_listeners=[self.pool_listener],
+                        **{**client_options(), **self._options},
+                    )
+        return self._client
+
+    @property
+    def client(self) -> AsyncMongoClient:
+        return self.connect()
+
+    @property
+    def db(self):
+        return self.client[self._db_name or os.getenv('MONGO_DB_NAME')]
+
     def get_collection(self, collection_name):
-        return self.db[collection_name]
\ No newline at end of file
+        return self.db[collection_name]
+
+    async def close(self):
+        client, self._client = self._client, None
+        if client is not None:
+            await client.close()
+
+    def pool_stats(self) -> dict:
+        return {
+            "connected": self._client is not None,
+            "options": {**client_options(), **self._options},
+            "pool": self.pool_listener.stats(),
+        }
@@ -0,0 +1,74 @@
+from typing import Any, Dict, List, Mapping, Optional, Sequence
+from services.mongodb_connection import AsyncMongoDBManager
+
+async_mongo_manager = AsyncMongoDBManager()
+
+class MongoRepository:
+    """
+    Accès asynchrone à une collection MongoDB, partagé par tous les services.
+    Lectures, écritures et agrégations passent par la même API `await`-able.
+    """
+    def __init__(self, collection_name: str, manager: AsyncMongoDBManager = None):
+        self.collection_name = collection_name
+        self._manager = manager or async_mongo_manager
+
+    @property
+    def collection(self):
+        return self._manager.get_collection(self.collection_name)
+
+    # Lectures
+
+    async def find_one(self, filter: Optional[Mapping[str, Any]] = None, projection: Optional[Mapping[str, Any]] = None, **kwargs) -> Optional[Dict[str, Any]]:
+        return await self.collection.find_one(filter or {}, projection, **kwargs)
+
+    def find_cursor(self, filter: Optional[Mapping[str, Any]] = None, projection: Optional[Mapping[str, Any]] = None, **kwargs):
+        """
+        Retourne un curseur asynchrone, à parcourir avec `async for` pour les gros volumes.
+        """
+        return self.collection.find(filter or {}, projection, **kwargs)
+
+    async def find(self, filter: Optional[Mapping[str, Any]] = None, projection: Optional[Mapping[str, Any]] = None, **kwargs) -> List[Dict[str, Any]]:
+        return await self.find_cursor(filter, projection, **kwargs).to_list()
+
+    async def count_documents(self, filter: Optional[Mapping[str, Any]] = None, **kwargs) -> int:
+        return await self.collection.count_documents(filter or {}, **kwargs)
+
+    async def distinct(self, key: str, filter: Optional[Mapping[str, Any]] = None, **kwargs) -> list:
+        return await self.collection.distinct(key, filter, **kwargs)
+
+    # Agrégations
+
+    async def aggregate_cursor(self, pipeline: Sequence[Mapping[str, Any]], **kwargs):
+        return await self.collection.aggregate(list(pipeline), **kwargs)
+
+    async def aggregate(self, pipeline: Sequence[Mapping[str, Any]], **kwargs) -> List[Dict[str, Any]]:
+        cursor = await self.aggregate_cursor(pipeline, **kwargs)
+        return await cursor.to_list()
+
+    # Écritures
+
+    async def insert_one(self, document: Mapping[str, Any], **kwargs):
+        return await self.collection.insert_one(document, **kwargs)
+
+    async def update_one(self, filter: Mapping[str, Any], update: Any, upsert: bool = False, **kwargs):
+        return await self.collection.update_one(filter, update, upsert=upsert, **kwargs)
+
+    async def update_many(self, filter: Mapping[str, Any], update: Any, upsert: bool = False, **kwargs):
+        return await self.collection.update_many(filter, update, upsert=upsert, **kwargs)
+
+    async def find_one_and_update(self, filter: Mapping[str, Any], update: Any, **kwargs):
+        return await self.collection.find_one_and_update(filter, update, **kwargs)
+
+    async def delete_one(self, filter: Mapping[str, Any], **kwargs):
+        return await self.collection.delete_one(filter, **kwargs)
+
+    async def find_one_and_delete(self, filter: Mapping[str, Any], **kwargs):
+        return await self.collection.find_one_and_delete(filter, **kwargs)
+
+    async def bulk_write(self, requests: Sequence[Any], ordered: bool = False, **kwargs):
+        return await self.collection.bulk_write(list(requests), ordered=ordered, **kwargs)
+
+chats_repository = MongoRepository("chats")
+analyses_repository = MongoRepository("analyses")
+config_repository = MongoRepository("config")
+analysis_jobs_repository = MongoRepository("analysis_jobs")
@@ -0,0 +1,256 @@
+import asyncio
+import os
+from collections import defaultdict
+from datetime import datetime
+from typing import Dict, Optional
+from services.repository import chats_repository, analyses_repository, MongoRepository
+from utils.http_cache import response_cache
+
+ROLLUP_ID = "dashboard"
+ROLLUP_REFRESH_SECONDS = float(os.getenv("ROLLUP_REFRESH_SECONDS", "900"))
+
+rollups_repository = MongoRepository("dashboard_rollups")
+
+# Champs moyennés sur le tableau de bord : nom du compteur -> chemin dans un document d'analyse.
+AVERAGED_FIELDS = {
+    "duration": "time_stats.total_duration_minutes",
+    "ai_score": "assistant_influence_score",
+    "originality": "originality_score",
+    "matching": "matching_score",
+    "user_size": "size_stats.avg_user_size",
+    "ai_size": "size_stats.avg_ai_size",
+}
+
+def _is_number(value) -> bool:
+    return isinstance(value, (int, float)) and not isinstance(value, bool)
+
+def _get_path(doc: dict, path: str):
+    for key in path.split("."):
+        if not isinstance(doc, dict):
+            return None
+        doc = doc.get(key)
+    return doc
+
+def originality_bucket(score) -> str:
+    """
+    Même découpage que le `$switch` historique : une valeur absente se range dans "0-25"
+    (null précède les nombres dans l'ordre BSON), une valeur non numérique dans "Unknown".
+    """
+    if score is None:
+        return "0-25"
+    if not _is_number(score):
+        return "Unknown"
+    if score < 25:
+        return "0-25"
+    if score < 50:
+        return "25-50"
+    if score < 75:
+        return "50-75"
+    if score <= 100:
+        return "75-100"
+    return "Unknown"
+
+def analysis_contribution(doc: Optional[dict], sign: int = 1) -> Dict[str, float]:
+    """
+    Incréments qu'un document d'analyse apporte aux compteurs du tableau de bord.
+    """
+    if not doc:
+        return {}
+    inc = {"analyses.count": sign}
+    if _get_path(doc, "time_stats.user_returned_after_30mins") is True:
+        inc["analyses.reengagements"] = sign
+    for name, path in AVERAGED_FIELDS.items():
+        value = _get_path(doc, path)
+        if _is_number(value):
+            inc[f"analyses.{name}_sum"] = sign * value
+            inc[f"analyses.{name}_count"] = sign
+    bucket = originality_bucket(doc.get("originality_score"))
+    inc[f"analyses.heatmap.{bucket}.docs"] = sign
+    total_messages = _get_path(doc, "time_stats.total_messages")
+    if _is_number(total_messages):
+        inc[f"analyses.heatmap.{bucket}.messages_sum"] = sign * total_messages
+        inc[f"analyses.heatmap.{bucket}.messages_count"] = sign
+    return inc
+
+def _merge(*increments: Dict[str, float]) -> Dict[str, float]:
+    merged = defaultdict(int)
+    for inc in increments:
+        for key, value in inc.items():
+            merged[key] += value
+    return {k: v for k, v in merged.items() if v != 0}
+
+async def _apply(inc: Dict[str, float]):
+    """
+    Applique des incréments au résumé. Sans résumé existant, rien n'est écrit :
+    le prochain recalcul complet le créera avec des valeurs exactes.
+    """
+    if inc:
+        await rollups_repository.update_one(
+            {"_id": ROLLUP_ID},
+            {"$inc": {**inc, "version": 1}, "$set": {"updated_at": datetime.utcnow()}}
+        )
+
+async def on_analysis_replaced(old_doc: Optional[dict], new_doc: Optional[dict]):
+    """
+    À appeler après l'insertion, le remplacement ou la suppression d'une analyse.
+    """
+    await _apply(_merge(analysis_contribution(old_doc, -1), analysis_contribution(new_doc, 1)))
+    response_cache.invalidate("analyses")
+
+async def on_chat_changed(created: bool = False, completed: bool = False, deleted: bool = False, was_completed: bool = False):
+    """
+    À appeler quand une session est créée, reçoit sa première idée finale, ou est supprimée.
+    """
+    total = int(created) - int(deleted)
+    completed_delta = int(completed) - int(deleted and was_completed)
+    await _apply(_merge({"chats.total": total, "chats.completed": completed_delta}))
+    response_cache.invalidate("chats")
+
+def _numeric_sum(path: str) -> dict:
+    return {"$sum": {"$cond": [{"$isNumber": f"${path}"}, f"${path}", 0]}}
+
+def _numeric_count(path: str) -> dict:
+    return {"$sum": {"$cond": [{"$isNumber": f"${path}"}, 1, 0]}}
+
+def _analyses_facet_pipeline() -> list:
+    totals = {"_id": None, "count": {"$sum": 1}, "reengagements": {
+        "$sum": {"$cond": [{"$eq": ["$time_stats.user_returned_after_30mins", True]}, 1, 0]}
+    }}
+    for name, path in AVERAGED_FIELDS.items():
+        totals[f"{name}_sum"] = _numeric_sum(path)
+        totals[f"{name}_count"] = _numeric_count(path)
+    return [{"$facet": {
+        "totals": [{"$group": totals}],
+        "heatmap": [
+            {"$project": {
+                "bucket": {"$switch": {
+                    "branches": [
+                        {"case": {"$lt": ["$originality_score", 25]}, "then": "0-25"},
+                        {"case": {"$lt": ["$originality_score", 50]}, "then": "25-50"},
+                        {"case": {"$lt": ["$originality_score", 75]}, "then": "50-75"},
+                        {"case": {"$lte": ["$originality_score", 100]}, "then": "75-100"}
+                    ],
+                    "default": "Unknown"
+                }},
+                "total_messages": "$time_stats.total_messages"
+            }},
+            {"$group": {
+                "_id": "$bucket",
+                "docs": {"$sum": 1},
+                "messages_sum": _numeric_sum("total_messages"),
+                "messages_count": _numeric_count("total_messages"),
+            }},
+        ],
+    }}]
+
+async def refresh_rollups() -> dict:
+    """
+    Recalcule entièrement le résumé : une passe `$facet` par collection.
+    """
+    chats_result = await chats_repository.aggregate([{"$facet": {
+        "total": [{"$count": "n"}],
+        "completed": [{"$match": {"final_idea": {"$exists": True}}}, {"$count": "n"}],
+    }}])
+    analyses_result = await analyses_repository.aggregate(_analyses_facet_pipeline())
+
+    chats_facet = chats_result[0] if chats_result else {}
+    analyses_facet = analyses_result[0] if analyses_result else {}
+    totals = (analyses_facet.get("totals") or [{}])[0]
+    totals.pop("_id", None)
+    analyses = {"count": 0, "reengagements": 0}
+    for name in AVERAGED_FIELDS:
+        analyses[f"{name}_sum"] = 0
+        analyses[f"{name}_count"] = 0
+    analyses.update(totals)
+    analyses["heatmap"] = {
+        row["_id"]: {"docs": row["docs"], "messages_sum": row["messages_sum"], "messages_count": row["messages_count"]}
+        for row in analyses_facet.get("heatmap", [])
+    }
+
+    rollup = {
+        "chats": {
+            "total": (chats_facet.get("total") or [{"n": 0}])[0]["n"],
+            "completed": (chats_facet.get("completed") or [{"n": 0}])[0]["n"],
+        },
+        "analyses": analyses,
+        "refreshed_at": datetime.utcnow(),
+        "updated_at": datetime.utcnow(),
+    }
+    await rollups_repository.update_one(
+        {"_id": ROLLUP_ID},
+        {"$set": rollup, "$inc": {"version": 1}},
+        upsert=True
+    )
+    # Appelé après les écritures en masse (analyses groupées, recalcul des statistiques).
+    response_cache.invalidate("analyses", "chats")
+    return await rollups_repository.find_one({"_id": ROLLUP_ID})
+
+class RollupScheduler:
+    """
+    Recalcul complet périodique du résumé, pour corriger toute dérive des compteurs incrémentaux.
+    """
+    def __init__(self, interval: float = ROLLUP_REFRESH_SECONDS):
+        self.interval = interval
+        self._task: Optional[asyncio.Task] = None
+
+    def ensure_started(self):
+        if self._task is None and self.interval > 0:
+            self._task = asyncio.get_running_loop().create_task(self._run())
+
+    async def stop(self):
+        if self._task:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+
+    async def _run(self):
+        while True:
+            await asyncio.sleep(self.interval)
+            try:
+                await refresh_rollups()
+            except Exception as e:
+                print(f"Erreur lors du recalcul des agrégats du tableau de bord : {e}")
+
+rollup_scheduler = RollupScheduler()
+
+async def get_rollup() -> dict:
+    rollup_scheduler.ensure_started()
+    rollup = await rollups_repository.find_one({"_id": ROLLUP_ID})
+    if rollup is None:
+        rollup = await refresh_rollups()
+    return rollup
+
+def _avg(analyses: dict, name: str) -> float:
+    count = analyses.get(f"{name}_count", 0)
+    return round(analyses.get(f"{name}_sum", 0) / count, 2) if count else 0.00
+
+def statistics_from_rollup(rollup: dict) -> dict:
+    chats = rollup.get("chats", {})
+    analyses = rollup.get("analyses", {})
+    total_users = chats.get("total", 0)
+    total_completed_sessions = chats.get("completed", 0)
+    return {
+        "total_users": total_users,
+        "total_completed_sessions": total_completed_sessions,
+        "total_abandoned_sessions": total_users - total_completed_sessions,
+        "num_reengagements": analyses.get("reengagements", 0),
+        "avg_session_duration": _avg(analyses, "duration"),
+    }
+
+def diagram_scores_from_rollup(rollup: dict) -> dict:
+    analyses = rollup.get("analyses", {})
+    heatmap = []
+    for bucket in sorted(analyses.get("heatmap", {})):
+        counters = analyses["heatmap"][bucket]
+        if counters.get("docs", 0) <= 0:
+            continue
+        count = counters.get("messages_count", 0)
+        heatmap.append({"_id": bucket, "avg_messages": counters["messages_sum"] / count if count else None})
+    return {
+        "avg_ai_score": _avg(analyses, "ai_score"),
+        "avg_matching": _avg(analyses, "matching"),
+        "avg_originality": _avg(analyses, "originality"),
+        "avg_user_msg_size": _avg(analyses, "user_size"),
+        "avg_ai_msg_size": _avg(analyses, "ai_size"),
+        "heatmap_data": heatmap,
+    }
@@ -1,58 +1,166 @@
-import asyncio
-from services.mongodb_connection import MongoDBManager
+import hashlib
+from typing import List
+from services.repository import chats_repository
+from services.rollup_service import on_chat_changed
+from utils.http_cache import response_cache
+from services.analysis_service import timestamp_to_ms, update_running_stats
+from utils.tokens import count_tokens
 
-mongo_manager = MongoDBManager()
-collection = mongo_manager.get_collection('chats')
+SAVE_MAX_ATTEMPTS = 5
+
+def make_message_id(session_id: str, role: str, content: str, timestamp: str) -> str:
+    """
+    Identifiant déterministe d'un message : il sert de clé d'idempotence,
+    un même message réenvoyé produit le même identifiant.
+    """
+    raw = f"{session_id}|{role}|{timestamp}|{content}".encode("utf-8")
+    return hashlib.sha1(raw).hexdigest()
+
+def build_message(session_id: str, role: str, content: str, timestamp: str) -> dict:
+    """
+    Construit un message prêt à être persisté dans `conversation_history`.
+    `tokens` est calculé une seule fois ici et réutilisé par build_context.
+    """
+    return {
+        "message_id": make_message_id(session_id, role, content, timestamp),
+        "role": role,
+        "content": content,
+        "timestamp": timestamp,
+        "ts_ms": timestamp_to_ms(timestamp),
+        "size": len(content),
+        "tokens": count_tokens(content)
+    }
 
 async def load_conversation(session_id: str) -> list:
     """
     Charge l'historique de conversation pour une session donnée.
     Renvoie une liste de messages (chaque message étant un dict avec 'role' et 'content').
     """
-    def sync_find():
-        doc = collection.find_one({"session_id": session_id})
-        if doc and "conversation_history" in doc:
-            return doc["conversation_history"]
-        return []
-    conversation = await asyncio.to_thread(sync_find)
-    return conversation
+    doc = await chats_repository.find_one({"session_id": session_id}, {"_id": 0, "conversation_history": 1})
+    if doc and "conversation_history" in doc:
+        return doc["conversation_history"]
+    return []
+
+async def load_last_messages(session_id: str, count: int = 1) -> list:
+    """
+    Charge uniquement les `count` derniers messages de la session ($slice côté serveur).
+    """
+    doc = await chats_repository.find_one(
+        {"session_id": session_id},
+        {"_id": 0, "conversation_history": {"$slice": -count}}
+    )
+    if doc and "conversation_history" in doc:
+        return doc["conversation_history"]
+    return []
 
 async def update_final_idea(session_id: str, idea: str):
     """
     Met à jour ou crée un document pour la session donnée en y ajoutant l'idée finale.
+    Une première idée finale (ou une nouvelle session) est répercutée sur les agrégats
+    du tableau de bord.
     """
-    def sync_update():
-        return collection.update_one(
-            {"session_id": session_id},
-            {"$set": {"final_idea": idea}},
-            upsert=True
-        )
-    result = await asyncio.to_thread(sync_update)
+    result = await chats_repository.update_one(
+        {"session_id": session_id, "final_idea": {"$exists": False}},
+        {"$set": {"final_idea": idea}}
+    )
+    if result.matched_count:
+        await on_chat_changed(completed=True)
+        return result
+    result = await chats_repository.update_one(
+        {"session_id": session_id},
+        {"$set": {"final_idea": idea}},
+        upsert=True
+    )
+    if result.upserted_id is not None:
+        await on_chat_changed(created=True, completed=True)
+    else:
+        response_cache.invalidate("chats")
     return result
 
-async def save_conversation(session_id: str, conversation_history: list):
+async def _existing_message_ids(session_id: str, message_ids: List[str]) -> set:
+    """
+    Parmi `message_ids`, ceux déjà présents dans l'historique (filtrage côté serveur).
+    """
+    result = await chats_repository.aggregate([
+        {"$match": {"session_id": session_id}},
+        {"$project": {"_id": 0, "ids": {"$filter": {
+            "input": "$conversation_history.message_id",
+            "cond": {"$in": ["$$this", message_ids]}
+        }}}}
+    ])
+    return set(result[0]["ids"] or []) if result else set()
+
+async def save_conversation(session_id: str, new_messages: List[dict]):
     """
-    Ajoute les nouveaux messages sans dupliquer ceux déjà présents dans la base.
+    Ajoute les nouveaux messages à la fin de l'historique via un `$push` atomique et met à
+    jour, dans la même écriture, les agrégats `stats` de la session (voir
+    analysis_service.update_running_stats).
+    Seuls les nouveaux messages transitent : le coût d'écriture ne dépend pas de la
+    longueur de l'historique. Un message dont le `message_id` est déjà présent n'est
+    jamais réinséré, ce qui rend l'opération idempotente en cas de nouvel essai.
+    L'écriture est conditionnée au nombre de messages lu (verrou optimiste) : deux
+    écritures concurrentes ne peuvent ni se perdre ni fausser les agrégats.
     """
-    def sync_save():
-        doc = collection.find_one({"session_id": session_id})
-        existing_history = doc.get("conversation_history", []) if doc else []
+    messages = []
+    for m in new_messages:
+        if "message_id" not in m:
+            m = {**m, "message_id": make_message_id(session_id, m["role"], m["content"], m["timestamp"])}
+        if "ts_ms" not in m:
+            m = {**m, "ts_ms": timestamp_to_ms(m["timestamp"])}
+        messages.append(m)
 
-        existing_set = {f"{m['role']}|{m['content']}|{m['timestamp']}" for m in existing_history}
-        new_filtered = [
-            m for m in conversation_history
-            if f"{m['role']}|{m['content']}|{m['timestamp']}" not in existing_set
-        ]
+    result = None
+    for _ in range(SAVE_MAX_ATTEMPTS):
+        if not messages:
+            return result
+        message_ids = [m["message_id"] for m in messages]
+        doc = await chats_repository.find_one({"session_id": session_id}, {"_id": 0, "stats": 1})
 
-        combined_history = existing_history + new_filtered
+        if doc is None:
+            result = await chats_repository.update_one(
+                {"session_id": session_id},
+                {"$setOnInsert": {"conversation_history": messages, "stats": update_running_stats(None, messages)}},
+                upsert=True
+            )
+            if result.upserted_id is not None:
+                await on_chat_changed(created=True)
+                return result
+            continue
 
-        return collection.update_one(
-            {"session_id": session_id},
-            {"$set": {"conversation_history": combined_history}},
-            upsert=True
-        )
+        if "stats" not in doc:
+            # Session antérieure aux agrégats : on les initialise une fois depuis l'historique.
+            legacy = await chats_repository.find_one({"session_id": session_id}, {"_id": 0, "conversation_history": 1})
+            history = legacy.get("conversation_history", [])
+            known_ids = {m.get("message_id") for m in history}
+            messages = [m for m in messages if m["message_id"] not in known_ids]
+            stats = update_running_stats(update_running_stats(None, history), messages)
+            result = await chats_repository.update_one(
+                {"session_id": session_id, "stats": {"$exists": False}},
+                {"$push": {"conversation_history": {"$each": messages}}, "$set": {"stats": stats}}
+            )
+            if result.matched_count:
+                response_cache.invalidate("chats")
+                return result
+            continue
 
-    result = await asyncio.to_thread(sync_save)
-    return result
+        stats = doc["stats"]
+        result = await chats_repository.update_one(
+            {
+                "session_id": session_id,
+                "stats.total_messages": stats["total_messages"],
+                "conversation_history.message_id": {"$nin": message_ids},
+            },
+            {
+                "$push": {"conversation_history": {"$each": messages}},
+                "$set": {"stats": update_running_stats(stats, messages)},
+            }
+        )
+        if result.matched_count:
+            response_cache.invalidate("chats")
+            return result
 
+        # Écriture concurrente, ou messages déjà enregistrés : on retire ces derniers et on recommence.
+        existing = await _existing_message_ids(session_id, message_ids)
+        messages = [m for m in messages if m["message_id"] not in existing]
 
+    raise RuntimeError(f"Impossible d'enregistrer la conversation {session_id} après {SAVE_MAX_ATTEMPTS} tentatives")
@@ -0,0 +1,326 @@
+import asyncio
+import json
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from typing import Awaitable, Callable, Dict, List, Optional
+from dotenv import load_dotenv
+from services.saveConversation_service import load_last_messages
+from utils.tokens import count_tokens
+
+load_dotenv()
+
+def _compact(messages: List[dict]) -> List[dict]:
+    """
+    Ne conserve que ce qui est utile au contexte du modèle : le rôle, le contenu et
+    le nombre de tokens (recalculé pour les messages persistés avant l'ajout de ce champ).
+    """
+    return [
+        {"role": m["role"], "content": m["content"], "tokens": m.get("tokens") if m.get("tokens") is not None else count_tokens(m["content"])}
+        for m in messages
+    ]
+
+def _footprint(messages: List[dict]) -> int:
+    """
+    Empreinte mémoire approximative d'une session, en octets (taille JSON UTF-8).
+    """
+    return len(json.dumps(messages, ensure_ascii=False).encode("utf-8"))
+
+class InMemorySessionBackend:
+    """
+    Stockage dans le processus, LRU : l'entrée la moins récemment utilisée est en tête.
+    """
+    def __init__(self, max_sessions: int, max_bytes: int, idle_ttl: float):
+        self.max_sessions = max_sessions
+        self.max_bytes = max_bytes
+        self.idle_ttl = idle_ttl
+        self._entries: "OrderedDict[str, tuple]" = OrderedDict()
+        self._bytes = 0
+        self.evictions = 0
+
+    async def get(self, session_id: str) -> Optional[List[dict]]:
+        entry = self._entries.get(session_id)
+        if entry is None:
+            return None
+        messages, size, last_access = entry
+        if self.idle_ttl and time.time() - last_access > self.idle_ttl:
+            self._remove(session_id)
+            self.evictions += 1
+            return None
+        self._entries[session_id] = (messages, size, time.time())
+        self._entries.move_to_end(session_id)
+        return list(messages)
+
+    async def put(self, session_id: str, messages: List[dict]):
+        if session_id in self._entries:
+            self._remove(session_id)
+        size = _footprint(messages)
+        self._entries[session_id] = (messages, size, time.time())
+        self._bytes += size
+        self._evict()
+
+    async def delete(self, session_id: str):
+        if session_id in self._entries:
+            self._remove(session_id)
+
+    async def stats(self) -> Dict[str, int]:
+        return {"sessions": len(self._entries), "bytes": self._bytes, "evictions": self.evictions}
+
+    def _remove(self, session_id: str):
+        _, size, _ = self._entries.pop(session_id)
+        self._bytes -= size
+
+    def _evict(self):
+        now = time.time()
+        while self._entries:
+            oldest_id, (_, _, last_access) = next(iter(self._entries.items()))
+            expired = self.idle_ttl and now - last_access > self.idle_ttl
+            over_limit = len(self._entries) > self.max_sessions or self._bytes > self.max_bytes
+            if not (expired or over_limit):
+                break
+            self._remove(oldest_id)
+            self.evictions += 1
+
+class SQLiteSessionBackend:
+    """
+    Stockage dans un fichier SQLite local, partagé par tous les workers d'une même machine.
+    """
+    def __init__(self, path: str, max_sessions: int, max_bytes: int, idle_ttl: float):
+        self.max_sessions = max_sessions
+        self.max_bytes = max_bytes
+        self.idle_ttl = idle_ttl
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False, timeout=5.0, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS session_memory ("
+            "session_id TEXT PRIMARY KEY, messages TEXT NOT NULL, "
+            "size INTEGER NOT NULL, last_access REAL NOT NULL)"
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS idx_session_memory_last_access ON session_memory (last_access)")
+        self._conn.execute("CREATE TABLE IF NOT EXISTS session_memory_counters (name TEXT PRIMARY KEY, value INTEGER NOT NULL)")
+
+    async def get(self, session_id: str) -> Optional[List[dict]]:
+        return await asyncio.to_thread(self._get, session_id)
+
+    async def put(self, session_id: str, messages: List[dict]):
+        await asyncio.to_thread(self._put, session_id, messages)
+
+    async def delete(self, session_id: str):
+        await asyncio.to_thread(self._execute, "DELETE FROM session_memory WHERE session_id = ?", (session_id,))
+
+    async def stats(self) -> Dict[str, int]:
+        return await asyncio.to_thread(self._stats)
+
+    def _execute(self, sql, params=()):
+        with self._lock:
+            return self._conn.execute(sql, params).fetchall()
+
+    def _get(self, session_id):
+        now = time.time()
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT messages, last_access FROM session_memory WHERE session_id = ?", (session_id,)
+            ).fetchone()
+            if row is None:
+                return None
+            if self.idle_ttl and now - row[1] > self.idle_ttl:
+                self._conn.execute("DELETE FROM session_memory WHERE session_id = ?", (session_id,))
+                self._count_evictions(1)
+                return None
+            self._conn.execute("UPDATE session_memory SET last_access = ? WHERE session_id = ?", (now, session_id))
+            return json.loads(row[0])
+
+    def _put(self, session_id, messages):
+        payload = json.dumps(messages, ensure_ascii=False)
+        now = time.time()
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                self._conn.execute(
+                    "INSERT INTO session_memory (session_id, messages, size, last_access) VALUES (?, ?, ?, ?) "
+                    "ON CONFLICT(session_id) DO UPDATE SET messages = excluded.messages, "
+                    "size = excluded.size, last_access = excluded.last_access",
+                    (session_id, payload, len(payload.encode("utf-8")), now)
+                )
+                self._evict(now)
+                self._conn.execute("COMMIT")
+            except Exception:
+                self._conn.execute("ROLLBACK")
+                raise
+
+    def _evict(self, now):
+        evicted = 0
+        if self.idle_ttl:
+            evicted += self._conn.execute(
+                "DELETE FROM session_memory WHERE last_access < ?", (now - self.idle_ttl,)
+            ).rowcount
+        count, total = self._conn.execute("SELECT COUNT(*), COALESCE(SUM(size), 0) FROM session_memory").fetchone()
+        while count > self.max_sessions or total > self.max_bytes:
+            row = self._conn.execute(
+                "SELECT session_id, size FROM session_memory ORDER BY last_access LIMIT 1"
+            ).fetchone()
+            if row is None:
+                break
+            self._conn.execute("DELETE FROM session_memory WHERE session_id = ?", (row[0],))
+            count -= 1
+            total -= row[1]
+            evicted += 1
+        if evicted:
+            self._count_evictions(evicted)
+
+    def _count_evictions(self, n):
+        self._conn.execute(
+            "INSERT INTO session_memory_counters (name, value) VALUES ('evictions', ?) "
+            "ON CONFLICT(name) DO UPDATE SET value = value + excluded.value", (n,)
+        )
+
+    def _stats(self):
+        with self._lock:
+            count, total = self._conn.execute("SELECT COUNT(*), COALESCE(SUM(size), 0) FROM session_memory").fetchone()
+            row = self._conn.execute("SELECT value FROM session_memory_counters WHERE name = 'evictions'").fetchone()
+        return {"sessions": count, "bytes": total, "evictions": row[0] if row else 0}
+
+class RedisSessionBackend:
+    """
+    Stockage sur un serveur compatible Redis (Redis, Valkey, KeyDB...), partagé par tous les workers.
+    L'expiration d'inactivité repose sur le TTL des clés ; l'ordre LRU est tenu dans un sorted set.
+    """
+    PREFIX = "session_memory:"
+
+    def __init__(self, url: str, max_sessions: int, max_bytes: int, idle_ttl: float):
+        try:
+            import redis.asyncio as redis_asyncio
+        except ImportError:
+            raise RuntimeError("Le backend 'redis' nécessite le paquet `redis` (pip install redis).")
+        self.max_sessions = max_sessions
+        self.max_bytes = max_bytes
+        self.idle_ttl = idle_ttl
+        self._redis = redis_asyncio.from_url(url)
+        self._lru_key = self.PREFIX + "lru"
+        self._sizes_key = self.PREFIX + "sizes"
+        self._evictions_key = self.PREFIX + "evictions"
+
+    def _key(self, session_id):
+        return self.PREFIX + "s:" + session_id
+
+    async def get(self, session_id: str) -> Optional[List[dict]]:
+        payload = await self._redis.get(self._key(session_id))
+        if payload is None:
+            await self._forget(session_id)
+            return None
+        pipe = self._redis.pipeline()
+        pipe.zadd(self._lru_key, {session_id: time.time()})
+        if self.idle_ttl:
+            pipe.expire(self._key(session_id), int(self.idle_ttl))
+        await pipe.execute()
+        return json.loads(payload)
+
+    async def put(self, session_id: str, messages: List[dict]):
+        payload = json.dumps(messages, ensure_ascii=False)
+        pipe = self._redis.pipeline()
+        pipe.set(self._key(session_id), payload, ex=int(self.idle_ttl) if self.idle_ttl else None)
+        pipe.zadd(self._lru_key, {session_id: time.time()})
+        pipe.hset(self._sizes_key, session_id, len(payload.encode("utf-8")))
+        await pipe.execute()
+        await self._evict()
+
+    async def delete(self, session_id: str):
+        await self._redis.delete(self._key(session_id))
+        await self._forget(session_id)
+
+    async def stats(self) -> Dict[str, int]:
+        sizes = await self._redis.hvals(self._sizes_key)
+        evictions = await self._redis.get(self._evictions_key)
+        return {"sessions": len(sizes), "bytes": sum(int(s) for s in sizes), "evictions": int(evictions or 0)}
+
+    async def _forget(self, session_id):
+        pipe = self._redis.pipeline()
+        pipe.zrem(self._lru_key, session_id)
+        pipe.hdel(self._sizes_key, session_id)
+        await pipe.execute()
+
+    async def _evict(self):
+        if self.idle_ttl:
+            expired = await self._redis.zrangebyscore(self._lru_key, 0, time.time() - self.idle_ttl)
+            for raw_id in expired:
+                await self.delete(raw_id.decode())
+        sizes = await self._redis.hvals(self._sizes_key)
+        count, total = len(sizes), sum(int(s) for s in sizes)
+        evicted = 0
+        while count > self.max_sessions or total > self.max_bytes:
+            oldest = await self._redis.zrange(self._lru_key, 0, 0)
+            if not oldest:
+                break
+            session_id = oldest[0].decode()
+            size = await self._redis.hget(self._sizes_key, session_id)
+            await self.delete(session_id)
+            count -= 1
+            total -= int(size or 0)
+            evicted += 1
+        if evicted:
+            await self._redis.incrby(self._evictions_key, evicted)
+
+class SessionMemoryStore:
+    """
+    Mémoire conversationnelle par session, bornée (LRU + expiration d'inactivité + budget en octets).
+    Une session absente (jamais vue ou évincée) est réhydratée à la demande depuis
+    les `max_messages` derniers messages du `conversation_history` persisté dans MongoDB
+    (`loader(session_id, max_messages)`, projection `$slice` côté serveur).
+    """
+    def __init__(self, backend, loader: Callable[[str, int], Awaitable[list]], max_messages: int = 50):
+        self.backend = backend
+        self.loader = loader
+        self.max_messages = max_messages
+        self.hits = 0
+        self.misses = 0
+
+    @classmethod
+    def from_env(cls, loader: Callable[[str, int], Awaitable[list]]) -> "SessionMemoryStore":
+        # "memory" est propre à chaque processus : à réserver à un déploiement à un seul worker,
+        # sinon chaque worker garde sa propre copie et manque les messages reçus par les autres.
+        # "sqlite" (défaut) est partagé par les workers d'une machine ; "redis" par plusieurs machines.
+        kind = os.getenv("SESSION_STORE_BACKEND", "sqlite").lower()
+        max_sessions = int(os.getenv("SESSION_STORE_MAX_SESSIONS", "1000"))
+        max_bytes = int(os.getenv("SESSION_STORE_MAX_BYTES", str(64 * 1024 * 1024)))
+        idle_ttl = float(os.getenv("SESSION_STORE_IDLE_TTL_SECONDS", "1800"))
+        max_messages = int(os.getenv("SESSION_STORE_MAX_MESSAGES", "50"))
+
+        if kind == "memory":
+            backend = InMemorySessionBackend(max_sessions, max_bytes, idle_ttl)
+        elif kind == "sqlite":
+            path = os.getenv("SESSION_STORE_SQLITE_PATH", "/tmp/session_memory.sqlite3")
+            backend = SQLiteSessionBackend(path, max_sessions, max_bytes, idle_ttl)
+        elif kind == "redis":
+            url = os.getenv("SESSION_STORE_REDIS_URL", "redis://localhost:6379/0")
+            backend = RedisSessionBackend(url, max_sessions, max_bytes, idle_ttl)
+        else:
+            raise ValueError(f"SESSION_STORE_BACKEND inconnu : {kind}")
+        return cls(backend, loader, max_messages=max_messages)
+
+    async def get_messages(self, session_id: str) -> List[dict]:
+        messages = await self.backend.get(session_id)
+        if messages is not None:
+            self.hits += 1
+            return messages
+        self.misses += 1
+        persisted = await self.loader(session_id, self.max_messages)
+        # Les anciens messages sans `tokens` sont comptés hors de la boucle d'événements.
+        messages = await asyncio.to_thread(_compact, persisted[-self.max_messages:])
+        await self.backend.put(session_id, messages)
+        return messages
+
+    async def append(self, session_id: str, new_messages: List[dict]) -> List[dict]:
+        messages = await self.get_messages(session_id)
+        messages = (messages + _compact(new_messages))[-self.max_messages:]
+        await self.backend.put(session_id, messages)
+        return messages
+
+    async def stats(self) -> Dict[str, int]:
+        stats = await self.backend.stats()
+        stats.update({"hits": self.hits, "misses": self.misses, "max_messages": self.max_messages})
+        return stats
+
+session_memory = SessionMemoryStore.from_env(loader=load_last_messages)
@@ -0,0 +1,224 @@
+import asyncio
+import uuid
+from datetime import datetime
+from typing import Dict, List, Optional
+import numpy as np
+from pymongo import UpdateOne
+from services.analysis_service import GAP_THRESHOLD_MS, timestamp_to_ms
+from services.repository import chats_repository, analyses_repository, analysis_jobs_repository
+from services.rollup_service import refresh_rollups
+
+ROLE_CODES = {"user": 0, "assistant": 1}
+OTHER_ROLE = 2
+
+# Seuls le rôle, l'horodatage et la taille de chaque message sont transférés :
+# la taille est calculée côté serveur quand elle n'a pas été enregistrée.
+MESSAGES_PROJECTION_PIPELINE = [
+    {"$match": {"final_idea": {"$exists": True, "$ne": None}}},
+    {"$project": {
+        "_id": 0,
+        "session_id": 1,
+        "messages": {"$map": {
+            "input": {"$ifNull": ["$conversation_history", []]},
+            "as": "m",
+            "in": {
+                "role": "$$m.role",
+                "timestamp": "$$m.timestamp",
+                "ts_ms": "$$m.ts_ms",
+                "size": {"$ifNull": ["$$m.size", {"$strLenCP": {"$ifNull": ["$$m.content", ""]}}]},
+            },
+        }},
+    }},
+]
+
+def iso_timestamps_to_ms(timestamps: List[str]) -> np.ndarray:
+    """
+    Convertit des horodatages ISO 8601 en millisecondes epoch.
+    Le format écrit par le chat (`datetime.isoformat()` avec microsecondes et décalage,
+    ex. 2025-03-01T10:15:42.123456-05:00) est décodé en bloc : partie locale parsée
+    par NumPy, décalage lu directement dans les codes de caractères. Les autres
+    formats passent par timestamp_to_ms.
+    """
+    if not timestamps:
+        return np.empty(0, dtype=np.float64)
+    fixed = np.array(timestamps, dtype="U32")
+    codes = fixed.view(np.uint32).reshape(-1, 32)
+    vectorizable = (
+        (codes[:, 19] == ord("."))
+        & ((codes[:, 26] == ord("+")) | (codes[:, 26] == ord("-")))
+        & (codes[:, 29] == ord(":"))
+    )
+    result = np.empty(len(timestamps), dtype=np.float64)
+    if vectorizable.any():
+        local = fixed[vectorizable].astype("U26").astype("datetime64[us]").astype("datetime64[ms]").astype(np.int64)
+        c = codes[vectorizable].astype(np.int64)
+        sign = np.where(c[:, 26] == ord("-"), -1, 1)
+        offset_minutes = ((c[:, 27] - 48) * 10 + (c[:, 28] - 48)) * 60 + (c[:, 30] - 48) * 10 + (c[:, 31] - 48)
+        result[vectorizable] = local - sign * offset_minutes * 60000
+    for i in np.flatnonzero(~vectorizable):
+        result[i] = timestamp_to_ms(timestamps[i])
+    return result
+
+def sessions_to_arrays(sessions: List[dict]):
+    """
+    Aplatit les messages de plusieurs sessions en tableaux NumPy alignés :
+    indice de session, horodatage (ms epoch), code de rôle et taille.
+    `ts_ms` (enregistré à l'écriture) est utilisé tel quel ; les anciens messages sans
+    `ts_ms` voient leur horodatage ISO converti en bloc.
+    """
+    counts = np.fromiter((len(s["messages"]) for s in sessions), dtype=np.int64, count=len(sessions))
+    session_idx = np.repeat(np.arange(len(sessions), dtype=np.int64), counts)
+    messages = [m for s in sessions for m in s["messages"]]
+
+    role = np.fromiter((ROLE_CODES.get(m.get("role"), OTHER_ROLE) for m in messages), dtype=np.int8, count=len(messages))
+    size = np.fromiter((m.get("size") or 0 for m in messages), dtype=np.float64, count=len(messages))
+    ts_ms = np.fromiter(
+        (m["ts_ms"] if m.get("ts_ms") is not None else np.nan for m in messages),
+        dtype=np.float64, count=len(messages)
+    )
+    missing = np.flatnonzero(np.isnan(ts_ms))
+    if len(missing):
+        ts_ms[missing] = iso_timestamps_to_ms([messages[i]["timestamp"] for i in missing])
+    return session_idx, ts_ms, role, size
+
+def compute_stats_arrays(n_sessions: int, session_idx, ts_ms, role, size, gap_threshold_ms: float = GAP_THRESHOLD_MS) -> Dict[str, np.ndarray]:
+    """
+    Calcule en bloc, pour `n_sessions` sessions, les agrégats de compute_time_stats
+    et compute_size_stats à coups de tri, différences, masques et bincount.
+    """
+    order = np.lexsort((ts_ms, session_idx))
+    sid, ts, rl, sz = session_idx[order], ts_ms[order], role[order], size[order]
+
+    diff = ts[1:] - ts[:-1]
+    same_session = sid[1:] == sid[:-1]
+    gap = same_session & (diff > gap_threshold_ms)
+    active = same_session & ~gap
+    latency = same_session & (rl[:-1] == ROLE_CODES["user"]) & (rl[1:] == ROLE_CODES["assistant"])
+    next_sid = sid[1:]
+
+    user = rl == ROLE_CODES["user"]
+    assistant = rl == ROLE_CODES["assistant"]
+    return {
+        "total_messages": np.bincount(sid, minlength=n_sessions),
+        "active_ms": np.bincount(next_sid[active], weights=diff[active], minlength=n_sessions),
+        "num_gaps": np.bincount(next_sid[gap], minlength=n_sessions),
+        "latency_sum_ms": np.bincount(next_sid[latency], weights=diff[latency], minlength=n_sessions),
+        "latency_count": np.bincount(next_sid[latency], minlength=n_sessions),
+        "user_count": np.bincount(sid[user], minlength=n_sessions),
+        "user_size_sum": np.bincount(sid[user], weights=sz[user], minlength=n_sessions),
+        "assistant_count": np.bincount(sid[assistant], minlength=n_sessions),
+        "assistant_size_sum": np.bincount(sid[assistant], weights=sz[assistant], minlength=n_sessions),
+    }
+
+def stats_documents(stats: Dict[str, np.ndarray]) -> List[dict]:
+    """
+    Convertit les tableaux d'agrégats en documents {time_stats, size_stats} au format
+    de compute_time_stats / compute_size_stats.
+    """
+    with np.errstate(divide="ignore", invalid="ignore"):
+        avg_latency = np.where(stats["latency_count"] > 0, stats["latency_sum_ms"] / 1000.0 / stats["latency_count"], 0.0)
+        avg_user = np.where(stats["user_count"] > 0, stats["user_size_sum"] / stats["user_count"], 0)
+        avg_ai = np.where(stats["assistant_count"] > 0, stats["assistant_size_sum"] / stats["assistant_count"], 0)
+    duration = np.round(stats["active_ms"] / 60000.0, 2)
+    avg_latency = np.round(avg_latency, 2)
+
+    # Conversion en listes Python d'un bloc : l'accès élément par élément aux tableaux NumPy est lent.
+    rows = zip(
+        stats["total_messages"].tolist(),
+        duration.tolist(),
+        stats["num_gaps"].tolist(),
+        avg_latency.tolist(),
+        avg_user.tolist(),
+        avg_ai.tolist(),
+    )
+    return [
+        {
+            "time_stats": {
+                "total_messages": total_messages,
+                "total_duration_minutes": total_duration,
+                "num_gaps_over_30mins": num_gaps,
+                "user_returned_after_30mins": num_gaps > 0,
+                "avg_ai_latency_seconds": latency,
+            },
+            "size_stats": {
+                "avg_user_size": user_size,
+                "avg_ai_size": ai_size,
+            },
+        }
+        for total_messages, total_duration, num_gaps, latency, user_size, ai_size in rows
+    ]
+
+def compute_batch_stats(sessions: List[dict], gap_threshold_ms: float = GAP_THRESHOLD_MS) -> List[dict]:
+    if not sessions:
+        return []
+    arrays = sessions_to_arrays(sessions)
+    return stats_documents(compute_stats_arrays(len(sessions), *arrays, gap_threshold_ms=gap_threshold_ms))
+
+async def recompute_analysis_stats(job_id: Optional[str] = None, chunk_size: int = 2000, gap_threshold_minutes: float = 30):
+    """
+    Recalcule time_stats et size_stats de toutes les analyses existantes, par blocs de
+    `chunk_size` sessions lus par curseur, et les réécrit par `bulk_write`.
+    """
+    gap_threshold_ms = gap_threshold_minutes * 60 * 1000
+    processed = 0
+    updated = 0
+
+    async def flush(chunk):
+        nonlocal processed, updated
+        documents = await asyncio.to_thread(compute_batch_stats, chunk, gap_threshold_ms)
+        writes = [
+            UpdateOne({"session_id": s["session_id"]}, {"$set": doc})
+            for s, doc in zip(chunk, documents)
+        ]
+        if writes:
+            result = await analyses_repository.bulk_write(writes, ordered=False)
+            updated += result.modified_count
+        processed += len(chunk)
+        if job_id:
+            await analysis_jobs_repository.update_one(
+                {"_id": job_id},
+                {"$set": {"processed": processed, "updated": updated, "updated_at": datetime.utcnow()}}
+            )
+
+    chunk = []
+    cursor = await chats_repository.aggregate_cursor(MESSAGES_PROJECTION_PIPELINE, batchSize=chunk_size)
+    async for session in cursor:
+        chunk.append(session)
+        if len(chunk) >= chunk_size:
+            await flush(chunk)
+            chunk = []
+    await flush(chunk)
+    if updated:
+        await refresh_rollups()
+    return {"processed": processed, "updated": updated}
+
+_running_recomputes = set()
+
+async def start_stats_recompute(chunk_size: int = 2000, gap_threshold_minutes: float = 30) -> dict:
+    job_id = uuid.uuid4().hex
+    now = datetime.utcnow()
+    await analysis_jobs_repository.insert_one({
+        "_id": job_id,
+        "type": "stats_recompute",
+        "status": "running",
+        "request": {"chunk_size": chunk_size, "gap_threshold_minutes": gap_threshold_minutes},
+        "processed": 0,
+        "updated": 0,
+        "created_at": now,
+        "updated_at": now,
+    })
+
+    async def run():
+        try:
+            await recompute_analysis_stats(job_id, chunk_size, gap_threshold_minutes)
+            status = {"status": "done"}
+        except Exception as e:
+            status = {"status": "failed", "error": str(e)}
+        await analysis_jobs_repository.update_one(
+            {"_id": job_id}, {"$set": {**status, "finished_at": datetime.utcnow(), "updated_at": datetime.utcnow()}}
+        )
+
+    task = asyncio.create_task(run())
+    _running_recomputes.add(task)
+    task.add_done_callback(_running_recomputes.discard)
+    return {"job_id": job_id, "status": "running"}
@@ -0,0 +1,322 @@
+import ast
+import asyncio
+import hashlib
+import os
+from collections import Counter, defaultdict
+from datetime import datetime
+from typing import Dict, Iterable, List, Optional
+from pymongo import UpdateOne
+from services.local_themes import extract_local_themes
+from services.llm_gateway import llm_gateway
+from services.repository import MongoRepository
+from utils.prompt_config import KEYWORD_EXTRACTION_PROMPT_VERSION, THEME_CLASSIFICATION_PROMPT_VERSION
+from utils.prompt_registry import prompt_registry
+from utils.tokens import count_tokens
+
+# Budget de tokens d'un prompt de thèmes : au-delà, le corpus est découpé en plusieurs appels.
+THEME_PROMPT_TOKEN_BUDGET = int(os.getenv("THEME_PROMPT_TOKEN_BUDGET", "6000"))
+THEME_MAX_THEMES = int(os.getenv("THEME_MAX_THEMES", "12"))
+THEME_LLM_CONCURRENCY = int(os.getenv("THEME_LLM_CONCURRENCY", "4"))
+# Délai accordé à l'extraction par LLM en mode "auto" avant de se rabattre sur l'extraction locale.
+THEME_LLM_TIMEOUT_SECONDS = float(os.getenv("THEME_LLM_TIMEOUT_SECONDS", "20"))
+# Part d'idées classées "Other" au-delà de laquelle le jeu de thèmes est redécouvert.
+THEME_REDISCOVER_OTHER_RATIO = float(os.getenv("THEME_REDISCOVER_OTHER_RATIO", "0.25"))
+# Une nouvelle découverte n'a lieu qu'après ce nombre de nouvelles idées et ce délai depuis
+# la précédente : une part d'"Other" durablement élevée ne relance pas le modèle à chaque idée.
+THEME_REDISCOVER_MIN_NEW_IDEAS = int(os.getenv("THEME_REDISCOVER_MIN_NEW_IDEAS", "50"))
+THEME_REDISCOVER_COOLDOWN_SECONDS = float(os.getenv("THEME_REDISCOVER_COOLDOWN_SECONDS", "86400"))
+
+OTHER_THEME = "Other"
+THEMES_CACHE_ID = "themes"
+THEME_PROMPT_VERSION = f"{KEYWORD_EXTRACTION_PROMPT_VERSION}+{THEME_CLASSIFICATION_PROMPT_VERSION}"
+ASSIGNMENTS_LOOKUP_CHUNK = 1000
+
+theme_cache_repository = MongoRepository("theme_cache")
+theme_assignments_repository = MongoRepository("theme_assignments")
+
+def normalize_idea(text) -> str:
+    return " ".join(str(text).split())
+
+def idea_hash(text: str) -> str:
+    return hashlib.sha1(text.encode("utf-8")).hexdigest()
+
+def idea_set_hash(hashes: Iterable[str]) -> str:
+    """
+    Empreinte de l'ensemble des idées (doublons compris), indépendante de leur ordre.
+    """
+    return hashlib.sha256("\n".join(sorted(hashes)).encode("utf-8")).hexdigest()
+
+def parse_python_dict(raw: str) -> dict:
+    """
+    Lit le dictionnaire Python renvoyé par le modèle sans jamais l'exécuter.
+    """
+    cleaned = raw.strip().replace("```python", "").replace("```", "").strip()
+    if not (cleaned.startswith("{") and cleaned.endswith("}")):
+        return {}
+    try:
+        value = ast.literal_eval(cleaned)
+    except (ValueError, SyntaxError):
+        return {}
+    return value if isinstance(value, dict) else {}
+
+def chunk_by_tokens(texts: List[str], budget: int = THEME_PROMPT_TOKEN_BUDGET) -> List[List[int]]:
+    """
+    Découpe les textes (par indices) en lots dont la somme des tokens tient dans `budget`.
+    """
+    chunks, current, used = [], [], 0
+    for i, text in enumerate(texts):
+        tokens = count_tokens(text) + 4
+        if current and used + tokens > budget:
+            chunks.append(current)
+            current, used = [], 0
+        current.append(i)
+        used += tokens
+    if current:
+        chunks.append(current)
+    return chunks
+
+def _complete(prompt: str, system: str) -> str:
+    return llm_gateway.complete(prompt, system, temperature=0.3)
+
+def _extract_theme_frequencies(texts: List[str]) -> Dict[str, float]:
+    prompt = prompt_registry.keyword_extraction_prompt(texts).text
+    raw_response = _complete(prompt, "You are an expert in semantic keyword extraction and frequency analysis.")
+    return {
+        str(theme).strip(): freq for theme, freq in parse_python_dict(raw_response).items()
+        if str(theme).strip() and isinstance(freq, (int, float)) and not isinstance(freq, bool)
+    }
+
+def _classify_chunk(ideas: List[str], themes: List[str]) -> List[str]:
+    prompt = prompt_registry.theme_classification_prompt(themes + [OTHER_THEME], ideas).text
+    raw_response = _complete(prompt, "You are an expert in thematic classification.")
+    parsed = parse_python_dict(raw_response)
+    by_label = {theme.lower(): theme for theme in themes}
+    return [
+        by_label.get(str(parsed.get(i, parsed.get(str(i), ""))).strip().lower(), OTHER_THEME)
+        for i in range(len(ideas))
+    ]
+
+async def _gather_limited(calls: list) -> list:
+    """
+    Exécute des appels bloquants au modèle dans des threads, `THEME_LLM_CONCURRENCY` à la fois.
+    Un appel en échec renvoie None au lieu d'interrompre les autres.
+    """
+    semaphore = asyncio.Semaphore(THEME_LLM_CONCURRENCY)
+
+    async def run(func, *args):
+        async with semaphore:
+            try:
+                return await asyncio.to_thread(func, *args)
+            except Exception as e:
+                print(f"Erreur lors de l'extraction des thèmes : {e}")
+                return None
+
+    return await asyncio.gather(*(run(*call) for call in calls))
+
+async def discover_themes(texts: List[str]) -> List[str]:
+    """
+    Découverte du jeu de thèmes en map-reduce : chaque lot de textes tenant dans un prompt
+    produit ses thèmes et fréquences (map), puis les fréquences sont pondérées par la
+    taille du lot et fusionnées par libellé (reduce). Seuls les THEME_MAX_THEMES premiers
+    thèmes sont conservés.
+    """
+    chunks = await asyncio.to_thread(chunk_by_tokens, texts)
+    results = await _gather_limited([(_extract_theme_frequencies, [texts[i] for i in chunk]) for chunk in chunks])
+    weights = defaultdict(float)
+    labels = {}
+    for chunk, frequencies in zip(chunks, results):
+        for theme, freq in (frequencies or {}).items():
+            key = theme.lower()
+            labels.setdefault(key, theme)
+            weights[key] += freq * len(chunk)
+    weights.pop(OTHER_THEME.lower(), None)
+    return [labels[key] for key in sorted(weights, key=weights.get, reverse=True)[:THEME_MAX_THEMES]]
+
+async def classify_ideas(ideas: List[str], themes: List[str]) -> List[Optional[str]]:
+    """
+    Rattache chaque idée à un thème existant, par lots tenant dans un prompt.
+    Les idées d'un lot en échec restent à None et seront reclassées à la prochaine demande.
+    """
+    budget = max(THEME_PROMPT_TOKEN_BUDGET - count_tokens(" ".join(themes)), THEME_PROMPT_TOKEN_BUDGET // 2)
+    chunks = await asyncio.to_thread(chunk_by_tokens, ideas, budget)
+    results = await _gather_limited([(_classify_chunk, [ideas[i] for i in chunk], themes) for chunk in chunks])
+    assigned: List[Optional[str]] = [None] * len(ideas)
+    for chunk, labels in zip(chunks, results):
+        if labels:
+            for i, label in zip(chunk, labels):
+                assigned[i] = label
+    return assigned
+
+class ThemeDistributionService:
+    """
+    Distribution des thèmes des idées finales, calculée de façon incrémentale.
+    - Le résultat est mis en cache sous l'empreinte de l'ensemble des idées : tant qu'aucune
+      idée n'est ajoutée ni supprimée, aucun appel au modèle n'est fait.
+    - Chaque idée est classée une seule fois (collection `theme_assignments`) : seules les
+      nouvelles idées sont envoyées au modèle, contre le jeu de thèmes existant.
+    - Le jeu de thèmes n'est redécouvert que s'il n'existe pas encore, ou si trop d'idées
+      tombent dans "Other" alors qu'assez de nouvelles idées sont arrivées et que le délai
+      depuis la dernière découverte est écoulé. Les classements dont le thème figure
+      toujours dans le nouveau jeu sont conservés ; seules les autres idées sont reclassées.
+    """
+    def __init__(self):
+        self._lock = asyncio.Lock()
+
+    async def _cached(self) -> Optional[dict]:
+        cached = await theme_cache_repository.find_one({"_id": THEMES_CACHE_ID})
+        if cached and cached.get("prompt_version") != THEME_PROMPT_VERSION:
+            return None
+        return cached
+
+    async def get_distribution(self, ideas: List[str]) -> List[dict]:
+        texts = [t for t in (normalize_idea(i) for i in ideas) if t]
+        if not texts:
+            return []
+        hashes = [idea_hash(t) for t in texts]
+        set_hash = idea_set_hash(hashes)
+
+        cached = await self._cached()
+        if cached and cached.get("idea_set_hash") == set_hash:
+            return cached["distribution"]
+        async with self._lock:
+            cached = await self._cached()
+            if cached and cached.get("idea_set_hash") == set_hash:
+                return cached["distribution"]
+            return await self._update(texts, hashes, set_hash, cached)
+
+    async def _load_assignments(self, hashes: List[str], themes_version: int) -> Dict[str, str]:
+        assignments = {}
+        for start in range(0, len(hashes), ASSIGNMENTS_LOOKUP_CHUNK):
+            docs = await theme_assignments_repository.find(
+                {"_id": {"$in": hashes[start:start + ASSIGNMENTS_LOOKUP_CHUNK]}, "themes_version": themes_version},
+                {"theme": 1}
+            )
+            assignments.update({doc["_id"]: doc["theme"] for doc in docs})
+        return assignments
+
+    def _rediscovery_due(self, cached: dict, assignments: Dict[str, str], idea_count: int) -> bool:
+        if not assignments:
+            return False
+        other_ratio = sum(1 for theme in assignments.values() if theme == OTHER_THEME) / len(assignments)
+        if other_ratio <= THEME_REDISCOVER_OTHER_RATIO:
+            return False
+        if idea_count - cached.get("discovered_ideas", 0) < THEME_REDISCOVER_MIN_NEW_IDEAS:
+            return False
+        discovered_at = cached.get("discovered_at")
+        return discovered_at is None or (datetime.utcnow() - discovered_at).total_seconds() >= THEME_REDISCOVER_COOLDOWN_SECONDS
+
+    async def _keep_valid_assignments(self, assignments: Dict[str, str], themes: List[str], themes_version: int) -> Dict[str, str]:
+        """
+        Reporte dans la nouvelle version les classements dont le thème existe toujours
+        (hors "Other", dont les idées doivent être reclassées).
+        """
+        by_label = {theme.lower(): theme for theme in themes}
+        kept = {h: by_label[label.lower()] for h, label in assignments.items() if label.lower() in by_label}
+        if kept:
+            now = datetime.utcnow()
+            await theme_assignments_repository.bulk_write([
+                UpdateOne({"_id": h}, {"$set": {"theme": label, "themes_version": themes_version, "updated_at": now}})
+                for h, label in kept.items()
+            ], ordered=False)
+        return kept
+
+    async def _update(self, texts: List[str], hashes: List[str], set_hash: str, cached: Optional[dict]) -> List[dict]:
+        unique = dict(zip(hashes, texts))
+        cached = cached or {}
+        themes = cached.get("themes")
+        themes_version = cached.get("themes_version", 0)
+        discovered_ideas = cached.get("discovered_ideas", 0)
+        discovered_at = cached.get("discovered_at")
+        assignments = await self._load_assignments(list(unique), themes_version) if themes else {}
+
+        if not themes or self._rediscovery_due(cached, assignments, len(unique)):
+            discovered = await discover_themes(list(unique.values()))
+            if discovered:
+                themes, themes_version = discovered, themes_version + 1
+                assignments = await self._keep_valid_assignments(assignments, themes, themes_version)
+                discovered_ideas, discovered_at = len(unique), datetime.utcnow()
+            elif not themes:
+                return []
+
+        new_hashes = [h for h in unique if h not in assignments]
+        if new_hashes:
+            labels = await classify_ideas([unique[h] for h in new_hashes], themes)
+            writes = []
+            for h, label in zip(new_hashes, labels):
+                if label is not None:
+                    assignments[h] = label
+                    writes.append(UpdateOne(
+                        {"_id": h},
+                        {"$set": {"theme": label, "themes_version": themes_version, "updated_at": datetime.utcnow()}},
+                        upsert=True
+                    ))
+            if writes:
+                await theme_assignments_repository.bulk_write(writes, ordered=False)
+
+        classified = [assignments[h] for h in hashes if h in assignments]
+        counts = Counter(classified)
+        total = len(classified) or 1
+        distribution = [{"_id": theme, "count": round(n / total, 2)} for theme, n in counts.most_common()]
+        complete = len(classified) == len(hashes)
+
+        await theme_cache_repository.update_one(
+            {"_id": THEMES_CACHE_ID},
+            {"$set": {
+                "prompt_version": THEME_PROMPT_VERSION,
+                "themes": themes,
+                "themes_version": themes_version,
+                "discovered_ideas": discovered_ideas,
+                "discovered_at": discovered_at,
+                # Un classement incomplet (lot en échec) n'est pas mis en cache : il sera repris.
+                "idea_set_hash": set_hash if complete else None,
+                "distribution": distribution,
+                "total_ideas": len(hashes),
+                "updated_at": datetime.utcnow(),
+            }},
+            upsert=True
+        )
+        return distribution
+
+theme_service = ThemeDistributionService()
+
+_local_cache: Dict[str, List[dict]] = {}
+_pending_llm_updates = set()
+
+async def local_distribution(ideas: List[str]) -> List[dict]:
+    """
+    Extraction locale (voir local_themes), mémorisée pour le dernier ensemble d'idées.
+    """
+    texts = [t for t in (normalize_idea(i) for i in ideas) if t]
+    set_hash = idea_set_hash(idea_hash(t) for t in texts)
+    if set_hash not in _local_cache:
+        result = await asyncio.to_thread(extract_local_themes, texts)
+        _local_cache.clear()
+        _local_cache[set_hash] = result
+    return _local_cache[set_hash]
+
+async def get_theme_distribution(ideas: List[str], engine: str = "auto") -> List[dict]:
+    """
+    Distribution des thèmes selon le moteur demandé :
+    - "llm" : classement incrémental par le modèle (ThemeDistributionService) ;
+    - "local" : extraction TF-IDF hors ligne ;
+    - "auto" : le modèle, avec repli sur l'extraction locale s'il échoue ou dépasse
+      THEME_LLM_TIMEOUT_SECONDS. Le calcul par le modèle se poursuit alors en arrière-plan
+      et alimente le cache pour les demandes suivantes.
+    """
+    if engine == "local":
+        return await local_distribution(ideas)
+    if engine == "llm":
+        return await theme_service.get_distribution(ideas)
+
+    task = asyncio.create_task(theme_service.get_distribution(ideas))
+    _pending_llm_updates.add(task)
+    task.add_done_callback(_pending_llm_updates.discard)
+    try:
+        result = await asyncio.wait_for(asyncio.shield(task), THEME_LLM_TIMEOUT_SECONDS)
+        if result:
+            return result
+    except asyncio.TimeoutError:
+        print(f"Extraction des thèmes par LLM trop lente (> {THEME_LLM_TIMEOUT_SECONDS}s), repli sur l'extraction locale")
+    except Exception as e:
+        print(f"Extraction des thèmes par LLM indisponible, repli sur l'extraction locale : {e}")
+    return await local_distribution(ideas)
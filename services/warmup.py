@@ -0,0 +1,91 @@
+import asyncio
+import os
+from services.analysis_jobs import analysis_pool
+from services.indexes import ENSURE_INDEXES_ON_STARTUP, ensure_indexes
+from services.llm_gateway import llm_gateway
+from services.migrations import migrate_created_at_to_date
+from services.repository import async_mongo_manager
+from utils.startup import startup_report
+from utils.tokens import preload_encoding
+
+LLM_WARMUP_ON_STARTUP = os.getenv("LLM_WARMUP_ON_STARTUP", "true").lower() == "true"
+# Par défaut, un modèle injoignable au démarrage n'empêche pas le worker d'être déclaré prêt.
+READINESS_REQUIRES_LLM = os.getenv("READINESS_REQUIRES_LLM", "false").lower() == "true"
+MONGO_PING_TIMEOUT_SECONDS = float(os.getenv("MONGO_PING_TIMEOUT_SECONDS", "2"))
+# Migrations idempotentes rejouées à chaque démarrage (sans effet une fois appliquées).
+MONGO_MIGRATE_ON_STARTUP = os.getenv("MONGO_MIGRATE_ON_STARTUP", "true").lower() == "true"
+
+async def ping_mongo(timeout: float = MONGO_PING_TIMEOUT_SECONDS):
+    await asyncio.wait_for(async_mongo_manager.client.admin.command("ping"), timeout)
+
+async def warm_up():
+    """
+    Préchauffage lancé au démarrage, en tâche de fond : le worker accepte les connexions
+    tout de suite (liveness) mais ne se déclare prêt (readiness) qu'une fois MongoDB
+    joignable, les migrations appliquées, les index vérifiés, l'encodage des tokens chargé
+    et les connexions au modèle ouvertes.
+    """
+    with startup_report.phase("warmup.mongo"):
+        try:
+            await ping_mongo()
+            startup_report.check("mongo", True)
+        except Exception as e:
+            startup_report.check("mongo", False, e)
+
+    if MONGO_MIGRATE_ON_STARTUP and startup_report.checks["mongo"] == "ok":
+        with startup_report.phase("warmup.migrations"):
+            try:
+                result = await migrate_created_at_to_date()
+                if result["converted"] or result["remaining"]:
+                    print(f"Migration des dates created_at : {result}")
+            except Exception as e:
+                print(f"Migration des dates created_at impossible : {e}")
+
+    if ENSURE_INDEXES_ON_STARTUP and startup_report.checks["mongo"] == "ok":
+        with startup_report.phase("warmup.indexes"):
+            await ensure_indexes()
+
+    # Démarre les workers d'analyse : leur première tâche reprend les jobs laissés
+    # en cours par un arrêt précédent, puis la reprise est répétée périodiquement.
+    if startup_report.checks["mongo"] == "ok":
+        analysis_pool.ensure_started()
+
+    # Chargement (et téléchargement éventuel) de l'encodage hors de la boucle d'événements,
+    # avant le premier prompt. En cas d'échec, le comptage approximatif prend le relais.
+    with startup_report.phase("warmup.tokenizer"):
+        try:
+            await asyncio.to_thread(preload_encoding)
+            startup_report.check("tokenizer", True)
+        except Exception as e:
+            startup_report.check("tokenizer", False, e)
+
+    if LLM_WARMUP_ON_STARTUP:
+        with startup_report.phase("warmup.llm"):
+            try:
+                await llm_gateway.warmup()
+                startup_report.check("llm", True)
+            except Exception as e:
+                startup_report.check("llm", False, e)
+
+    startup_report.mark_warmed_up()
+    await readiness()
+
+async def readiness() -> dict:
+    """
+    État de préparation du worker : préchauffage terminé et MongoDB joignable
+    (et le modèle, si READINESS_REQUIRES_LLM).
+    """
+    if not startup_report.warmed_up:
+        return {"ready": False, "reason": "warming up", "checks": dict(startup_report.checks)}
+    checks = {}
+    try:
+        await ping_mongo()
+        checks["mongo"] = "ok"
+    except Exception as e:
+        checks["mongo"] = f"error: {e}"
+    llm = startup_report.checks.get("llm", "skipped")
+    checks["llm"] = llm
+    ready = checks["mongo"] == "ok" and (not READINESS_REQUIRES_LLM or llm == "ok")
+    if ready:
+        startup_report.mark_ready()
+    return {"ready": ready, "checks": checks}
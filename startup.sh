@@ -1,2 +1,5 @@
 #!/bin/bash
-gunicorn main:app -w 4 -k uvicorn.workers.UvicornWorker --bind 0.0.0.0:8000 --timeout 120
\ No newline at end of file
+# Les 4 workers partagent la mémoire conversationnelle via un fichier SQLite local
+# (SESSION_STORE_BACKEND=redis si l'application tourne sur plusieurs instances).
+export SESSION_STORE_BACKEND=${SESSION_STORE_BACKEND:-sqlite}
+gunicorn main:app -w 4 -k uvicorn.workers.UvicornWorker --bind 0.0.0.0:8000 --timeout 120
@@ -1,3 +1,105 @@
-from typing import Any
+import asyncio
+import os
+import random
+import time
+from typing import Optional
+from pymongo.errors import OperationFailure
+from services.repository import config_repository
 
-config_cache: Any = None
+CONFIG_CACHE_TTL_SECONDS = float(os.getenv("CONFIG_CACHE_TTL_SECONDS", "30"))
+# Reprise du change stream après une erreur (bascule du primaire, coupure réseau).
+CONFIG_WATCH_BACKOFF_BASE_SECONDS = float(os.getenv("CONFIG_WATCH_BACKOFF_BASE_SECONDS", "1"))
+CONFIG_WATCH_BACKOFF_MAX_SECONDS = float(os.getenv("CONFIG_WATCH_BACKOFF_MAX_SECONDS", "60"))
+# Codes renvoyés par un serveur sans change streams (serveur autonome) : inutile de réessayer.
+CHANGE_STREAMS_UNSUPPORTED_CODES = {40573}
+
+class ConfigCache:
+    """
+    Cache de la configuration du chat, indexé par le numéro de version du document `config`.
+    - Chaque entrée expire après `ttl` secondes : un worker sert au pire une configuration
+      vieille de `ttl` secondes, même sans notification.
+    - Quand MongoDB le permet (replica set), un change stream invalide le cache de tous
+      les workers dès qu'une mise à jour est écrite ; il est rouvert après une erreur,
+      avec un délai croissant, et arrêté par `stop` à l'arrêt de l'application.
+    """
+    def __init__(self, ttl: float = CONFIG_CACHE_TTL_SECONDS):
+        self.ttl = ttl
+        self.config: Optional[dict] = None
+        self.version: Optional[int] = None
+        self._fetched_at = 0.0
+        self._lock = asyncio.Lock()
+        self._watch_task: Optional[asyncio.Task] = None
+
+    def is_fresh(self) -> bool:
+        return self.config is not None and time.monotonic() - self._fetched_at < self.ttl
+
+    async def get(self) -> Optional[dict]:
+        self._ensure_watcher()
+        if self.is_fresh():
+            return self.config
+        async with self._lock:
+            if not self.is_fresh():
+                await self.refresh()
+        return self.config
+
+    async def refresh(self) -> Optional[dict]:
+        config = await config_repository.find_one({}, {"_id": 0})
+        self.set(config)
+        return config
+
+    def set(self, config: Optional[dict]):
+        self.config = config
+        self.version = config.get("version", 0) if config else None
+        self._fetched_at = time.monotonic()
+
+    def invalidate(self):
+        self._fetched_at = 0.0
+
+    def _ensure_watcher(self):
+        if self._watch_task is None:
+            self._watch_task = asyncio.get_running_loop().create_task(self._watch())
+
+    async def stop(self):
+        if self._watch_task:
+            self._watch_task.cancel()
+            await asyncio.gather(self._watch_task, return_exceptions=True)
+            self._watch_task = None
+
+    async def _watch(self):
+        """
+        Écoute les modifications de la collection `config`. Après une erreur, le flux est
+        rouvert (en reprenant au dernier événement reçu si possible) et le cache invalidé,
+        une modification ayant pu être manquée. Si les change streams ne sont pas
+        disponibles (serveur autonome), on se contente de l'expiration par TTL.
+        """
+        resume_token = None
+        attempt = 0
+        while True:
+            try:
+                async with await config_repository.collection.watch(resume_after=resume_token) as stream:
+                    attempt = 0
+                    async for change in stream:
+                        resume_token = stream.resume_token
+                        self.invalidate()
+                reason = "flux fermé par le serveur"
+            except asyncio.CancelledError:
+                raise
+            except OperationFailure as e:
+                if e.code in CHANGE_STREAMS_UNSUPPORTED_CODES:
+                    print(f"Change stream indisponible pour la configuration, invalidation par TTL uniquement : {e}")
+                    return
+                # Jeton de reprise trop ancien ou invalide : le flux repart de l'instant présent.
+                resume_token = None
+                reason = f"{type(e).__name__}: {e}"
+            except Exception as e:
+                reason = f"{type(e).__name__}: {e}"
+            await self._backoff(attempt, reason)
+            attempt += 1
+
+    async def _backoff(self, attempt: int, reason: str):
+        self.invalidate()
+        delay = random.uniform(0, min(CONFIG_WATCH_BACKOFF_MAX_SECONDS, CONFIG_WATCH_BACKOFF_BASE_SECONDS * (2 ** attempt)))
+        print(f"Change stream de la configuration interrompu ({reason}), reprise dans {delay:.1f}s")
+        await asyncio.sleep(delay)
+
+config_cache = ConfigCache()
@@ -0,0 +1,153 @@
+import asyncio
+import hashlib
+import json
+import os
+import time
+from collections import OrderedDict
+from dataclasses import dataclass, field
+from typing import Any, Awaitable, Callable, Dict, Iterable, Optional, Tuple
+from fastapi import Request, Response
+from fastapi.encoders import jsonable_encoder
+
+HTTP_CACHE_TTL_SECONDS = float(os.getenv("HTTP_CACHE_TTL_SECONDS", "30"))
+HTTP_CACHE_MAX_ENTRIES = int(os.getenv("HTTP_CACHE_MAX_ENTRIES", "512"))
+# Les clients doivent revalider à chaque appel : ils renvoient l'ETag et reçoivent un 304
+# tant que la réponse n'a pas changé.
+CACHE_CONTROL = "private, no-cache"
+
+@dataclass
+class Payload:
+    """
+    Contenu d'une réponse accompagné d'en-têtes à mettre en cache avec lui.
+    """
+    content: Any
+    headers: Dict[str, str] = field(default_factory=dict)
+
+@dataclass
+class CachedResponse:
+    body: bytes
+    etag: str
+    headers: Dict[str, str]
+    generations: Tuple[int, ...]
+    expires_at: float
+
+def _etag_matches(if_none_match: Optional[str], etag: str) -> bool:
+    if not if_none_match:
+        return False
+    for candidate in if_none_match.split(","):
+        candidate = candidate.strip()
+        if candidate == "*" or candidate.removeprefix("W/") == etag:
+            return True
+    return False
+
+class ResponseCache:
+    """
+    Cache des réponses JSON des endpoints de lecture de l'administration.
+    - Chaque entrée dépend de collections ; une écriture incrémente le compteur de version
+      de la collection (`invalidate`), ce qui périme les entrées qui en dépendent.
+    - Les écritures faites par un autre worker ne sont pas notifiées : une entrée expire
+      de toute façon après son `ttl`.
+    - Les requêtes identiques simultanées attendent le même calcul (single-flight).
+    - L'ETag est l'empreinte du corps de la réponse : `If-None-Match` donne un 304.
+    """
+    def __init__(self, max_entries: int = HTTP_CACHE_MAX_ENTRIES):
+        self.max_entries = max_entries
+        self._entries: "OrderedDict[str, CachedResponse]" = OrderedDict()
+        self._inflight: Dict[str, asyncio.Future] = {}
+        self._generations: Dict[str, int] = {}
+        self.hits = 0
+        self.misses = 0
+        self.coalesced = 0
+        self.not_modified = 0
+
+    def invalidate(self, *collections: str):
+        for collection in collections:
+            self._generations[collection] = self._generations.get(collection, 0) + 1
+
+    def _current(self, depends_on: Iterable[str]) -> Tuple[int, ...]:
+        return tuple(self._generations.get(collection, 0) for collection in depends_on)
+
+    def _fresh(self, key: str, generations: Tuple[int, ...]) -> Optional[CachedResponse]:
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        if entry.generations != generations or entry.expires_at <= time.monotonic():
+            del self._entries[key]
+            return None
+        self._entries.move_to_end(key)
+        return entry
+
+    def _store(self, key: str, entry: CachedResponse):
+        self._entries[key] = entry
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    async def _compute(self, key: str, compute: Callable[[], Awaitable[Any]], depends_on: Tuple[str, ...], ttl: float) -> CachedResponse:
+        generations = self._current(depends_on)
+        result = await compute()
+        payload = result if isinstance(result, Payload) else Payload(result)
+        body = json.dumps(
+            jsonable_encoder(payload.content), ensure_ascii=False, allow_nan=False, separators=(",", ":")
+        ).encode("utf-8")
+        entry = CachedResponse(
+            body=body,
+            etag=f'"{hashlib.sha1(body).hexdigest()}"',
+            headers=payload.headers,
+            generations=generations,
+            expires_at=time.monotonic() + ttl,
+        )
+        # Une écriture survenue pendant le calcul rend l'entrée déjà périmée : inutile de la garder.
+        if generations == self._current(depends_on):
+            self._store(key, entry)
+        return entry
+
+    async def get(self, key: str, compute: Callable[[], Awaitable[Any]], depends_on: Iterable[str], ttl: float) -> CachedResponse:
+        depends_on = tuple(depends_on)
+        generations = self._current(depends_on)
+        entry = self._fresh(key, generations)
+        if entry is not None:
+            self.hits += 1
+            return entry
+        flight = self._inflight.get(key)
+        if flight is not None:
+            self.coalesced += 1
+            return await asyncio.shield(flight)
+        self.misses += 1
+        flight = asyncio.ensure_future(self._compute(key, compute, depends_on, ttl))
+        self._inflight[key] = flight
+        flight.add_done_callback(lambda done: self._inflight.pop(key) if self._inflight.get(key) is done else None)
+        # Le calcul continue même si le client qui l'a lancé se déconnecte : d'autres l'attendent.
+        return await asyncio.shield(flight)
+
+    def stats(self) -> dict:
+        return {
+            "entries": len(self._entries),
+            "max_entries": self.max_entries,
+            "hits": self.hits,
+            "misses": self.misses,
+            "coalesced": self.coalesced,
+            "not_modified": self.not_modified,
+            "generations": dict(self._generations),
+        }
+
+response_cache = ResponseCache()
+
+async def cached_json(
+    request: Request,
+    compute: Callable[[], Awaitable[Any]],
+    depends_on: Iterable[str],
+    ttl: float,
+    cache: ResponseCache = response_cache,
+) -> Response:
+    """
+    Sert la réponse JSON de `compute` depuis le cache, ou un 304 si le client possède déjà
+    cette version. La clé est le chemin et les paramètres de la requête.
+    """
+    key = f"{request.url.path}?{request.url.query}"
+    entry = await cache.get(key, compute, depends_on, ttl)
+    headers = {"ETag": entry.etag, "Cache-Control": CACHE_CONTROL}
+    if _etag_matches(request.headers.get("if-none-match"), entry.etag):
+        cache.not_modified += 1
+        return Response(status_code=304, headers=headers)
+    return Response(content=entry.body, media_type="application/json", headers={**entry.headers, **headers})
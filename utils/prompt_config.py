@@ -96,11 +96,8 @@ def get_chat_prompt(tone, genderTone,  text_size, intervalValue):
 
     return system_prompt.strip()
 
-def get_keyword_extraction_prompt(texts):
-    """
-    Génère le prompt pour extraire les thèmes principaux et leur fréquence.
-    """
-    return f"""
+KEYWORD_EXTRACTION_PROMPT_VERSION = "keywords-v1"
+KEYWORD_EXTRACTION_TEMPLATE = """
     Analyze the following texts and extract the **most frequent themes or concepts**.
     - Group similar words (e.g., "AI" and "Artificial Intelligence" should be combined).
     - Compute the relative frequency of each theme.
@@ -110,22 +107,41 @@ def get_keyword_extraction_prompt(texts):
     {{'science fiction': 0.25, 'adventure': 0.2, 'technology': 0.15, 'space': 0.1, 'AI': 0.3}}
 
     Texts:
-    \"\"\"{" ".join(texts)}\"\"\"
+    \"\"\"{texts}\"\"\"
     """
 
-def get_analysis_prompt(conversation_history, final_idea):
+def get_keyword_extraction_prompt(texts):
     """
-    Génère le prompt pour analyser l'originalité, l'influence de l'assistant et le matching de l'idée finale avec la conversation.
+    Génère le prompt pour extraire les thèmes principaux et leur fréquence.
     """
+    return KEYWORD_EXTRACTION_TEMPLATE.format(texts=" ".join(texts))
 
-    user_messages = "\n".join(
-        [f"User: {msg['content']}" for msg in conversation_history if msg["role"] == "user"]
-    )
-    assistant_messages = "\n".join(
-        [f"Assistant: {msg['content']}" for msg in conversation_history if msg["role"] == "assistant"]
+THEME_CLASSIFICATION_PROMPT_VERSION = "themes-classify-v1"
+THEME_CLASSIFICATION_TEMPLATE = """
+    Assign each of the following numbered ideas to exactly one of these themes:
+    {themes}
+
+    - Use 'Other' only when none of the themes fits.
+    - Return ONLY a **Python dictionary** mapping each idea number to its theme, in the following format:
+
+    Expected response (example):
+    {{0: 'technology', 1: 'adventure', 2: 'Other'}}
+
+    Ideas:
+    {ideas}
+    """
+
+def get_theme_classification_prompt(themes, ideas):
+    """
+    Génère le prompt pour rattacher chaque idée numérotée à l'un des thèmes existants.
+    """
+    return THEME_CLASSIFICATION_TEMPLATE.format(
+        themes="\n    ".join(f"- {theme}" for theme in themes),
+        ideas="\n    ".join(f"{i}. {idea}" for i, idea in enumerate(ideas))
     )
 
-    return f"""
+ANALYSIS_PROMPT_VERSION = "analysis-v1"
+ANALYSIS_TEMPLATE = """
     The following is a conversation between the user and the AI assistant.
 
     **User messages:**
@@ -191,3 +207,21 @@ def get_analysis_prompt(conversation_history, final_idea):
             }}
         }}
     """
+
+def get_analysis_prompt(conversation_history, final_idea):
+    """
+    Génère le prompt pour analyser l'originalité, l'influence de l'assistant et le matching de l'idée finale avec la conversation.
+    """
+
+    user_messages = "\n".join(
+        [f"User: {msg['content']}" for msg in conversation_history if msg["role"] == "user"]
+    )
+    assistant_messages = "\n".join(
+        [f"Assistant: {msg['content']}" for msg in conversation_history if msg["role"] == "assistant"]
+    )
+
+    return ANALYSIS_TEMPLATE.format(
+        user_messages=user_messages,
+        assistant_messages=assistant_messages,
+        final_idea=final_idea
+    )
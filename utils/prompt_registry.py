@@ -0,0 +1,80 @@
+import json
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import List, Optional
+from utils.prompt_config import (
+    get_chat_prompt,
+    get_analysis_prompt,
+    get_keyword_extraction_prompt,
+    get_theme_classification_prompt,
+    ANALYSIS_PROMPT_VERSION,
+    KEYWORD_EXTRACTION_PROMPT_VERSION,
+    THEME_CLASSIFICATION_PROMPT_VERSION,
+)
+from utils.tokens import count_tokens
+
+CHAT_PROMPT_VERSION = "chat-v1"
+
+@dataclass(frozen=True)
+class CompiledPrompt:
+    name: str
+    version: str
+    text: str
+    token_count: int
+
+class PromptRegistry:
+    """
+    Point d'accès unique aux prompts.
+    Le prompt système du chat ne dépend que de la configuration : il est compilé une
+    seule fois par version de configuration puis resservi tel quel, avec son nombre
+    de tokens déjà calculé.
+    """
+    def __init__(self, max_system_prompts: int = 16):
+        self.max_system_prompts = max_system_prompts
+        self._system_prompts: "OrderedDict[tuple, CompiledPrompt]" = OrderedDict()
+
+    @staticmethod
+    def _system_prompt_key(config: dict) -> tuple:
+        interval = config.get("intervalValue")
+        return (
+            config.get("version"),
+            config.get("tone"),
+            config.get("genderTone"),
+            config.get("textSize"),
+            json.dumps(interval, sort_keys=True, default=str),
+        )
+
+    def system_prompt(self, config: Optional[dict]) -> CompiledPrompt:
+        config = config or {}
+        key = self._system_prompt_key(config)
+        compiled = self._system_prompts.get(key)
+        if compiled is not None:
+            self._system_prompts.move_to_end(key)
+            return compiled
+
+        text = get_chat_prompt(
+            config.get("tone"),
+            config.get("genderTone"),
+            config.get("textSize"),
+            config.get("intervalValue"),
+        )
+        version = f"{CHAT_PROMPT_VERSION}+config-{config.get('version', 0)}"
+        compiled = CompiledPrompt("chat_system", version, text, count_tokens(text))
+        self._system_prompts[key] = compiled
+        while len(self._system_prompts) > self.max_system_prompts:
+            self._system_prompts.popitem(last=False)
+        return compiled
+
+    def analysis_prompt(self, conversation_history: List[dict], final_idea: str) -> CompiledPrompt:
+        text = get_analysis_prompt(conversation_history, final_idea)
+        return CompiledPrompt("analysis", ANALYSIS_PROMPT_VERSION, text, count_tokens(text))
+
+    def keyword_extraction_prompt(self, texts: List[str]) -> CompiledPrompt:
+        text = get_keyword_extraction_prompt(texts)
+        return CompiledPrompt("keyword_extraction", KEYWORD_EXTRACTION_PROMPT_VERSION, text, count_tokens(text))
+
+    def theme_classification_prompt(self, themes: List[str], ideas: List[str]) -> CompiledPrompt:
+        text = get_theme_classification_prompt(themes, ideas)
+        return CompiledPrompt("theme_classification", THEME_CLASSIFICATION_PROMPT_VERSION, text, count_tokens(text))
+
+prompt_registry = PromptRegistry()
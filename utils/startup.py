@@ -0,0 +1,65 @@
+import time
+from contextlib import contextmanager
+from typing import Any, Dict, Optional
+
+class StartupReport:
+    """
+    Chronologie du démarrage d'un worker : durée d'import des modules de l'application,
+    durée des étapes de préchauffage et délai avant d'être prêt à recevoir du trafic.
+    Les durées d'import sont cumulées : une dépendance partagée est comptée dans le
+    premier module qui l'importe.
+    """
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.imports: Dict[str, float] = {}
+        self.phases: Dict[str, float] = {}
+        self.checks: Dict[str, Any] = {}
+        self.warmed_up_after: Optional[float] = None
+        self.ready_after: Optional[float] = None
+
+    def _elapsed_ms(self, since: float) -> float:
+        return round((time.perf_counter() - since) * 1000, 1)
+
+    @contextmanager
+    def importing(self, module: str):
+        started = time.perf_counter()
+        yield
+        self.imports[module] = self._elapsed_ms(started)
+
+    @contextmanager
+    def phase(self, name: str):
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.phases[name] = self._elapsed_ms(started)
+
+    def check(self, name: str, ok: bool, error: Optional[BaseException] = None):
+        self.checks[name] = "ok" if ok else f"error: {error}"
+
+    def mark_warmed_up(self):
+        self.warmed_up_after = self._elapsed_ms(self.started)
+
+    def mark_ready(self):
+        """
+        Premier passage à l'état prêt (préchauffage terminé et dépendances joignables).
+        """
+        if self.ready_after is None:
+            self.ready_after = self._elapsed_ms(self.started)
+            print(f"Worker prêt en {self.ready_after} ms (imports : {sum(self.imports.values()):.1f} ms)")
+
+    @property
+    def warmed_up(self) -> bool:
+        return self.warmed_up_after is not None
+
+    def report(self) -> dict:
+        return {
+            "uptime_seconds": round(time.perf_counter() - self.started, 1),
+            "warmed_up_after_ms": self.warmed_up_after,
+            "ready_after_ms": self.ready_after,
+            "imports_ms": dict(sorted(self.imports.items(), key=lambda item: -item[1])),
+            "phases_ms": dict(self.phases),
+            "checks": dict(self.checks),
+        }
+
+startup_report = StartupReport()
@@ -0,0 +1,72 @@
+import os
+import threading
+import time
+from typing import Any, Dict
+
+TOKENIZER_MODEL = os.getenv("TOKENIZER_MODEL", "gpt-4o")
+# Après un échec de chargement, délai avant une nouvelle tentative (l'approximation sert entre-temps).
+TOKENIZER_RETRY_SECONDS = float(os.getenv("TOKENIZER_RETRY_SECONDS", "300"))
+
+# Approximation utilisée uniquement si l'encodage tiktoken ne peut pas être chargé.
+APPROX_CHARS_PER_TOKEN = 4
+
+_encodings: Dict[str, Any] = {}
+_failed_at: Dict[str, float] = {}
+_lock = threading.Lock()
+
+def get_encoding(model: str = TOKENIZER_MODEL):
+    """
+    Encodage tiktoken du modèle, chargé une seule fois par processus (préchargé au
+    démarrage, voir services/warmup.py : le premier chargement peut télécharger
+    l'encodage). Renvoie None si l'encodage est indisponible ; un échec n'est pas
+    mémorisé définitivement, le chargement est retenté après TOKENIZER_RETRY_SECONDS.
+    """
+    encoding = _encodings.get(model)
+    if encoding is not None:
+        return encoding
+    failed_at = _failed_at.get(model)
+    if failed_at is not None and time.monotonic() - failed_at < TOKENIZER_RETRY_SECONDS:
+        return None
+    with _lock:
+        if model in _encodings:
+            return _encodings[model]
+        try:
+            import tiktoken
+
+            encoding = tiktoken.encoding_for_model(model)
+        except Exception as e:
+            _failed_at[model] = time.monotonic()
+            print(f"Encodage tiktoken indisponible pour {model}, comptage approximatif : {e}")
+            return None
+        _encodings[model] = encoding
+        _failed_at.pop(model, None)
+        return encoding
+
+def preload_encoding(model: str = TOKENIZER_MODEL):
+    """
+    Charge l'encodage sans attendre la fin d'un délai de nouvelle tentative ; lève une
+    exception s'il est indisponible. Appel bloquant, à exécuter dans un thread.
+    """
+    _failed_at.pop(model, None)
+    if get_encoding(model) is None:
+        raise RuntimeError(f"Encodage tiktoken indisponible pour {model}")
+
+def count_tokens(text: str, model: str = TOKENIZER_MODEL) -> int:
+    encoding = get_encoding(model)
+    if encoding is None:
+        return (len(text) + APPROX_CHARS_PER_TOKEN - 1) // APPROX_CHARS_PER_TOKEN
+    return len(encoding.encode(text, disallowed_special=()))
+
+def truncate_tokens(text: str, max_tokens: int, model: str = TOKENIZER_MODEL) -> str:
+    """
+    Tronque `text` à ses `max_tokens` premiers tokens.
+    """
+    if max_tokens <= 0:
+        return ""
+    encoding = get_encoding(model)
+    if encoding is None:
+        return text[:max_tokens * APPROX_CHARS_PER_TOKEN]
+    tokens = encoding.encode(text, disallowed_special=())
+    if len(tokens) <= max_tokens:
+        return text
+    return encoding.decode(tokens[:max_tokens])